@@ -1,20 +1,43 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import tushare as ts
 import pandas as pd
 from datetime import datetime, timedelta
 import json
+from functools import partial
+import queue
+import hashlib
 from dotenv import load_dotenv
 import os
-import threading
 import time
-import random
 from flask_migrate import Migrate
-from threading import Thread
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 
 from config import Config
-from database import db, User, Stock, Position, Trade, TradingStrategy, QuantStrategy
+from database import db, User, Stock, Position, Trade, TradingStrategy, QuantStrategy, RestingOrder, DailyPnl, \
+    create_missing_indexes, read_only
+from stock_loader import PhaseTimer, bulk_load_stocks, default_stock_frame
+from price_engine import PriceTickEngine
+from quote_cache import quote_cache
+from quote_stream import quote_broadcaster, format_sse, float_column
+from bar_store import bar_store, BarAggregator, day_bucket
+from indicators import indicator_engine
+from strategy_engine import BatchStrategyRunner
+from execution_engine import execution_engine, Order, BUY, SELL
+from order_book import resting_orders, ORDER_TYPES
+from market_data import market_data, TushareSource, LocalSource
+from tushare_client import TushareClient, FakeTushareBackend
+from backtest import run_backtest
+from pnl import ensure_daily_pnl, position_pnl, RANGES as PNL_RANGES
+from portfolio import portfolio
+from sql_metrics import sql_metrics
+from leader import leader_election
+from scheduler import scheduler
+from trading_calendar import trading_calendar
+import db_engine
+from optimizer import BestParameters, ParameterSweep, parse_range, parameter_grid, random_parameters, sweep_pool
 
 # 加载环境变量
 load_dotenv()
@@ -22,8 +45,6 @@ load_dotenv()
 app = Flask(__name__)
 app.config.from_object(Config)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///stock_trading.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # 添加会话配置
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)  # 会话有效期7天
@@ -31,16 +52,54 @@ app.config['SESSION_COOKIE_SECURE'] = False  # 开发环境设为False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
-# 初始化扩展
+# 初始化扩展：先按数据库类型设置连接池和 SQLite 参数（WAL、busy_timeout）
+db_engine.init_app(app)
 db.init_app(app)
 migrate = Migrate(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+# 按路由统计 SQL 语句数和耗时
+sql_metrics.init_app(app)
+execution_engine.init_app(app)
+# 成交后清除对应持仓的收益曲线缓存，并调整内存中的持仓估值
+execution_engine.add_listener(position_pnl.on_fills)
+execution_engine.add_listener(portfolio.on_fills)
 
-# 初始化Tushare
-ts.set_token(os.getenv('TUSHARE_TOKEN'))
-pro = ts.pro_api()
+# 行情缓存变化时推送给 SSE 订阅者
+quote_cache.add_listener(quote_broadcaster.publish)
+# 行情变化时只重新估值持有这些股票的用户
+quote_cache.add_listener(portfolio.on_quotes)
+# 持仓范围的行情订阅按当前持仓推送
+quote_broadcaster.holdings = portfolio.held_codes
+
+# 初始化Tushare：所有接口调用经过限速、合并和磁盘缓存
+if app.config['TUSHARE_BACKEND'] == 'fake':
+    tushare_backend = FakeTushareBackend()
+else:
+    ts.set_token(os.getenv('TUSHARE_TOKEN'))
+    tushare_backend = ts.pro_api()
+pro = TushareClient(
+    tushare_backend,
+    rate_limit=app.config['TUSHARE_RATE_LIMIT'],
+    cache_dir=app.config['TUSHARE_CACHE_DIR'],
+    batch_size=app.config['TUSHARE_BATCH_SIZE'],
+    max_rows=app.config['TUSHARE_MAX_ROWS']
+)
+
+# 交易请求只读行情缓存，外部行情由后台服务刷新
+if app.config['MARKET_DATA_SOURCE'] == 'local':
+    market_data.init_app(app, LocalSource(bar_store, quote_cache))
+else:
+    market_data.init_app(app, TushareSource(pro))
+
+# 多进程部署时只有选举出的领导者进程运行行情模拟、挂单撮合和量化策略
+leader_election.init_app(app)
+scheduler.init_app(app)
+# 参数寻优共用一个进程池，并限制同时进行的寻优数量
+sweep_pool.init_app(app)
+# 交易日历由领导者进程和回补脚本载入，驱动交易日切换和后台任务的交易时段
+trading_calendar.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -48,137 +107,116 @@ def load_user(user_id):
 
 def init_stock_data():
     """初始化股票数据"""
+    chunk_size = app.config['STOCK_LOAD_CHUNK_SIZE']
+    timer = PhaseTimer()
     try:
         print("开始初始化股票数据...")
         
         # 尝试从Tushare获取数据
         try:
             stocks = pro.stock_basic(exchange='', list_status='L')
+            timer.mark('stock_basic')
             print(f"从Tushare获取到 {len(stocks)} 只股票")
             
             # 获取最新交易日
-            today = datetime.now().strftime('%Y%m%d')
-            trade_date = pro.trade_cal(exchange='SSE', is_open=1, end_date=today, limit=1).iloc[0]['cal_date']
+            trade_date = trading_calendar.last_trading_day(datetime.now()).strftime('%Y%m%d')
             
             # 获取最新行情数据
             price_df = pro.daily(trade_date=trade_date)
+            timer.mark('daily')
             
-            # 批量处理股票数据
-            for _, row in stocks.iterrows():
-                try:
-                    # 检查股票是否已存在
-                    stock = Stock.query.filter_by(code=row['ts_code']).first()
-                    if not stock:
-                        stock = Stock(
-                            code=row['ts_code'],
-                            name=row['name'],
-                            industry=row['industry'],
-                            market=row['market'],
-                            last_price=0.0,
-                            prev_price=0.0
-                        )
-                        db.session.add(stock)
-                    
-                    # 更新最新价格
-                    if price_df is not None and not price_df.empty:
-                        stock_price = price_df[price_df['ts_code'] == row['ts_code']]
-                        if not stock_price.empty:
-                            stock.last_price = float(stock_price.iloc[0]['close'])
-                            stock.prev_price = float(stock_price.iloc[0]['pre_close'])
-                            stock.last_update = datetime.now()
-                    
-                except Exception as e:
-                    print(f"处理股票 {row['ts_code']} 时出错: {str(e)}")
-                    continue
-            
-            db.session.commit()
-            print("从Tushare获取的股票数据初始化完成")
+            # 批量写入股票数据
+            inserted, updated = bulk_load_stocks(stocks, price_df, chunk_size=chunk_size, timer=timer)
+            print(f"从Tushare获取的股票数据初始化完成: 新增 {inserted} 只, 更新 {updated} 只")
             
         except Exception as e:
+            db.session.rollback()
             print(f"从Tushare获取数据失败: {str(e)}")
             print("使用默认股票数据...")
             
-            # 使用默认数据
-            default_stocks = Stock.get_default_stocks()
-            for stock_data in default_stocks:
-                try:
-                    stock = Stock.query.filter_by(code=stock_data['code']).first()
-                    if not stock:
-                        stock = Stock(
-                            code=stock_data['code'],
-                            name=stock_data['name'],
-                            industry=stock_data['industry'],
-                            market=stock_data['market'],
-                            last_price=stock_data['last_price'],
-                            prev_price=stock_data['prev_price'],
-                            last_update=datetime.now()
-                        )
-                        db.session.add(stock)
-                except Exception as e:
-                    print(f"添加默认股票 {stock_data['code']} 时出错: {str(e)}")
-                    continue
-            
-            db.session.commit()
-            print("默认股票数据初始化完成")
+            # 使用默认数据，只补充缺失的股票
+            stocks, price_df = default_stock_frame()
+            inserted, _ = bulk_load_stocks(stocks, price_df, chunk_size=chunk_size,
+                                           update_existing=False, timer=timer)
+            print(f"默认股票数据初始化完成: 新增 {inserted} 只")
+        
+        print("股票数据初始化耗时:\n" + timer.report())
         
+        # 股票列表可能变化，重建行情缓存，持仓估值随之重新加载
+        quote_cache.load_from_db()
+        portfolio.reset()
     except Exception as e:
         print(f"初始化股票数据时出错: {str(e)}")
         db.session.rollback()
 
-def update_stock_prices():
-    """定期更新股票价格的函数"""
-    while True:
-        try:
-            with app.app_context():
-                print("开始更新股票价格...")
-                stocks = Stock.query.all()
-                
-                # 检查是否是新的交易日
-                now = datetime.now()
-                is_new_trading_day = now.hour == 9 and now.minute == 30  # 假设每天9:30开盘
-                
-                for stock in stocks:
-                    try:
-                        # 如果是新的交易日，更新prev_price为昨日收盘价
-                        if is_new_trading_day:
-                            stock.prev_price = stock.last_price
-                        
-                        # 模拟价格波动（-2% 到 +2% 之间的随机波动）
-                        price_change = random.uniform(-0.02, 0.02)
-                        new_price = stock.last_price * (1 + price_change)
-                        stock.last_price = round(new_price, 2)
-                        
-                        # 计算涨跌幅
-                        if stock.prev_price > 0:  # 防止除以0
-                            change_percent = ((stock.last_price - stock.prev_price) / stock.prev_price) * 100
-                            print(f"更新股票 {stock.code} 价格: {stock.last_price} (变动: {change_percent:.2f}%)")
-                        else:
-                            stock.prev_price = stock.last_price  # 如果没有前收盘价，使用当前价格
-                            print(f"更新股票 {stock.code} 价格: {stock.last_price}")
-                            
-                    except Exception as e:
-                        print(f"更新股票 {stock.code} 价格失败: {str(e)}")
-                        continue
-                
-                db.session.commit()
-                print("股票价格更新完成")
-        except Exception as e:
-            print(f"更新股票价格时发生错误: {str(e)}")
-        time.sleep(30)  # 每30秒更新一次
+def update_stock_prices(engine):
+    """行情模拟任务：载入其他进程新增的挂单后更新一次价格"""
+    if not resting_orders.loaded:
+        print(f"已载入挂单: {resting_orders.load_from_db()} 笔")
+    else:
+        resting_orders.sync_from_db()
 
-@app.before_first_request
-def create_tables():
-    """创建数据库表"""
-    with app.app_context():
-        db.create_all()
-        init_stock_data()
+    # 交易日变化时引擎把前收盘价滚动为上一交易日的最新价
+    trading_day = trading_calendar.last_trading_day(datetime.now())
+    count, elapsed = engine.tick(trading_day=trading_day)
+    print(f"股票价格更新完成: {count} 只股票, 耗时 {elapsed * 1000:.1f} ms")
 
-@app.before_first_request
-def start_price_updater():
-    """启动价格更新线程"""
-    with app.app_context():  # 添加应用上下文
-        price_updater = threading.Thread(target=update_stock_prices, daemon=True)
-        price_updater.start()
+    # 本交易时段的最后一次 tick：写入未完成的K线，下一次 tick 要到下一个交易时段
+    next_tick = datetime.now() + timedelta(seconds=app.config['PRICE_TICK_INTERVAL'])
+    if app.config['SCHEDULE_MARKET_HOURS_ONLY'] and not trading_calendar.is_open(next_tick):
+        engine.bars.flush()
+        db.session.commit()
+
+def should_run_background_jobs():
+    """行情模拟和量化策略只在领导者进程执行，交易时段由调度器按交易日历控制"""
+    return leader_election.is_leader
+
+def refresh_trading_calendar():
+    """交易日历任务：覆盖范围快到期时重新载入"""
+    if trading_calendar.refresh(pro):
+        print(f"交易日历已更新: {trading_calendar.first_day} 至 {trading_calendar.last_day} "
+              f"({trading_calendar.source})")
+
+def register_jobs():
+    """向调度器注册后台任务"""
+    engine = PriceTickEngine(
+        volatility=app.config['PRICE_VOLATILITY'],
+        universe_size=app.config['PRICE_UNIVERSE_SIZE'],
+        cache=quote_cache,
+        bars=BarAggregator(bar_store, intraday_minutes=app.config['BAR_INTRADAY_MINUTES'],
+                           flush_interval=app.config['BAR_FLUSH_INTERVAL']),
+        orders=resting_orders
+    )
+    strategy_runner = BatchStrategyRunner(bar_store, quote_cache, execution_engine,
+                                          app.config['EXECUTION_TIMEOUT'])
+    # 非交易时段任务线程不唤醒，不产生计算和数据库写入
+    calendar = trading_calendar if app.config['SCHEDULE_MARKET_HOURS_ONLY'] else None
+    scheduler.add_job('price_tick', partial(update_stock_prices, engine), app.config['PRICE_TICK_INTERVAL'],
+                      jitter=app.config['JOB_JITTER'], max_backoff=app.config['JOB_MAX_BACKOFF'],
+                      condition=should_run_background_jobs, calendar=calendar)
+    scheduler.add_job('quant_strategies', partial(run_quant_strategies, strategy_runner),
+                      app.config['QUANT_INTERVAL'], jitter=app.config['JOB_JITTER'],
+                      max_backoff=app.config['JOB_MAX_BACKOFF'], condition=should_run_background_jobs,
+                      calendar=calendar)
+    scheduler.add_job('trading_calendar', refresh_trading_calendar, app.config['TRADING_CALENDAR_REFRESH_INTERVAL'],
+                      jitter=app.config['JOB_JITTER'], max_backoff=app.config['JOB_MAX_BACKOFF'],
+                      condition=should_run_background_jobs)
+
+def get_quote(stock_id):
+    """从行情缓存读取股票行情，缓存中没有时从数据库重建缓存"""
+    quote = quote_cache.get_by_id(stock_id)
+    if quote is None:
+        quote_cache.load_from_db()
+        portfolio.reset()
+        quote = quote_cache.get_by_id(stock_id)
+    return quote
+
+def setup_database():
+    """创建数据库表并初始化股票数据，由领导者进程执行"""
+    db.create_all()
+    create_missing_indexes()
+    ensure_daily_pnl()
+    init_stock_data()
 
 @app.route('/')
 def index():
@@ -231,29 +269,8 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    positions = Position.query.filter_by(user_id=current_user.id).all()
-    
-    # 计算总持仓市值和总盈亏
-    total_position_value = 0
-    total_profit = 0
-    position_details = []
-    
-    for position in positions:
-        market_value = position.quantity * position.stock.last_price
-        profit = position.quantity * (position.stock.last_price - position.average_price)
-        total_position_value += market_value
-        total_profit += profit
-        
-        position_details.append({
-            'code': position.stock.code,
-            'name': position.stock.name,
-            'quantity': position.quantity,
-            'average_price': position.average_price,
-            'current_price': position.stock.last_price,
-            'market_value': market_value,
-            'profit': profit,
-            'profit_color': 'text-danger' if profit > 0 else 'text-success'
-        })
+    # 持仓明细和汇总值由持仓估值服务维护
+    position_details, total_position_value, total_profit = portfolio.positions(current_user.id)
     
     return render_template('dashboard.html',
                          balance=current_user.balance,
@@ -270,117 +287,89 @@ def trade():
         quantity = int(request.form.get('quantity'))
         trade_type = request.form.get('type')
         
-        stock = Stock.query.filter_by(code=stock_code).first()
+        # 从行情缓存读取价格，过旧时由后台服务刷新，不在请求中访问外部接口
+        stock = market_data.quote(stock_code)
         if not stock:
             flash('股票代码不存在', 'danger')
             return redirect(url_for('trade'))
         
-        # 更新股票价格
-        try:
-            price_data = pro.daily(ts_code=stock_code, start_date=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'))
-            if not price_data.empty:
-                stock.last_price = float(price_data.iloc[0]['close'])
-                db.session.commit()
-        except Exception as e:
-            print(f"更新股票价格时出错: {str(e)}")
-        
-        total_amount = quantity * stock.last_price
-        commission = total_amount * app.config['COMMISSION_RATE']
+        sides = {'buy': BUY, 'sell': SELL}
+        if trade_type not in sides:
+            flash('未知的交易类型', 'danger')
+            return redirect(url_for('trade'))
         
-        if trade_type == 'buy':
-            # 检查余额是否足够
-            if current_user.balance < total_amount + commission:
-                flash('余额不足', 'danger')
-                return redirect(url_for('trade'))
-            
-            # 创建交易记录
-            trade = Trade(
-                user_id=current_user.id,
-                stock_id=stock.id,
-                type='BUY',
-                quantity=quantity,
-                price=stock.last_price,
-                commission=commission,
-                total_amount=total_amount
-            )
-            db.session.add(trade)
-            
-            # 更新用户余额
-            current_user.balance -= (total_amount + commission)
-            
-            # 更新或创建持仓
-            position = Position.query.filter_by(user_id=current_user.id, stock_id=stock.id).first()
-            if position:
-                # 计算新的平均成本
-                total_cost = position.average_price * position.quantity + total_amount
-                position.quantity += quantity
-                position.average_price = total_cost / position.quantity
-            else:
-                position = Position(
-                    user_id=current_user.id,
-                    stock_id=stock.id,
-                    quantity=quantity,
-                    average_price=stock.last_price
+        order_type = request.form.get('order_type', 'MARKET')
+        if order_type in ORDER_TYPES:
+            # 限价/止损单进入订单簿，价格满足条件时由行情 tick 触发成交
+            try:
+                expires_at = request.form.get('expires_at')
+                resting_orders.place(
+                    current_user.id, stock.id, sides[trade_type], order_type, quantity,
+                    limit_price=request.form.get('limit_price', type=float),
+                    stop_price=request.form.get('stop_price', type=float),
+                    expires_at=datetime.strptime(expires_at, '%Y-%m-%dT%H:%M') if expires_at else None,
+                    current_price=stock.last_price
                 )
-                db.session.add(position)
-            
-            flash(f'成功买入 {quantity} 股 {stock.name}', 'success')
-            
-        elif trade_type == 'sell':
-            # 检查持仓是否足够
-            position = Position.query.filter_by(user_id=current_user.id, stock_id=stock.id).first()
-            if not position or position.quantity < quantity:
-                flash('持仓不足', 'danger')
-                return redirect(url_for('trade'))
-            
-            # 创建交易记录
-            trade = Trade(
-                user_id=current_user.id,
-                stock_id=stock.id,
-                type='SELL',
-                quantity=quantity,
-                price=stock.last_price,
-                commission=commission,
-                total_amount=total_amount
-            )
-            db.session.add(trade)
-            
-            # 更新用户余额
-            current_user.balance += (total_amount - commission)
-            
-            # 更新持仓
-            position.quantity -= quantity
-            if position.quantity == 0:
-                db.session.delete(position)
-            
-            flash(f'成功卖出 {quantity} 股 {stock.name}', 'success')
+                flash(f'挂单已提交: {stock.name} {quantity} 股', 'success')
+            except ValueError as e:
+                flash(f'挂单失败: {str(e)}', 'danger')
+            return redirect(url_for('trade'))
         
+        order = Order(current_user.id, stock.id, sides[trade_type], quantity, stock.last_price)
+        stock_name = stock.name
+        
+        # 余额和持仓只由委托执行线程修改；等待前结束本请求的读事务
         db.session.commit()
+        try:
+            fill = execution_engine.execute(order, timeout=app.config['EXECUTION_TIMEOUT'])
+        except Exception as e:
+            print(f"委托执行失败: {str(e)}")
+            flash(f'交易失败: {str(e)}', 'danger')
+            return redirect(url_for('trade'))
+        
+        if not fill.filled:
+            flash(fill.reason, 'danger')
+            return redirect(url_for('trade'))
+        
+        action = '买入' if order.side == BUY else '卖出'
+        flash(f'成功{action} {quantity} 股 {stock_name}', 'success')
         return redirect(url_for('positions'))
     
-    stocks = Stock.query.all()
-    positions = Position.query.filter_by(user_id=current_user.id).all()
-    total_position_value = sum(p.quantity * p.stock.last_price for p in positions)
-    total_profit = sum(p.quantity * (p.stock.last_price - p.average_price) for p in positions)
+    if not quote_cache.loaded:
+        quote_cache.load_from_db()
+    stocks = quote_cache.all()
+    position_details, total_position_value, total_profit = portfolio.positions(current_user.id)
+    open_orders = RestingOrder.query.options(selectinload(RestingOrder.stock)).filter(
+        RestingOrder.user_id == current_user.id,
+        RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+    ).order_by(RestingOrder.created_at.desc()).all()
     
     return render_template('trade.html',
                          stocks=stocks,
-                         positions=positions,
+                         positions=position_details,
+                         open_orders=open_orders,
                          balance=current_user.balance,
                          total_position_value=total_position_value,
                          total_profit=total_profit)
 
+@app.route('/orders/<int:order_id>/cancel', methods=['POST'])
+@login_required
+def cancel_order(order_id):
+    """撤销挂单"""
+    if resting_orders.cancel(order_id, current_user.id):
+        flash('挂单已撤销', 'success')
+    else:
+        flash('挂单不存在或已成交', 'danger')
+    return redirect(url_for('trade'))
+
 @app.route('/positions')
 @login_required
 def positions():
-    positions = Position.query.filter_by(user_id=current_user.id).all()
-    
-    # 计算总持仓市值和总盈亏
-    total_position_value = sum(position.quantity * position.stock.last_price for position in positions)
-    total_profit = sum(position.quantity * (position.stock.last_price - position.average_price) for position in positions)
+    # 持仓明细和汇总值由持仓估值服务维护
+    position_details, total_position_value, total_profit = portfolio.positions(current_user.id)
     
     return render_template('positions.html',
-                         positions=positions,
+                         positions=position_details,
                          total_position_value=total_position_value,
                          total_profit=total_profit,
                          balance=current_user.balance)
@@ -389,20 +378,17 @@ def positions():
 @login_required
 def get_stock_price(code):
     try:
-        stock = Stock.query.filter_by(code=code).first()
+        stock = market_data.quote(code)
         if not stock:
             return jsonify({'error': '股票不存在'}), 404
         
-        # 更新股票价格
-        price_data = pro.daily(ts_code=code, start_date=(datetime.now() - timedelta(days=1)).strftime('%Y%m%d'))
-        if not price_data.empty:
-            stock.last_price = price_data.iloc[0]['close']
-            db.session.commit()
-        
+        age = market_data.age(code)
         return jsonify({
             'code': stock.code,
             'name': stock.name,
-            'price': stock.last_price
+            'price': stock.last_price,
+            'age': None if age is None else round(age, 1),
+            'stale': age is None or age > market_data.max_age
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -412,42 +398,153 @@ def get_stock_price(code):
 def get_stock_price_real_time(code):
     """获取股票实时价格的API"""
     try:
-        stock = Stock.query.filter_by(code=code).first()
-        if stock:
-            # 确保有前收盘价
-            if not stock.prev_price:
-                stock.prev_price = stock.last_price
-                db.session.commit()
-            
-            # 计算涨跌幅
-            change = ((stock.last_price - stock.prev_price) / stock.prev_price) * 100 if stock.prev_price > 0 else 0.0
+        if not quote_cache.loaded:
+            quote_cache.load_from_db()
+        quote = quote_cache.get(code)
+        if quote:
+            # 没有前收盘价时使用当前价格
+            prev_price = quote.prev_price if quote.prev_price > 0 else quote.last_price
             
             return jsonify({
-                'code': stock.code,
-                'name': stock.name,
-                'price': stock.last_price,
-                'prev_price': stock.prev_price,
-                'change': round(change, 2),
-                'industry': stock.industry
+                'code': quote.code,
+                'name': quote.name,
+                'price': quote.last_price,
+                'prev_price': prev_price,
+                'change': round(quote.change, 2),
+                'industry': quote.industry,
+                'version': quote_cache.version,
+                'stale': quote_cache.is_stale(app.config['QUOTE_MAX_AGE'])
             })
         return jsonify({'error': 'Stock not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _resolve_quote_scope():
+    """解析行情请求范围，返回 (codes, stock_ids)；参数无效时返回 None
+
+    codes 和 stock_ids 同时为 None 表示全部股票。
+    """
+    scope = request.args.get('scope')
+    codes = request.args.get('codes')
+    if codes:
+        codes = [code for code in codes.split(',') if code]
+        return codes, None
+    if scope == 'positions':
+        stock_ids = sorted(stock_id for (stock_id,) in db.session.query(Position.stock_id).filter_by(user_id=current_user.id))
+        return None, stock_ids
+    if scope == 'all':
+        return None, None
+    return None
+
+def _quote_columns(codes=None, stock_ids=None):
+    """从行情缓存按列读取行情，返回可直接序列化的字典"""
+    version, result_codes, prices, prev_prices, changes = quote_cache.columns(codes=codes, stock_ids=stock_ids)
+    return {
+        'version': version,
+        'codes': result_codes,
+        'prices': float_column(prices, 2),
+        'prev_prices': float_column(prev_prices, 2),
+        'changes': float_column(changes, 2)
+    }
+
+def _quote_etag(data):
+    """行情 ETag 由返回的股票代码和价格列计算
+
+    不使用行情版本号：版本号只在各进程内递增，多进程部署时同样的行情
+    在不同进程上版本号不同，客户端换到另一个进程就无法命中 304。
+    """
+    content = json.dumps([data['codes'], data['prices'], data['prev_prices'], data['changes'], data['stale']])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+@app.route('/api/quotes')
+@login_required
+def get_quotes():
+    """批量获取行情的API
+
+    参数 codes 为逗号分隔的股票代码；或 scope=all 返回全部股票，
+    scope=positions 返回当前用户持仓股票。返回按列组织的 JSON，
+    并以价格列的哈希作为弱 ETag，行情未变化时返回 304。
+    """
+    try:
+        if not quote_cache.loaded:
+            quote_cache.load_from_db()
+        
+        resolved = _resolve_quote_scope()
+        if resolved is None:
+            return jsonify({'error': '缺少参数 codes 或 scope'}), 400
+        codes, stock_ids = resolved
+        
+        data = _quote_columns(codes, stock_ids)
+        data['stale'] = quote_cache.is_stale(app.config['QUOTE_MAX_AGE'])
+        # 响应体中的 version 随进程不同，内容相同即视为同一表示，使用弱 ETag
+        etag = _quote_etag(data)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        response = jsonify(data)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/quotes/stream')
+@login_required
+def stream_quotes():
+    """行情推送（Server-Sent Events）
+
+    参数与 /api/quotes 相同。连接建立后先推送一次完整快照，之后每次
+    行情更新只推送订阅范围内发生变化的股票。
+    """
+    if not quote_cache.loaded:
+        quote_cache.load_from_db()
+    
+    resolved = _resolve_quote_scope()
+    if resolved is None:
+        return jsonify({'error': '缺少参数 codes 或 scope'}), 400
+    codes, stock_ids = resolved
+    # 持仓范围按用户订阅，买卖后推送范围随持仓变化
+    user_id = current_user.id if stock_ids is not None else None
+    if stock_ids is not None:
+        codes = quote_cache.columns(stock_ids=stock_ids)[1]
+    keepalive = app.config['QUOTE_STREAM_KEEPALIVE']
+    
+    # 推送过程中不再访问数据库，提前释放连接
+    db.session.close()
+    
+    def generate():
+        subscription = quote_broadcaster.subscribe(codes, user_id)
+        try:
+            snapshot = _quote_columns(codes)
+            yield format_sse(snapshot, event='snapshot', event_id=snapshot['version'])
+            while True:
+                if subscription.resync:
+                    # 积压过多时丢弃增量，重新发送完整快照
+                    subscription.resync = False
+                    current_codes = None if subscription.codes is None else sorted(subscription.codes)
+                    snapshot = _quote_columns(current_codes)
+                    yield format_sse(snapshot, event='snapshot', event_id=snapshot['version'])
+                try:
+                    message = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(message, event='quotes', event_id=message['version'])
+        finally:
+            quote_broadcaster.unsubscribe(subscription)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/positions/update')
 @login_required
 def update_positions():
     """更新持仓信息的API"""
     try:
-        positions = Position.query.filter_by(user_id=current_user.id).all()
-        total_position_value = 0
-        total_profit = 0
-        
-        for position in positions:
-            market_value = position.quantity * position.stock.last_price
-            profit = position.quantity * (position.stock.last_price - position.average_price)
-            total_position_value += market_value
-            total_profit += profit
+        total_position_value, total_profit = portfolio.summary(current_user.id)
         
         return jsonify({
             'total_position_value': total_position_value,
@@ -460,19 +557,25 @@ def update_positions():
 
 @app.route('/quant')
 @login_required
+@read_only
 def quant():
     """Quantitative trading interface"""
-    stocks = Stock.query.all()
-    strategies = QuantStrategy.query.filter_by(user_id=current_user.id).all()
+    if not quote_cache.loaded:
+        quote_cache.load_from_db()
+    stocks = quote_cache.all()
+    
+    # 股票在行情库中，不能与账本联表：策略和持仓各查询一次，股票从行情缓存读取
+    strategies = QuantStrategy.query.filter_by(user_id=current_user.id).order_by(QuantStrategy.id).all()
+    positions = {position.stock_id: position for position in Position.query.filter_by(user_id=current_user.id)}
     
     # 获取今日日期
     today = datetime.now().date()
     
-    # 获取今日交易记录
-    today_trades = Trade.query.filter(
-        Trade.user_id == current_user.id,
-        Trade.created_at >= today
-    ).count()
+    # 今日成交笔数从每日盈亏汇总表读取
+    today_trades = db.session.query(func.coalesce(func.sum(DailyPnl.trades), 0)).filter(
+        DailyPnl.user_id == current_user.id,
+        DailyPnl.trade_date == today
+    ).scalar()
     
     # 计算活跃策略数量
     active_strategies = sum(1 for s in strategies if s.is_active)
@@ -483,60 +586,43 @@ def quant():
     # 获取最近7天的日期
     dates = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
     
-    # 准备每个策略的收益数据
+    # 最近7天各股票的资金净流入直接读取每日盈亏汇总表
+    daily_rows = DailyPnl.query.filter(
+        DailyPnl.user_id == current_user.id,
+        DailyPnl.trade_date >= today - timedelta(days=6),
+        DailyPnl.trade_date <= today
+    ).all()
+    daily_profits = {(row.stock_id, row.trade_date.strftime('%Y-%m-%d')): row.cash_flow for row in daily_rows}
+    
+    # 准备策略数据和每个策略的收益数据
+    strategy_data = []
     profits = []
     for strategy in strategies:
-        # 获取该策略最近7天的交易记录
+        stock = quote_cache.get(strategy.stock_code)
+        if not stock:
+            continue
+        position = positions.get(stock.id)
+        
         strategy_profits = []
         cumulative_profit = 0
         for date in dates:
-            date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-            next_date = date_obj + timedelta(days=1)
-            
-            # 获取当天的交易记录
-            day_trades = Trade.query.filter(
-                Trade.user_id == current_user.id,
-                Trade.stock_id == Stock.query.filter_by(code=strategy.stock_code).first().id,
-                Trade.created_at >= date_obj,
-                Trade.created_at < next_date
-            ).all()
-            
-            # 计算当天的收益
-            day_profit = sum(
-                trade.quantity * (trade.price - trade.commission/trade.quantity)
-                if trade.type == 'SELL'
-                else -trade.quantity * (trade.price + trade.commission/trade.quantity)
-                for trade in day_trades
-            )
-            
-            cumulative_profit += day_profit
+            cumulative_profit += daily_profits.get((stock.id, date), 0)
             strategy_profits.append(cumulative_profit)
-        
         profits.append(strategy_profits)
-    
-    # 准备策略数据
-    strategy_data = []
-    for strategy in strategies:
-        stock = Stock.query.filter_by(code=strategy.stock_code).first()
-        if stock:
-            # 通过stock_id查询持仓
-            position = Position.query.filter_by(
-                user_id=current_user.id,
-                stock_id=stock.id
-            ).first()
-            
-            strategy_info = {
-                'id': strategy.id,
-                'stock_code': strategy.stock_code,
-                'stock_name': stock.name,
-                'position': position.quantity if position else 0,
-                'avg_price': position.average_price if position else 0,
-                'current_price': stock.last_price,
-                'total_profit': strategy.total_profit,
-                'profit_rate': ((stock.last_price / position.average_price) - 1) * 100 if position and position.average_price > 0 else 0,
-                'is_active': strategy.is_active
-            }
-            strategy_data.append(strategy_info)
+        
+        current_price = stock.last_price
+        strategy_info = {
+            'id': strategy.id,
+            'stock_code': strategy.stock_code,
+            'stock_name': stock.name,
+            'position': position.quantity if position else 0,
+            'avg_price': position.average_price if position else 0,
+            'current_price': current_price,
+            'total_profit': strategy.total_profit,
+            'profit_rate': ((current_price / position.average_price) - 1) * 100 if position and position.average_price > 0 else 0,
+            'is_active': strategy.is_active
+        }
+        strategy_data.append(strategy_info)
     
     return render_template(
         'quant.html',
@@ -594,6 +680,139 @@ def add_quant_strategy():
     
     return redirect(url_for('quant'))
 
+@app.route('/quant/backtest', methods=['POST'])
+@login_required
+def backtest_strategy():
+    """用已保存的日线回测一组策略参数"""
+    try:
+        stock_code = request.form.get('stock_code')
+        ma_short = int(request.form.get('ma_short'))
+        ma_long = int(request.form.get('ma_long'))
+        momentum_days = int(request.form.get('momentum_days'))
+        position_size = int(request.form.get('position_size'))
+        start = request.form.get('start_date') or None
+        end = request.form.get('end_date') or None
+
+        if ma_short >= ma_long:
+            return jsonify({'error': '短期均线周期必须小于长期均线周期'}), 400
+        if min(ma_short, momentum_days, position_size) < 1:
+            return jsonify({'error': '参数必须为正整数'}), 400
+
+        if not quote_cache.loaded:
+            quote_cache.load_from_db()
+        quote = quote_cache.get(stock_code)
+        if quote is None:
+            return jsonify({'error': '股票不存在'}), 404
+
+        # 只回测已完成的日线，盘中写入的今天的日线不参与
+        bars = bar_store.read_range(
+            quote.id,
+            start=datetime.strptime(start, '%Y-%m-%d') if start else None,
+            end=datetime.strptime(end, '%Y-%m-%d') if end else None,
+            before=day_bucket(datetime.now())
+        )
+        if len(bars['close']) == 0:
+            return jsonify({'error': '该股票没有可用的历史日线'}), 404
+
+        result = run_backtest(
+            bars['time'], bars['close'], ma_short, ma_long, momentum_days, position_size,
+            app.config['COMMISSION_RATE'], app.config['INITIAL_BALANCE']
+        )
+        dates = [str(day) for day in result['times'].astype('datetime64[D]')]
+        return jsonify({
+            'stock_code': quote.code,
+            'stock_name': quote.name,
+            'dates': dates,
+            'equity': result['equity'].round(2).tolist(),
+            'trades': [dict(trade, time=str(trade['time'].astype('datetime64[D]'))) for trade in result['trades']],
+            'stats': result['stats']
+        })
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        print(f"策略回测失败: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/quant/optimize')
+@login_required
+def optimize_strategy():
+    """策略参数寻优（Server-Sent Events）
+
+    stock_codes 为逗号分隔的股票代码；ma_short/ma_long/momentum_days 为
+    "start:stop[:step]" 形式的范围；给出 samples 时随机抽样，否则遍历网格。
+    每完成一批回测推送一次 progress，全部完成后推送 result。
+    """
+    try:
+        codes = [code for code in request.args.get('stock_codes', '').split(',') if code]
+        if not codes:
+            return jsonify({'error': '缺少参数 stock_codes'}), 400
+        ma_short = parse_range(request.args.get('ma_short'), range(2, 21))
+        ma_long = parse_range(request.args.get('ma_long'), range(10, 61, 5))
+        momentum_days = parse_range(request.args.get('momentum_days'), range(2, 21, 2))
+        position_size = request.args.get('position_size', 100, type=int)
+        samples = request.args.get('samples', type=int)
+        best = BestParameters(request.args.get('metric', 'total_return'))
+        if samples:
+            params = random_parameters(ma_short, ma_long, momentum_days, samples)
+        else:
+            params = parameter_grid(ma_short, ma_long, momentum_days)
+        if not params:
+            return jsonify({'error': '没有有效的参数组合'}), 400
+        if len(params) * len(codes) > app.config['OPTIMIZER_MAX_RUNS']:
+            return jsonify({'error': f"回测次数超过上限 {app.config['OPTIMIZER_MAX_RUNS']}，请缩小参数范围或使用 samples"}), 400
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+
+    if not quote_cache.loaded:
+        quote_cache.load_from_db()
+    series = {}
+    for code in codes:
+        quote = quote_cache.get(code)
+        if quote is None:
+            continue
+        closes = bar_store.read_range(quote.id, before=day_bucket(datetime.now()))['close']
+        if len(closes):
+            series[code] = closes
+    if not series:
+        return jsonify({'error': '所选股票没有可用的历史日线'}), 404
+
+    if not sweep_pool.acquire():
+        return jsonify({'error': '参数寻优任务过多，请稍后再试'}), 429
+    sweep = ParameterSweep(chunk_size=app.config['OPTIMIZER_CHUNK_SIZE'], pool=sweep_pool)
+    total = len(params) * len(series)
+    commission_rate = app.config['COMMISSION_RATE']
+    initial_capital = app.config['INITIAL_BALANCE']
+    
+    # 寻优过程中不再访问数据库，提前释放连接
+    db.session.close()
+    
+    def generate():
+        start = time.perf_counter()
+        try:
+            for code, batch in sweep.run(series, params, position_size, commission_rate, initial_capital):
+                improved = best.add(code, batch)
+                yield format_sse({
+                    'done': best.evaluated,
+                    'total': total,
+                    'best': best.to_dict(code) if improved else {}
+                }, event='progress')
+            yield format_sse({
+                'done': best.evaluated,
+                'total': total,
+                'elapsed': round(time.perf_counter() - start, 3),
+                'metric': best.metric,
+                'best': best.to_dict()
+            }, event='result')
+        except Exception as e:
+            print(f"参数寻优失败: {str(e)}")
+            yield format_sse({'error': str(e)}, event='failed')
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 响应结束或连接断开时释放名额：先关闭生成器，等已提交给进程池的任务完成后再释放
+    response.call_on_close(sweep_pool.release)
+    return response
+
 @app.route('/quant/toggle/<int:strategy_id>')
 @login_required
 def toggle_strategy(strategy_id):
@@ -611,172 +830,137 @@ def toggle_strategy(strategy_id):
     flash(f'策略已{status}', 'success')
     return redirect(url_for('quant'))
 
-def run_quant_strategies():
-    """执行所有活跃的量化策略"""
-    with app.app_context():
-        while True:
-            try:
-                print("开始执行量化策略检查...")
-                # 获取所有活跃的策略
-                strategies = QuantStrategy.query.filter_by(is_active=True).all()
-                current_date = datetime.now().date()
-                
-                for strategy in strategies:
-                    try:
-                        # 检查是否已经今日交易
-                        if strategy.last_trade_date == current_date:
-                            continue
-                        
-                        # 获取股票信息
-                        stock = Stock.query.filter_by(code=strategy.stock_code).first()
-                        if not stock:
-                            print(f"未找到股票: {strategy.stock_code}")
-                            continue
-                        
-                        # 获取历史价格数据（这里使用模拟数据）
-                        price_history = [stock.last_price * (1 + random.uniform(-0.02, 0.02)) 
-                                       for _ in range(max(strategy.ma_long, strategy.momentum_days))]
-                        price_history.append(stock.last_price)  # 添加当前价格
-                        
-                        # 计算信号
-                        signal = strategy.calculate_signal(price_history)
-                        print(f"策略 {strategy.id} ({strategy.stock_code}) 信号: {signal}")
-                        
-                        if signal == 1 and strategy.position == 0:  # 买入信号
-                            # 计算可以买入的数量（考虑手续费）
-                            amount = strategy.position_size * stock.last_price
-                            commission = amount * 0.0003  # 手续费率
-                            total_cost = amount + commission
-                            
-                            # 检查用户余额
-                            user = User.query.get(strategy.user_id)
-                            if user.balance >= total_cost:
-                                print(f"执行买入: {strategy.stock_code}, 数量: {strategy.position_size}, 价格: {stock.last_price}")
-                                
-                                # 创建交易记录
-                                trade = Trade(
-                                    user_id=strategy.user_id,
-                                    stock_id=stock.id,
-                                    type='BUY',
-                                    quantity=strategy.position_size,
-                                    price=stock.last_price,
-                                    commission=commission,
-                                    total_amount=amount
-                                )
-                                db.session.add(trade)
-                                
-                                # 更新策略状态
-                                strategy.position = strategy.position_size
-                                strategy.avg_price = stock.last_price
-                                strategy.last_trade_date = current_date
-                                
-                                # 更新用户余额
-                                user.balance -= total_cost
-                                
-                                db.session.commit()
-                                print(f"买入交易完成: {strategy.stock_code}")
-                            else:
-                                print(f"余额不足，无法买入: {strategy.stock_code}")
-                            
-                        elif signal == -1 and strategy.position > 0:  # 卖出信号
-                            # 计算卖出金额和手续费
-                            amount = strategy.position * stock.last_price
-                            commission = amount * 0.0003  # 手续费率
-                            net_amount = amount - commission
-                            
-                            print(f"执行卖出: {strategy.stock_code}, 数量: {strategy.position}, 价格: {stock.last_price}")
-                            
-                            # 创建交易记录
-                            trade = Trade(
-                                user_id=strategy.user_id,
-                                stock_id=stock.id,
-                                type='SELL',
-                                quantity=strategy.position,
-                                price=stock.last_price,
-                                commission=commission,
-                                total_amount=amount
-                            )
-                            db.session.add(trade)
-                            
-                            # 计算收益
-                            profit = amount - (strategy.position * strategy.avg_price) - commission
-                            strategy.total_profit += profit
-                            
-                            # 更新用户余额
-                            user = User.query.get(strategy.user_id)
-                            user.balance += net_amount
-                            
-                            # 更新策略状态
-                            strategy.position = 0
-                            strategy.avg_price = 0
-                            strategy.last_trade_date = current_date
-                            
-                            db.session.commit()
-                            print(f"卖出交易完成: {strategy.stock_code}, 收益: {profit}")
-                    
-                    except Exception as e:
-                        print(f"处理策略 {strategy.id} 时出错: {str(e)}")
-                        db.session.rollback()
-                        continue
-                
-                print("量化策略检查完成")
-            except Exception as e:
-                print(f"执行量化策略时出错: {str(e)}")
-                db.session.rollback()
-            
-            time.sleep(60)  # 每分钟检查一次
+def run_strategies_individually():
+    """逐个执行活跃的量化策略（每个委托单独等待成交）"""
+    # 获取所有活跃的策略
+    strategies = QuantStrategy.query.filter_by(is_active=True).all()
+    current_date = datetime.now().date()
+
+    for strategy in strategies:
+        try:
+            # 检查是否已经今日交易
+            if strategy.last_trade_date == current_date:
+                continue
+
+            # 获取股票信息
+            stock = Stock.query.filter_by(code=strategy.stock_code).first()
+            if not stock:
+                print(f"未找到股票: {strategy.stock_code}")
+                continue
+
+            quote = get_quote(stock.id)
+            current_price = quote.last_price if quote else stock.last_price
+
+            # 基于历史日线的增量指标状态和当前价格计算信号
+            signal = indicator_engine.evaluate(strategy, stock.id, current_price)
+            print(f"策略 {strategy.id} ({strategy.stock_code}) 信号: {signal}")
+
+            if signal == 1 and strategy.position == 0:  # 买入信号
+                side, quantity = BUY, strategy.position_size
+            elif signal == -1 and strategy.position > 0:  # 卖出信号
+                side, quantity = SELL, strategy.position
+            else:
+                continue
+
+            # 余额和策略持仓由执行线程修改，等待前结束读事务
+            order = Order(strategy.user_id, stock.id, side, quantity, current_price, strategy.id)
+            stock_code = strategy.stock_code
+            db.session.commit()
+            fill = execution_engine.execute(order, timeout=app.config['EXECUTION_TIMEOUT'])
+            if not fill.filled:
+                print(f"委托未成交: {stock_code}, 原因: {fill.reason}")
+            elif side == BUY:
+                print(f"买入交易完成: {stock_code}, 数量: {fill.quantity}, 价格: {fill.price}")
+            else:
+                print(f"卖出交易完成: {stock_code}, 收益: {fill.profit}")
+
+        except Exception as e:
+            print(f"处理策略 {strategy.id} 时出错: {str(e)}")
+            db.session.rollback()
+            continue
 
-def start_quant_thread():
-    """启动量化交易线程"""
-    thread = Thread(target=run_quant_strategies)
-    thread.daemon = True  # 设置为守护线程，这样主程序退出时线程会自动结束
-    thread.start()
-    print("量化交易线程已启动")
+def run_quant_strategies(strategy_runner):
+    """量化策略任务：检查一次所有活跃的量化策略"""
+    print("开始执行量化策略检查...")
+    if app.config['QUANT_BATCH_EVALUATION']:
+        count, fills, elapsed = strategy_runner.run_cycle()
+        print(f"批量评估 {count} 个策略, 成交 {fills} 笔, 耗时 {elapsed * 1000:.1f} ms")
+    else:
+        run_strategies_individually()
+    print("量化策略检查完成")
+
+_background_started = False
+_last_trade_id = None
+
+def sync_from_leader():
+    """非领导者进程：行情和挂单成交由领导者进程写入数据库，同步到本进程的缓存"""
+    global _last_trade_id
+    if quote_cache.sync_from_db():
+        portfolio.reset()
+    last_trade_id = db.session.query(func.max(Trade.id)).scalar()
+    if last_trade_id != _last_trade_id:
+        # 其他进程的成交不会通知本进程的回调，有新成交时重新加载持仓和收益曲线
+        if _last_trade_id is not None:
+            portfolio.reset()
+            position_pnl.reset()
+        _last_trade_id = last_trade_id
+
+def on_election(is_leader):
+    """每轮领导者选举后调用：领导者第一次当选时初始化数据并启动后台线程"""
+    global _background_started
+    resting_orders.set_owner(is_leader)
+    if not is_leader:
+        sync_from_leader()
+        return
+    if not _background_started:
+        print(f"交易日历来源: {trading_calendar.load(pro)}")
+        setup_database()
+        register_jobs()
+        scheduler.start()
+        _background_started = True
+        print("后台任务已启动")
+
+def start_background_services():
+    """按 APP_ROLE 启动后台服务
+
+    'all' 和 'scheduler' 进程参与领导者选举，当选的进程运行行情模拟、挂单撮合
+    和量化策略；'web' 进程和落选的进程只从数据库同步行情和成交。
+    """
+    leader_election.start(on_election, candidate=app.config['APP_ROLE'] in ('all', 'scheduler'))
 
-# 在应用启动时启动量化交易线程
 @app.before_first_request
 def initialize():
-    """应用初始化"""
+    """应用初始化：网页进程收到第一个请求时启动，独立的后台进程由 worker.py 启动"""
     try:
-        # 确保数据库表存在
-        db.create_all()
-        
-        # 初始化股票数据
-        init_stock_data()
-        
-        # 启动价格更新线程
-        start_price_updater()
-        
-        # 启动量化交易线程
-        start_quant_thread()
-        
+        start_background_services()
         print("应用初始化完成")
     except Exception as e:
         print(f"初始化失败: {str(e)}")
 
 @app.route('/quant/status')
 @login_required
+@read_only
 def quant_status():
     """查看量化交易状态"""
-    # 获取用户的所有策略
-    strategies = QuantStrategy.query.filter_by(user_id=current_user.id).all()
+    if not quote_cache.loaded:
+        quote_cache.load_from_db()
+    strategies = QuantStrategy.query.filter_by(user_id=current_user.id).order_by(QuantStrategy.id).all()
     
-    # 获取今日交易记录
+    # 获取今日最近20条交易记录，各股票的今日成交笔数读取每日盈亏汇总表
     today = datetime.now().date()
-    trades = Trade.query.filter(
+    trades = Trade.query.options(selectinload(Trade.stock)).filter(
         Trade.user_id == current_user.id,
         Trade.created_at >= today
-    ).order_by(Trade.created_at.desc()).all()
+    ).order_by(Trade.created_at.desc()).limit(20).all()
+    today_counts = dict(db.session.query(DailyPnl.stock_id, DailyPnl.trades).filter(
+        DailyPnl.user_id == current_user.id,
+        DailyPnl.trade_date == today
+    ).all())
     
     # 准备策略状态数据
     strategy_status = []
     for strategy in strategies:
-        # 获取股票信息
-        stock = Stock.query.filter_by(code=strategy.stock_code).first()
-        
-        # 获取该策略今日交易
-        strategy_trades = [t for t in trades if t.stock_id == stock.id]
-        
+        stock = quote_cache.get(strategy.stock_code)
         status = {
             'id': strategy.id,
             'stock_code': strategy.stock_code,
@@ -786,7 +970,7 @@ def quant_status():
             'avg_price': strategy.avg_price,
             'total_profit': strategy.total_profit,
             'last_trade_date': strategy.last_trade_date,
-            'today_trades': len(strategy_trades),
+            'today_trades': today_counts.get(stock.id, 0) if stock else 0,
             'params': {
                 'ma_short': strategy.ma_short,
                 'ma_long': strategy.ma_long,
@@ -799,128 +983,61 @@ def quant_status():
     return render_template(
         'quant_status.html',
         strategies=strategy_status,
-        trades=trades[:20]  # 只显示最近20条交易
+        trades=trades
     )
 
 @app.route('/position_history')
 @login_required
+@read_only
 def position_history():
     """持仓历史页面"""
-    positions = Position.query.filter_by(user_id=current_user.id).all()
+    positions = Position.query.options(selectinload(Position.stock)).filter_by(user_id=current_user.id).all()
     return render_template('position_history.html', positions=positions)
 
 @app.route('/api/position/<int:position_id>/history')
 @login_required
+@read_only
 def get_position_history(position_id):
-    """获取持仓30天历史数据的API"""
-    print(f"\n=== 开始处理持仓历史数据请求 ===")
-    print(f"请求的持仓ID: {position_id}")
-    print(f"当前用户ID: {current_user.id}")
-    
+    """获取持仓收益曲线，range 为 1M、1Y 或 all"""
+    position = Position.query.get_or_404(position_id)
+
+    # 验证权限
+    if position.user_id != current_user.id:
+        return jsonify({'error': '无权访问此持仓'}), 403
+
+    range_key = request.args.get('range', '1M')
+    if range_key not in PNL_RANGES:
+        return jsonify({'error': f'不支持的时间范围: {range_key}'}), 400
+
     try:
-        position = Position.query.get_or_404(position_id)
-        print(f"找到持仓: {position.stock.code} - {position.stock.name}")
-        print(f"持仓数量: {position.quantity}")
-        print(f"平均成本: {position.average_price}")
-        
-        # 验证权限
-        if position.user_id != current_user.id:
-            print(f"权限验证失败: 用户 {current_user.id} 尝试访问持仓 {position_id}")
-            return jsonify({'error': '无权访问此持仓'}), 403
-        
-        # 获取过去30天的日期
-        end_date = datetime.now().date()
-        start_date = end_date - timedelta(days=30)
-        print(f"获取数据时间范围: {start_date} 到 {end_date}")
-        
-        # 获取该持仓的30天交易记录
-        trades = Trade.query.filter(
-            Trade.user_id == current_user.id,
-            Trade.stock_id == position.stock_id,
-            Trade.created_at >= start_date,
-            Trade.created_at <= end_date
-        ).order_by(Trade.created_at).all()
-        
-        print(f"找到 {len(trades)} 条交易记录")
-        
-        # 准备数据
-        dates = []
-        profits = []
-        cumulative_profit = 0
-        
-        # 计算初始持仓成本
-        initial_cost = position.quantity * position.average_price
-        print(f"初始持仓成本: {initial_cost}")
-        
-        current_date = start_date
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            
-            # 获取当天的交易记录
-            day_trades = [t for t in trades if t.created_at.date() == current_date]
-            
-            # 计算当天的交易收益
-            day_profit = sum(
-                trade.quantity * (trade.price - trade.commission/trade.quantity)
-                if trade.type == 'SELL'
-                else -trade.quantity * (trade.price + trade.commission/trade.quantity)
-                for trade in day_trades
-            )
-            
-            # 计算持仓市值变化
-            if current_date == end_date:
-                # 使用当前价格
-                position_value = position.quantity * position.stock.last_price
-            else:
-                # 使用模拟数据（实际应用中应该使用历史数据）
-                price_change = random.uniform(-0.02, 0.02)
-                simulated_price = position.stock.last_price * (1 + price_change)
-                position_value = position.quantity * simulated_price
-            
-            # 计算总收益（包括交易收益和持仓市值变化）
-            current_profit = cumulative_profit + day_profit + (position_value - initial_cost)
-            
-            dates.append(current_date.strftime('%Y-%m-%d'))
-            profits.append(round(current_profit, 2))
-            
-            # 更新累计交易收益
-            cumulative_profit += day_profit
-            
-            current_date = next_date
-        
-        print(f"生成了 {len(dates)} 天的数据")
-        
-        # 确保数据不为空
-        if not dates or not profits:
-            print("没有生成任何数据")
-            return jsonify({
-                'error': '没有足够的历史数据',
-                'dates': [],
-                'profits': [],
-                'stock_code': position.stock.code,
-                'stock_name': position.stock.name,
-                'position': position.quantity,
-                'avg_price': position.average_price,
-                'current_price': position.stock.last_price
-            })
-        
-        response_data = {
-            'dates': dates,
-            'profits': profits,
-            'stock_code': position.stock.code,
-            'stock_name': position.stock.name,
-            'position': position.quantity,
-            'avg_price': position.average_price,
-            'current_price': position.stock.last_price
-        }
-        print("准备返回的数据:", response_data)
-        print("=== 持仓历史数据请求处理完成 ===\n")
-        return jsonify(response_data)
+        quote = get_quote(position.stock_id)
+        current_price = quote.last_price if quote else position.stock.last_price
+        history = position_pnl.history(position, range_key, current_price)
+        return jsonify(dict(
+            history,
+            range=range_key,
+            stock_code=position.stock.code,
+            stock_name=position.stock.name,
+            position=position.quantity,
+            avg_price=position.average_price,
+            current_price=current_price
+        ))
     except Exception as e:
         print(f"处理持仓历史数据请求时出错: {str(e)}")
-        print("=== 持仓历史数据请求处理失败 ===\n")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics/sql')
+@login_required
+def sql_metrics_report():
+    """各路由的 SQL 语句数和耗时统计"""
+    return jsonify(sql_metrics.snapshot())
+
+@app.route('/api/metrics/jobs')
+@login_required
+def job_metrics_report():
+    """后台任务的运行次数、失败次数和耗时、延迟直方图"""
+    return jsonify({'leader': leader_election.is_leader, 'jobs': scheduler.snapshot()})
+
 @app.route('/api/check-session')
 def check_session():
     """检查用户会话状态"""
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from database import db, Stock
+from bar_store import DAILY
+
+
+class BackfillCheckpoint:
+    """按股票记录已回补的日期区间，保存为 JSON 文件，中断后可以续传"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.done = {}  # code -> {'start': 'YYYYMMDD', 'end': 'YYYYMMDD'}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.done = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取回补进度失败，重新开始: {str(e)}")
+
+    def pending_range(self, code, start_date, end_date):
+        """还需要回补的 (start_date, end_date)，已完成时返回 None"""
+        done = self.done.get(code)
+        if done is None or done['start'] > start_date:
+            return start_date, end_date
+        if done['end'] >= end_date:
+            return None
+        next_day = datetime.strptime(done['end'], '%Y%m%d') + timedelta(days=1)
+        return next_day.strftime('%Y%m%d'), end_date
+
+    def mark(self, code, start_date, end_date):
+        done = self.done.get(code)
+        if done is not None:
+            start_date = min(start_date, done['start'])
+            end_date = max(end_date, done['end'])
+        self.done[code] = {'start': start_date, 'end': end_date}
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.done, f)
+        os.replace(temp_path, self.path)
+
+
+def daily_rows(stock_id, df):
+    """daily 接口返回的 DataFrame 转换为 BarStore.append 需要的行"""
+    if df is None or df.empty:
+        return []
+    times = pd.to_datetime(df['trade_date'], format='%Y%m%d').dt.to_pydatetime()
+    volumes = df['vol'].fillna(0.0) if 'vol' in df else [0.0] * len(df)
+    return [
+        {'stock_id': stock_id, 'freq': DAILY, 'bar_time': bar_time,
+         'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for bar_time, o, h, l, c, v in zip(times, df['open'].tolist(), df['high'].tolist(),
+                                          df['low'].tolist(), df['close'].tolist(), list(volumes))
+    ]
+
+
+class Backfill:
+    """历史日线回补
+
+    线程池并发请求各股票的日线（并发数不超过 workers，接口限速由
+    TushareClient 负责），取回的数据在调用线程中累积，每满 write_batch
+    行批量写入K线存储并提交一次，提交成功后再记录这些股票的进度。
+    中途退出时，已提交的股票下次运行会跳过或只补缺少的日期。传入交易日历
+    时截止日期取当天或之前最近的交易日，待补区间内没有交易日的股票不发请求。
+    """
+
+    def __init__(self, client, store, checkpoint=None, workers=8, write_batch=20000, progress_every=100,
+                 calendar=None):
+        self.client = client
+        self.store = store
+        self.checkpoint = checkpoint or BackfillCheckpoint()
+        self.workers = workers
+        self.write_batch = write_batch
+        self.progress_every = progress_every
+        self.calendar = calendar
+
+    def _fetch(self, code, start_date, end_date):
+        return self.client.daily(ts_code=code, start_date=start_date, end_date=end_date)
+
+    def _flush(self, rows, finished):
+        """写入累积的K线并提交，然后记录进度"""
+        if not rows and not finished:
+            return
+        try:
+            self.store.append(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"写入K线失败: {str(e)}")
+            raise
+        for code, start_date, end_date in finished:
+            self.checkpoint.mark(code, start_date, end_date)
+        self.checkpoint.save()
+
+    def run(self, years=5, codes=None, end_date=None):
+        """回补最近 years 年的日线，返回统计信息"""
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        if self.calendar is not None:
+            end_date = self.calendar.last_trading_day(end_date).strftime('%Y%m%d')
+        start_date = (datetime.strptime(end_date, '%Y%m%d') - timedelta(days=int(365.25 * years))).strftime('%Y%m%d')
+
+        query = db.session.query(Stock.code, Stock.id)
+        if codes:
+            query = query.filter(Stock.code.in_(codes))
+        stock_ids = dict(query.all())
+
+        jobs = []
+        skipped = 0
+        for code in sorted(stock_ids):
+            remaining = self.checkpoint.pending_range(code, start_date, end_date)
+            if remaining is not None and self.calendar is not None and self.calendar.count(*remaining) == 0:
+                remaining = None
+            if remaining is None:
+                skipped += 1
+            else:
+                jobs.append((code,) + remaining)
+        print(f"开始回补 {start_date} 至 {end_date} 的日线: {len(jobs)} 只股票待回补, {skipped} 只已完成")
+
+        stats = {'symbols': 0, 'skipped': skipped, 'failed': 0, 'bars': 0}
+        rows, finished = [], []
+        start = time.perf_counter()
+        jobs = iter(jobs)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # 同时在途的请求有上限，避免一次性提交全部股票占用内存
+            pending = {}
+            for job in jobs:
+                pending[pool.submit(self._fetch, *job)] = job
+                if len(pending) >= self.workers * 2:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    code, job_start, job_end = pending.pop(future)
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        stats['failed'] += 1
+                        print(f"回补 {code} 失败: {str(e)}")
+                    else:
+                        batch = daily_rows(stock_ids[code], df)
+                        rows.extend(batch)
+                        finished.append((code, job_start, job_end))
+                        stats['symbols'] += 1
+                        stats['bars'] += len(batch)
+                        if stats['symbols'] % self.progress_every == 0:
+                            elapsed = time.perf_counter() - start
+                            print(f"已回补 {stats['symbols']} 只股票, {stats['bars']} 根K线, "
+                                  f"{stats['symbols'] / elapsed:.1f} 只/秒")
+                    job = next(jobs, None)
+                    if job is not None:
+                        pending[pool.submit(self._fetch, *job)] = job
+                if len(rows) >= self.write_batch:
+                    self._flush(rows, finished)
+                    rows, finished = [], []
+        self._flush(rows, finished)
+
+        stats['elapsed'] = time.perf_counter() - start
+        stats['symbols_per_sec'] = stats['symbols'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        print(f"回补完成: {stats['symbols']} 只股票, {stats['bars']} 根K线, 失败 {stats['failed']} 只, "
+              f"{stats['elapsed']:.1f} 秒, {stats['symbols_per_sec']:.1f} 只/秒")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回补历史日线到K线存储')
+    parser.add_argument('--years', type=float, default=None, help='回补的年数')
+    parser.add_argument('--workers', type=int, default=None, help='并发请求数')
+    parser.add_argument('--codes', default=None, help='只回补指定股票，逗号分隔')
+    parser.add_argument('--end-date', default=None, help='截止日期 YYYYMMDD，默认今天')
+    parser.add_argument('--fake', action='store_true', help='使用本地模拟数据源，不访问 Tushare')
+    parser.add_argument('--reset', action='store_true', help='忽略已有进度，全部重新回补')
+    args = parser.parse_args()
+
+    from app import app, pro
+    from bar_store import bar_store
+    from tushare_client import TushareClient, FakeTushareBackend
+    from trading_calendar import trading_calendar
+
+    client = pro
+    if args.fake:
+        client = TushareClient(FakeTushareBackend(latency=0.02), rate_limit=None)
+    checkpoint_path = app.config['BACKFILL_CHECKPOINT']
+    if args.reset and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    trading_calendar.load(client)
+    with app.app_context():
+        db.create_all()
+        backfill = Backfill(
+            client, bar_store,
+            checkpoint=BackfillCheckpoint(checkpoint_path),
+            workers=args.workers or app.config['BACKFILL_WORKERS'],
+            write_batch=app.config['BACKFILL_WRITE_BATCH'],
+            calendar=trading_calendar
+        )
+        backfill.run(
+            years=args.years or app.config['BACKFILL_YEARS'],
+            codes=args.codes.split(',') if args.codes else None,
+            end_date=args.end_date
+        )
+
+
+if __name__ == '__main__':
+    main()
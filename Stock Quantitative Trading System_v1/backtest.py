@@ -0,0 +1,171 @@
+import time
+
+import numpy as np
+
+from signals import ma_signals, to_cents
+
+# 按每年约 252 个交易日折算年化指标
+TRADING_DAYS_PER_YEAR = 252
+
+
+def rolling_signals(closes, ma_short, ma_long, momentum_days):
+    """对整段收盘价序列逐根计算信号
+
+    第 t 个元素等于 QuantStrategy.calculate_signal(closes[:t + 1])：
+    1 买入，-1 卖出，0 持有。均线通过一次整数分的前缀和得到，不做逐根
+    循环，窗口和是精确值，与实盘信号逐根一致。
+    """
+    cents = to_cents(closes)
+    count = len(cents)
+    signals = np.zeros(count, dtype=np.int8)
+    required = max(ma_short, ma_long, momentum_days)
+    if count < required:
+        return signals
+
+    sums = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(cents, out=sums[1:])
+    end = np.arange(required, count + 1)
+    signals[required - 1:] = ma_signals(sums[end] - sums[end - ma_short], ma_short,
+                                        sums[end] - sums[end - ma_long], ma_long,
+                                        cents[end - 1], cents[end - momentum_days])
+    return signals
+
+
+def holding_mask(signals):
+    """按实盘规则推出每根K线收盘后是否持仓
+
+    空仓遇到买入信号买入，持仓遇到卖出信号全部卖出，因此持仓状态
+    只取决于最近一个非零信号是否为买入。
+    """
+    index = np.arange(len(signals))
+    last = np.maximum.accumulate(np.where(signals != 0, index, -1))
+    return (last >= 0) & (signals[np.maximum(last, 0)] == 1)
+
+
+def _simulate(closes, ma_short, ma_long, momentum_days, position_size, commission_rate, initial_capital):
+    """按信号模拟成交，返回 (holding, buys, amounts, commissions, cash, equity, profits, trade_rows)"""
+    signals = rolling_signals(closes, ma_short, ma_long, momentum_days)
+    holding = holding_mask(signals)
+
+    previous = np.concatenate([[False], holding[:-1]])
+    buys = holding & ~previous
+    sells = previous & ~holding
+
+    amounts = position_size * closes
+    commissions = amounts * commission_rate
+    cash_flow = np.where(buys, -(amounts + commissions), 0.0) + np.where(sells, amounts - commissions, 0.0)
+    cash = initial_capital + np.cumsum(cash_flow)
+    equity = cash + np.where(holding, amounts, 0.0)
+
+    buy_rows = np.flatnonzero(buys)
+    sell_rows = np.flatnonzero(sells)
+    # 与实盘一致：单笔收益 = 卖出金额 - 持仓成本 - 卖出手续费
+    closed = len(sell_rows)
+    profits = amounts[sell_rows] - amounts[buy_rows[:closed]] - commissions[sell_rows]
+
+    trade_rows = np.flatnonzero(buys | sells)
+    return holding, buys, amounts, commissions, cash, equity, profits, trade_rows
+
+
+def run_backtest(times, closes, ma_short, ma_long, momentum_days, position_size,
+                 commission_rate, initial_capital):
+    """在日线收盘价上回测一组策略参数
+
+    信号与成交价格都取当根K线的收盘价，每根K线最多成交一次，手续费
+    按 commission_rate 对买卖双方收取。返回包含 times/equity/cash/holding
+    数组、成交列表 trades 和汇总指标 stats 的字典。
+
+    为保持全程向量化，假设资金始终足够买入 position_size 股；
+    若某次买入时现金不足，stats['insufficient_capital'] 为 True。
+    """
+    times = np.asarray(times)
+    closes = np.asarray(closes, dtype=np.float64)
+    holding, buys, amounts, commissions, cash, equity, profits, trade_rows = _simulate(
+        closes, ma_short, ma_long, momentum_days, position_size, commission_rate, initial_capital)
+
+    trades = [
+        {
+            'time': times[row],
+            'type': 'BUY' if buys[row] else 'SELL',
+            'price': float(closes[row]),
+            'quantity': position_size,
+            'commission': float(commissions[row]),
+            'total_amount': float(amounts[row])
+        }
+        for row in trade_rows.tolist()
+    ]
+
+    return {
+        'times': times,
+        'equity': equity,
+        'cash': cash,
+        'holding': holding,
+        'trades': trades,
+        'stats': summarize(equity, cash, profits, commissions[trade_rows], initial_capital)
+    }
+
+
+def backtest_stats(closes, ma_short, ma_long, momentum_days, position_size, commission_rate, initial_capital):
+    """只计算汇总指标，不生成成交列表（参数寻优时使用）"""
+    _, _, _, commissions, cash, equity, profits, trade_rows = _simulate(
+        np.asarray(closes, dtype=np.float64), ma_short, ma_long, momentum_days,
+        position_size, commission_rate, initial_capital)
+    return summarize(equity, cash, profits, commissions[trade_rows], initial_capital)
+
+
+def summarize(equity, cash, profits, commissions, initial_capital):
+    """根据权益曲线和已平仓收益计算汇总指标"""
+    if len(equity) == 0:
+        return {
+            'bars': 0, 'final_equity': float(initial_capital), 'total_return': 0.0,
+            'annual_return': 0.0, 'max_drawdown': 0.0, 'sharpe': 0.0, 'trades': 0,
+            'round_trips': 0, 'win_rate': 0.0, 'realized_profit': 0.0,
+            'total_commission': 0.0, 'insufficient_capital': False
+        }
+
+    final_equity = float(equity[-1])
+    total_return = final_equity / initial_capital - 1
+    years = len(equity) / TRADING_DAYS_PER_YEAR
+    annual_return = (final_equity / initial_capital) ** (1 / years) - 1 if final_equity > 0 else -1.0
+
+    peaks = np.maximum.accumulate(np.maximum(equity, initial_capital))
+    max_drawdown = float(((peaks - equity) / peaks).max())
+
+    returns = np.diff(np.concatenate([[initial_capital], equity])) / np.concatenate([[initial_capital], equity[:-1]])
+    deviation = returns.std()
+    sharpe = float(returns.mean() / deviation * np.sqrt(TRADING_DAYS_PER_YEAR)) if deviation > 0 else 0.0
+
+    return {
+        'bars': len(equity),
+        'final_equity': final_equity,
+        'total_return': float(total_return),
+        'annual_return': float(annual_return),
+        'max_drawdown': max_drawdown,
+        'sharpe': sharpe,
+        'trades': len(commissions),
+        'round_trips': len(profits),
+        'win_rate': float((profits > 0).mean()) if len(profits) else 0.0,
+        'realized_profit': float(profits.sum()),
+        'total_commission': float(commissions.sum()),
+        'insufficient_capital': bool(cash.min() < 0)
+    }
+
+
+def benchmark(years=10, symbols=100, seed=0):
+    """用随机游走价格测量回测速度，返回每只股票的平均耗时（毫秒）"""
+    rng = np.random.default_rng(seed)
+    bars = years * TRADING_DAYS_PER_YEAR
+    times = np.datetime64('2000-01-01') + np.arange(bars).astype('timedelta64[D]')
+    series = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(symbols, bars)), axis=1))
+
+    start = time.perf_counter()
+    for closes in series:
+        run_backtest(times, closes, 5, 20, 5, 100, 0.0003, 100000)
+    elapsed = (time.perf_counter() - start) / symbols * 1000
+    print(f"回测基准: {symbols} 只股票 x {bars} 根日线, 平均每只 {elapsed:.2f} ms")
+    return elapsed
+
+
+if __name__ == '__main__':
+    for years in (1, 5, 10, 20):
+        benchmark(years=years)
@@ -0,0 +1,257 @@
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import db, StockBar
+
+DAILY = '1d'
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def intraday_freq(minutes):
+    return f"{minutes}min"
+
+
+def day_bucket(day):
+    """日线的时间桶（当天零点）；策略读取历史时以今天的桶为上界，不含盘中未完成的日线"""
+    return datetime(day.year, day.month, day.day)
+
+
+def _empty_bars():
+    bars = {'time': np.empty(0, dtype='datetime64[us]')}
+    for field in BAR_FIELDS:
+        bars[field] = np.empty(0)
+    return bars
+
+
+def _rows_to_arrays(rows):
+    """(bar_time, open, high, low, close, volume) 行转换为按列存放的数组"""
+    if not rows:
+        return _empty_bars()
+    columns = list(zip(*rows))
+    bars = {'time': np.asarray(columns[0], dtype='datetime64[us]')}
+    for field, values in zip(BAR_FIELDS, columns[1:]):
+        bars[field] = np.asarray([0.0 if value is None else value for value in values], dtype=np.float64)
+    return bars
+
+
+class BarStore:
+    """K线存储
+
+    数据保存在 stock_bar 表中，(stock_id, freq, bar_time) 上有唯一索引，
+    读取按索引范围扫描，返回按时间升序、按列连续存放的 NumPy 数组。
+    """
+
+    def __init__(self):
+        self.table = StockBar.__table__
+        self._columns = [self.table.c.bar_time] + [self.table.c[field] for field in BAR_FIELDS]
+
+    def _insert_stmt(self):
+        """同一根K线重复写入时以新数据为准"""
+        dialect = db.get_engine(bind=getattr(StockBar, '__bind_key__', None)).dialect.name
+        if dialect == 'sqlite':
+            return self.table.insert().prefix_with('OR REPLACE')
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(self.table)
+            return stmt.on_conflict_do_update(
+                index_elements=['stock_id', 'freq', 'bar_time'],
+                set_={field: stmt.excluded[field] for field in BAR_FIELDS}
+            )
+        return self.table.insert()
+
+    def _merge_stmt(self):
+        """同一根K线已存在时合并：保留已有开盘价，最高价、最低价取两者极值，收盘价以新数据为准"""
+        dialect = db.get_engine(bind=getattr(StockBar, '__bind_key__', None)).dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            greatest, least = func.max, func.min
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            greatest, least = func.greatest, func.least
+        else:
+            return self._insert_stmt()
+        stmt = insert(self.table)
+        return stmt.on_conflict_do_update(
+            index_elements=['stock_id', 'freq', 'bar_time'],
+            set_={
+                'high': greatest(self.table.c.high, stmt.excluded.high),
+                'low': least(self.table.c.low, stmt.excluded.low),
+                'close': stmt.excluded.close,
+                'volume': greatest(self.table.c.volume, stmt.excluded.volume)
+            }
+        )
+
+    def merge(self, rows):
+        """批量写入尚未完成或可能已部分写入的K线，与已有的同一根K线合并
+
+        只写入当前会话，由调用方负责提交。
+        """
+        if rows:
+            db.session.execute(self._merge_stmt(), rows)
+        return len(rows)
+
+    def append(self, rows):
+        """批量追加K线，rows 为包含 stock_id/freq/bar_time/open/high/low/close/volume 的字典列表
+
+        只写入当前会话，由调用方负责提交。
+        """
+        if rows:
+            db.session.execute(self._insert_stmt(), rows)
+        return len(rows)
+
+    def read_range(self, stock_id, freq=DAILY, start=None, end=None, before=None):
+        """读取 [start, end] 时间范围内、早于 before 的K线"""
+        query = select(*self._columns).where(
+            self.table.c.stock_id == stock_id,
+            self.table.c.freq == freq
+        )
+        if start is not None:
+            query = query.where(self.table.c.bar_time >= start)
+        if end is not None:
+            query = query.where(self.table.c.bar_time <= end)
+        if before is not None:
+            query = query.where(self.table.c.bar_time < before)
+        rows = db.session.execute(query.order_by(self.table.c.bar_time)).fetchall()
+        return _rows_to_arrays(rows)
+
+    def read_last(self, stock_id, freq=DAILY, count=1, before=None):
+        """读取早于 before 的最近 count 根K线，耗时只与 count 有关"""
+        query = select(*self._columns).where(
+            self.table.c.stock_id == stock_id,
+            self.table.c.freq == freq
+        )
+        if before is not None:
+            query = query.where(self.table.c.bar_time < before)
+        query = query.order_by(self.table.c.bar_time.desc()).limit(count)
+        rows = db.session.execute(query).fetchall()
+        return _rows_to_arrays(rows[::-1])
+
+    def read_close_panel(self, stock_ids, freq=DAILY, count=1, before=None):
+        """一次查询读取多只股票早于 before 的最近 count 根K线的收盘价
+
+        返回 (panel, lengths)：panel 形状为 (len(stock_ids), count)，按时间
+        升序右对齐，历史不足的位置为 NaN；lengths 为每只股票实际的K线数量。
+        stock_ids 需按升序排列。
+        """
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        panel = np.full((len(stock_ids), count), np.nan)
+        lengths = np.zeros(len(stock_ids), dtype=np.int64)
+        if len(stock_ids) == 0 or count <= 0:
+            return panel, lengths
+
+        row_number = func.row_number().over(
+            partition_by=self.table.c.stock_id,
+            order_by=self.table.c.bar_time.desc()
+        ).label('rn')
+        recent = select(self.table.c.stock_id, self.table.c.close, row_number).where(
+            self.table.c.freq == freq,
+            self.table.c.stock_id.in_(stock_ids.tolist())
+        )
+        if before is not None:
+            recent = recent.where(self.table.c.bar_time < before)
+        recent = recent.subquery()
+        rows = db.session.execute(
+            select(recent.c.stock_id, recent.c.close, recent.c.rn).where(recent.c.rn <= count)
+        ).fetchall()
+        if not rows:
+            return panel, lengths
+
+        ids, closes, numbers = (np.asarray(column) for column in zip(*rows))
+        positions = np.searchsorted(stock_ids, ids.astype(np.int64))
+        panel[positions, count - numbers.astype(np.int64)] = closes.astype(np.float64)
+        lengths += np.bincount(positions, minlength=len(stock_ids))
+        return panel, lengths
+
+    def last_time(self, stock_id, freq=DAILY):
+        """最后一根K线的时间，没有数据时返回 None"""
+        query = select(self.table.c.bar_time).where(
+            self.table.c.stock_id == stock_id,
+            self.table.c.freq == freq
+        ).order_by(self.table.c.bar_time.desc()).limit(1)
+        return db.session.execute(query).scalar()
+
+
+class BarAggregator:
+    """把行情引擎的 tick 聚合成日线和分钟线
+
+    当前未完成的K线以数组形式保存在内存中，时间桶切换时一次性批量
+    写入 BarStore；未完成的K线每隔 flush_interval 秒也写入一次，交易时段
+    结束时由调用方执行 flush。因此表中可能有今天未完成的日线，策略读取
+    历史时需以 day_bucket(今天) 为 before 上界。写入时与数据库中同一根K线合并，进程在盘中
+    重启后不会用不完整的开盘价、最高价、最低价覆盖已写入的K线。
+    """
+
+    def __init__(self, store, intraday_minutes=5, flush_interval=60):
+        self.store = store
+        self.intraday_minutes = intraday_minutes
+        self.flush_interval = flush_interval
+        self._bars = {}  # freq -> (bucket, ids, open, high, low, close)
+        self._flushed_at = None
+
+    def _bucket(self, freq, now):
+        if freq == DAILY:
+            return day_bucket(now)
+        minute = now.minute - now.minute % self.intraday_minutes
+        return now.replace(minute=minute, second=0, microsecond=0)
+
+    def _flush_rows(self, freq):
+        current = self._bars.get(freq)
+        if current is None:
+            return []
+        bucket, ids, opens, highs, lows, closes = current
+        return [
+            {'stock_id': stock_id, 'freq': freq, 'bar_time': bucket,
+             'open': o, 'high': h, 'low': l, 'close': c, 'volume': 0.0}
+            for stock_id, o, h, l, c in zip(ids.tolist(), opens.tolist(), highs.tolist(),
+                                            lows.tolist(), closes.tolist())
+        ]
+
+    def flush(self):
+        """写入全部未完成的K线，返回写入数量；由调用方提交"""
+        written = 0
+        for freq in list(self._bars):
+            written += self.store.merge(self._flush_rows(freq))
+        return written
+
+    def on_tick(self, ids, prices, now=None):
+        """合并一次 tick 的价格向量，返回本次写入的K线数量"""
+        now = now or datetime.now()
+        written = 0
+        if self._flushed_at is None:
+            self._flushed_at = now
+        for freq in (DAILY, intraday_freq(self.intraday_minutes)):
+            bucket = self._bucket(freq, now)
+            current = self._bars.get(freq)
+            if current is not None and current[0] == bucket and np.array_equal(current[1], ids):
+                _, _, opens, highs, lows, _ = current
+                self._bars[freq] = (bucket, ids, opens, np.maximum(highs, prices), np.minimum(lows, prices), prices)
+                continue
+            if current is not None and current[0] == bucket:
+                # 股票池变化，按 id 对齐后继续累积
+                self._bars[freq] = self._realign(current, ids, prices)
+                continue
+            written += self.store.merge(self._flush_rows(freq))
+            self._bars[freq] = (bucket, ids, prices.copy(), prices.copy(), prices.copy(), prices)
+        if (now - self._flushed_at).total_seconds() >= self.flush_interval:
+            written += self.flush()
+            self._flushed_at = now
+        return written
+
+    @staticmethod
+    def _realign(current, ids, prices):
+        bucket, old_ids, opens, highs, lows, _ = current
+        if len(old_ids) == 0:
+            return bucket, ids, prices.copy(), prices.copy(), prices.copy(), prices
+        index = {stock_id: row for row, stock_id in enumerate(old_ids.tolist())}
+        rows = np.asarray([index.get(stock_id, -1) for stock_id in ids.tolist()], dtype=np.int64)
+        known = rows >= 0
+        rows = np.where(known, rows, 0)
+        new_opens = np.where(known, opens[rows], prices)
+        new_highs = np.maximum(np.where(known, highs[rows], prices), prices)
+        new_lows = np.minimum(np.where(known, lows[rows], prices), prices)
+        return bucket, ids, new_opens, new_highs, new_lows, prices
+
+
+bar_store = BarStore()
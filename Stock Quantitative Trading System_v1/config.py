@@ -8,7 +8,26 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-please-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///stock_trading.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 数据库引擎配置（DATABASE_URL 可指向 PostgreSQL，SQLite 参数只对 SQLite 生效）
+    SQLITE_JOURNAL_MODE = 'WAL'    # WAL 模式下读写互不阻塞
+    SQLITE_SYNCHRONOUS = 'NORMAL'  # WAL 模式下只在检查点同步到磁盘
+    SQLITE_CACHE_SIZE_KB = 16384   # 每个连接的页缓存大小（KB）
+    SQLITE_BUSY_TIMEOUT = 5        # 等待写锁的秒数
+    DB_WEB_POOL_SIZE = 8           # 网页请求线程使用的连接数
+    DB_BACKGROUND_POOL_SIZE = 4    # 后台线程（行情、委托执行、行情刷新、量化策略）使用的连接数
+    DB_MAX_OVERFLOW = 4            # 连接池满时允许临时增加的连接数
+    DB_POOL_TIMEOUT = 10           # 等待空闲连接的秒数
+    DB_POOL_RECYCLE = 1800         # 连接最长使用时间（秒），避免服务端断开
+    MARKET_DATABASE_URL = os.environ.get('MARKET_DATABASE_URL')  # 行情库（股票、K线），为空时与账本同库
+    LEDGER_REPLICA_URL = os.environ.get('LEDGER_REPLICA_URL')    # 账本只读副本，为空时分析页面也读主库
+
     TUSHARE_TOKEN = os.environ.get('TUSHARE_TOKEN')
+    TUSHARE_BACKEND = os.environ.get('TUSHARE_BACKEND') or 'tushare'  # 'tushare' 或 'fake'（离线模拟数据）
+    TUSHARE_RATE_LIMIT = 200          # 每分钟最多调用次数
+    TUSHARE_CACHE_DIR = os.environ.get('TUSHARE_CACHE_DIR') or 'cache/tushare'  # 接口响应的磁盘缓存目录
+    TUSHARE_BATCH_SIZE = 50           # daily 接口每次请求的股票数量
+    TUSHARE_MAX_ROWS = 6000           # daily 接口每次最多返回的行数，分批时按股票数乘交易日数控制
     
     # 会话配置
     PERMANENT_SESSION_LIFETIME = timedelta(days=31)  # 会话持续31天
@@ -20,4 +39,56 @@ class Config:
     INITIAL_BALANCE = 100000  # 初始资金
     COMMISSION_RATE = 0.0003  # 手续费率
     MIN_TRADE_AMOUNT = 1      # 最小交易数量
-    MAX_TRADE_AMOUNT = 100000 # 最大交易数量 
\ No newline at end of file
+    MAX_TRADE_AMOUNT = 100000 # 最大交易数量
+
+    # 数据初始化配置
+    STOCK_LOAD_CHUNK_SIZE = 1000  # 批量写入股票数据的分块大小
+
+    # 行情模拟配置
+    PRICE_TICK_INTERVAL = 30     # 价格更新间隔（秒）
+    PRICE_UNIVERSE_SIZE = None   # 参与模拟的股票数量上限，None 表示全部
+    PRICE_VOLATILITY = 0.02      # 单次 tick 的最大波动幅度
+    QUOTE_MAX_AGE = 90           # 行情缓存超过该秒数未更新视为过期
+    QUOTE_STREAM_KEEPALIVE = 15  # 行情推送连接的心跳间隔（秒）
+    BAR_INTRADAY_MINUTES = 5     # 分钟K线周期
+    BAR_FLUSH_INTERVAL = 60      # 未完成的K线写入数据库的间隔（秒），进程重启时最多丢失这段时间的行情
+    BACKFILL_YEARS = 5           # 历史日线回补年数
+    BACKFILL_WORKERS = 8         # 回补时的并发请求数
+    BACKFILL_WRITE_BATCH = 20000  # 每累积多少根K线写入并提交一次
+    BACKFILL_CHECKPOINT = 'cache/backfill_checkpoint.json'  # 回补进度文件
+
+    # 外部行情配置
+    MARKET_DATA_SOURCE = os.environ.get('MARKET_DATA_SOURCE') or 'tushare'  # 'tushare' 或 'local'（离线，使用本地日线）
+    MARKET_DATA_MAX_AGE = 300    # 单只股票距上次从数据源刷新超过该秒数时在后台刷新
+    MARKET_DATA_BATCH_SIZE = 100 # 每次向数据源请求的股票数量
+
+    # 委托执行配置
+    EXECUTION_MAX_BATCH = 256  # 写线程单次提交的最大委托数量
+    EXECUTION_TIMEOUT = 10     # 等待委托执行结果的超时时间（秒）
+
+    # 部署配置
+    APP_ROLE = os.environ.get('APP_ROLE') or 'all'  # 'all'（网页和后台任务）、'web'（只处理请求）或 'scheduler'（只运行后台任务）
+    LEADER_ELECTION = os.environ.get('LEADER_ELECTION') or 'file'  # 'file'（单机文件锁）或 'db'（数据库租约，可跨主机）
+    LEADER_LOCK_FILE = 'cache/scheduler.lock'  # 文件锁路径
+    LEADER_LEASE_TTL = 30       # 数据库租约有效期（秒）
+    LEADER_CHECK_INTERVAL = 10  # 选举续约和非领导者同步数据的间隔（秒），需小于租约有效期的一半
+
+    # 后台任务配置
+    QUANT_INTERVAL = 60          # 量化策略检查间隔（秒）
+    JOB_JITTER = 1.0             # 每次执行的随机延迟上限（秒），错开同时到期的任务
+    JOB_MAX_BACKOFF = 600        # 任务连续失败时的最长退避时间（秒）
+    SCHEDULE_MARKET_HOURS_ONLY = True  # 只在交易日的交易时段运行行情模拟和量化策略，False 时全天运行（便于开发调试）
+    MARKET_SESSIONS = [('09:30', '11:30'), ('13:00', '15:00')]  # 交易时段
+    TRADING_CALENDAR_FILE = 'cache/trading_calendar.csv'  # 交易日历文件，启动时优先读取，过期时从 trade_cal 重新获取
+    TRADING_CALENDAR_START = '20100101'  # 交易日历的起始日期
+    TRADING_CALENDAR_REFRESH_INTERVAL = 24 * 3600  # 检查交易日历是否需要更新的间隔（秒）
+
+    # 性能统计配置
+    SQL_LOG_STATEMENTS = 20    # 单个请求的 SQL 语句数达到该值时打印日志
+
+    # 量化策略配置
+    QUANT_BATCH_EVALUATION = True  # 批量向量化评估所有策略，False 时逐个评估
+    OPTIMIZER_PROCESSES = None     # 参数寻优的进程数，None 表示使用全部 CPU 核心；进程池由所有寻优请求共用
+    OPTIMIZER_MAX_SWEEPS = 2       # 同时进行的参数寻优数量上限，超出时请求返回 429
+    OPTIMIZER_CHUNK_SIZE = 64      # 每个寻优任务包含的参数组合数量
+    OPTIMIZER_MAX_RUNS = 200000    # 单次寻优允许的最大回测次数（参数组合 x 股票数）
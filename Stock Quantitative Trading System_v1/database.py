@@ -1,10 +1,102 @@
-from flask_sqlalchemy import SQLAlchemy
+from functools import wraps
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector, get_state
+from sqlalchemy import orm
 from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import pandas as pd
 
-db = SQLAlchemy()
+from db_engine import engine_options
+from signals import latest_signal
+
+# 行情库（股票、K线）和账本只读副本在 SQLALCHEMY_BINDS 中的名称
+MARKET_BIND = 'market'
+LEDGER_REPLICA_BIND = 'ledger_replica'
+
+def _read_only_request():
+    return has_request_context() and g.get('db_read_only', False)
+
+def reads_replica():
+    """当前请求的账本查询是否从只读副本读取"""
+    return _read_only_request() and LEDGER_REPLICA_BIND in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+class RoutingSession(SignallingSession):
+    """按 __bind_key__ 选择数据库；只读请求中的账本查询使用只读副本，写入始终使用主库"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if mapper is not None and not self._flushing and _read_only_request():
+            binds = self.app.config.get('SQLALCHEMY_BINDS') or {}
+            if mapper.persist_selectable.info.get('bind_key') is None and LEDGER_REPLICA_BIND in binds:
+                return db.get_engine(self.app, bind=LEDGER_REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+class _WorkloadConnector(_EngineConnector):
+    """后台线程使用的引擎，与网页请求的引擎分开建立连接池"""
+
+    def get_options(self, sa_url, echo):
+        sa_url, options = super().get_options(sa_url, echo)
+        options['workload'] = 'background'
+        return sa_url, options
+
+class Database(SQLAlchemy):
+    """支持行情库和账本分库、账本只读副本的 SQLAlchemy 扩展"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_engine(self, app=None, bind=None):
+        # 地址与主库相同的 bind 直接使用主库引擎，同一事务不会占用同一文件的两个连接
+        app = self.get_app(app)
+        binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        if bind is not None and binds.get(bind) == app.config['SQLALCHEMY_DATABASE_URI']:
+            bind = None
+        # 不在请求中的线程（行情、委托执行、行情刷新、量化策略）使用独立的连接池，
+        # 请求占满网页连接池时后台写线程不需要等待；只读副本和内存库只建一个引擎
+        uri = binds.get(bind) if bind is not None else app.config['SQLALCHEMY_DATABASE_URI']
+        if has_request_context() or bind == LEDGER_REPLICA_BIND or not engine_options(app.config, uri):
+            return super().get_engine(app, bind)
+        state = get_state(app)
+        with self._engine_lock:
+            connector = state.connectors.get(('background', bind))
+            if connector is None:
+                connector = _WorkloadConnector(self, app, bind)
+                state.connectors[('background', bind)] = connector
+        return connector.get_engine()
+
+    def create_engine(self, sa_url, engine_opts):
+        # 连接池参数按各自的数据库地址设置，行情库可以是内存库而账本是文件库
+        config = self.get_app().config
+        engine_opts = dict(engine_opts)
+        tuned = engine_options(config, str(sa_url), engine_opts.pop('workload', 'web'))
+        if tuned:
+            engine_opts.pop('poolclass', None)
+            engine_opts.update(tuned)
+            engine_opts.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        return super().create_engine(sa_url, engine_opts)
+
+    def create_all(self, bind='__all__', app=None):
+        if bind == '__all__':
+            # 只读副本由主库复制而来，不在副本上建表
+            binds = self.get_app(app).config.get('SQLALCHEMY_BINDS') or {}
+            bind = [key for key in binds if key != LEDGER_REPLICA_BIND] + [None]
+        super().create_all(bind, app)
+
+db = Database()
+
+def read_only(view):
+    """只读取数据的分析类路由：配置了账本只读副本时从副本读取"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def create_missing_indexes():
+    """create_all 不会给已存在的表补建索引，升级后逐个检查并补建"""
+    for table in db.Model.metadata.sorted_tables:
+        engine = db.get_engine(bind=table.info.get('bind_key'))
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -22,6 +114,8 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Stock(db.Model):
+    __bind_key__ = MARKET_BIND
+
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(10), unique=True, nullable=False)  # 股票代码
     name = db.Column(db.String(50), nullable=False)  # 股票名称
@@ -30,8 +124,11 @@ class Stock(db.Model):
     last_price = db.Column(db.Float)  # 最新价格
     prev_price = db.Column(db.Float)  # 前一日价格
     last_update = db.Column(db.DateTime)  # 最后更新时间
-    positions = db.relationship('Position', backref='stock', lazy=True)
-    trades = db.relationship('Trade', backref='stock', lazy=True)
+    # 账本表与股票分库存放，stock_id 不建外键，关联条件显式指定
+    positions = db.relationship('Position', primaryjoin='Stock.id == foreign(Position.stock_id)',
+                                backref='stock', lazy=True)
+    trades = db.relationship('Trade', primaryjoin='Stock.id == foreign(Trade.stock_id)',
+                             backref='stock', lazy=True)
 
     @classmethod
     def get_default_stocks(cls):
@@ -59,19 +156,45 @@ class Stock(db.Model):
             {'code': '688981.SH', 'name': '中芯国际', 'industry': '半导体', 'market': '科创板', 'last_price': 45.80}
         ]
 
+class StockBar(db.Model):
+    """K线数据，freq 为 '1d'（日线）或 '5min' 等分钟线，按时间只追加写入"""
+    __bind_key__ = MARKET_BIND
+    __table_args__ = (
+        db.Index('ix_stock_bar_stock_freq_time', 'stock_id', 'freq', 'bar_time', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    freq = db.Column(db.String(8), nullable=False)  # K线周期
+    bar_time = db.Column(db.DateTime, nullable=False)  # K线起始时间
+    open = db.Column(db.Float, nullable=False)
+    high = db.Column(db.Float, nullable=False)
+    low = db.Column(db.Float, nullable=False)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.Float, default=0)
+
 class Position(db.Model):
+    __table_args__ = (
+        db.Index('ix_position_user_stock', 'user_id', 'stock_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    stock_id = db.Column(db.Integer, nullable=False)  # 行情库 stock.id，不同库之间不建外键
     quantity = db.Column(db.Integer, nullable=False)
     average_price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Trade(db.Model):
+    __table_args__ = (
+        db.Index('ix_trade_user_created', 'user_id', 'created_at'),
+        db.Index('ix_trade_user_stock_created', 'user_id', 'stock_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    stock_id = db.Column(db.Integer, db.ForeignKey('stock.id'), nullable=False)
+    stock_id = db.Column(db.Integer, nullable=False)  # 行情库 stock.id，不同库之间不建外键
     type = db.Column(db.String(4), nullable=False)  # 'BUY' or 'SELL'
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
@@ -79,6 +202,96 @@ class Trade(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class DailyPnl(db.Model):
+    """按用户、股票和日期汇总的成交和已实现盈亏，每次成交时增量更新"""
+    __tablename__ = 'daily_pnl'
+    __table_args__ = (
+        db.Index('ix_daily_pnl_user_stock_date', 'user_id', 'stock_id', 'trade_date', unique=True),
+        db.Index('ix_daily_pnl_user_date', 'user_id', 'trade_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    stock_id = db.Column(db.Integer, nullable=False)  # 行情库 stock.id，不同库之间不建外键
+    trade_date = db.Column(db.Date, nullable=False)  # 成交日期（与 Trade.created_at 的日期一致）
+    trades = db.Column(db.Integer, nullable=False, default=0)  # 成交笔数
+    buy_quantity = db.Column(db.Integer, nullable=False, default=0)
+    sell_quantity = db.Column(db.Integer, nullable=False, default=0)
+    buy_amount = db.Column(db.Float, nullable=False, default=0)  # 买入成交金额
+    sell_amount = db.Column(db.Float, nullable=False, default=0)  # 卖出成交金额
+    commission = db.Column(db.Float, nullable=False, default=0)  # 手续费
+    realized_profit = db.Column(db.Float, nullable=False, default=0)  # 已实现盈亏（已扣手续费）
+
+    def __init__(self, user_id, stock_id, trade_date):
+        self.user_id = user_id
+        self.stock_id = stock_id
+        self.trade_date = trade_date
+        self.trades = 0
+        self.buy_quantity = 0
+        self.sell_quantity = 0
+        self.buy_amount = 0.0
+        self.sell_amount = 0.0
+        self.commission = 0.0
+        self.realized_profit = 0.0
+
+    def add_trade(self, side, quantity, amount, commission, profit):
+        """累加一笔成交"""
+        self.trades += 1
+        if side == 'BUY':
+            self.buy_quantity += quantity
+            self.buy_amount += amount
+        else:
+            self.sell_quantity += quantity
+            self.sell_amount += amount
+        self.commission += commission
+        self.realized_profit += profit
+
+    @property
+    def cash_flow(self):
+        """当日资金净流入：卖出所得减买入支出，均扣除手续费"""
+        return self.sell_amount - self.buy_amount - self.commission
+
+class RestingOrder(db.Model):
+    """挂单（限价、止损、止损限价），成交或撤销前保存在内存订单簿中"""
+    __table_args__ = (
+        db.Index('ix_resting_order_status', 'status'),
+        db.Index('ix_resting_order_user_status', 'user_id', 'status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    stock_id = db.Column(db.Integer, nullable=False)  # 行情库 stock.id，不同库之间不建外键
+    side = db.Column(db.String(4), nullable=False)  # 'BUY' or 'SELL'
+    order_type = db.Column(db.String(10), nullable=False)  # 'LIMIT', 'STOP' or 'STOP_LIMIT'
+    quantity = db.Column(db.Integer, nullable=False)
+    limit_price = db.Column(db.Float)  # 限价
+    stop_price = db.Column(db.Float)  # 触发价
+    status = db.Column(db.String(10), nullable=False, default='OPEN')  # OPEN/TRIGGERED/FILLED/CANCELLED/EXPIRED/REJECTED
+    reason = db.Column(db.String(100))  # 拒绝原因
+    expires_at = db.Column(db.DateTime)  # 有效期，为空表示撤销前一直有效
+    fill_price = db.Column(db.Float)
+    trade_id = db.Column(db.Integer, db.ForeignKey('trade.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    stock = db.relationship('Stock', primaryjoin='foreign(RestingOrder.stock_id) == Stock.id', lazy=True)
+
+class MarketState(db.Model):
+    """行情库中的运行状态，按名称保存，例如行情引擎最后一次 tick 所在的交易日"""
+    __bind_key__ = MARKET_BIND
+    __tablename__ = 'market_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(50), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SchedulerLease(db.Model):
+    """后台任务领导者的数据库租约，holder 在 expires_at 之前持有，过期后其他进程可以接管"""
+    __tablename__ = 'scheduler_lease'
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 class TradingStrategy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -90,6 +303,11 @@ class TradingStrategy(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class QuantStrategy(db.Model):
+    __table_args__ = (
+        db.Index('ix_quant_strategy_user_code', 'user_id', 'stock_code'),
+        db.Index('ix_quant_strategy_active', 'is_active'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     stock_code = db.Column(db.String(20), nullable=False)
@@ -121,22 +339,8 @@ class QuantStrategy(db.Model):
     
     def calculate_signal(self, prices):
         """Calculate trading signal based on moving averages and momentum"""
-        if len(prices) < max(self.ma_long, self.momentum_days):
-            return 0
-            
-        # Calculate moving averages
-        ma_short_values = pd.Series(prices).rolling(window=self.ma_short).mean()
-        ma_long_values = pd.Series(prices).rolling(window=self.ma_long).mean()
-        
-        # Calculate momentum
-        momentum = (prices[-1] - prices[-self.momentum_days]) / prices[-self.momentum_days]
-        
-        # Generate signal
-        if ma_short_values.iloc[-1] > ma_long_values.iloc[-1] and momentum > 0:
-            return 1  # Buy signal
-        elif ma_short_values.iloc[-1] < ma_long_values.iloc[-1] and momentum < 0:
-            return -1  # Sell signal
-        return 0  # Hold
+        # 均线按整数分精确比较，两条均线相等时持有（与批量评估、回测共用 signals.ma_signals）
+        return latest_signal(prices, self.ma_short, self.ma_long, self.momentum_days)
 
     def to_dict(self):
         """Convert strategy to dictionary for JSON serialization"""
@@ -0,0 +1,253 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+_installed = False
+# 连接建立时应用的 SQLite 参数，由 install_sqlite_pragmas 设置
+_pragmas = {}
+
+
+def sqlite_pragmas(config):
+    """根据配置生成连接建立时执行的 PRAGMA 列表"""
+    return {
+        'journal_mode': config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -int(config.get('SQLITE_CACHE_SIZE_KB', 16384)),
+        'busy_timeout': int(config.get('SQLITE_BUSY_TIMEOUT', 5) * 1000),
+        'temp_store': 'MEMORY',
+    }
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas(config):
+    """在所有 Engine 的连接建立时应用 SQLite 参数，其他数据库不受影响"""
+    global _installed
+    _pragmas.clear()
+    _pragmas.update(sqlite_pragmas(config))
+    if not _installed:
+        event.listen(Engine, 'connect', _apply_pragmas)
+        _installed = True
+
+
+def engine_options(config, uri=None, workload='web'):
+    """生成 uri 对应数据库的 create_engine 参数，uri 为空时使用主库地址
+
+    网页请求和后台线程（行情、委托执行、行情刷新、量化策略）各自建立引擎，
+    workload 为 'web' 时连接池大小取 DB_WEB_POOL_SIZE，为 'background' 时取
+    DB_BACKGROUND_POOL_SIZE，请求占满网页连接池时后台写线程不会等待连接。
+    内存 SQLite 数据库只能使用单个连接，保持 SQLAlchemy 默认设置。
+    """
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if workload == 'background':
+        pool_size = config.get('DB_BACKGROUND_POOL_SIZE', 4)
+    else:
+        pool_size = config.get('DB_WEB_POOL_SIZE', 8)
+    if uri.startswith('sqlite'):
+        if ':memory:' in uri or uri.rstrip('/') == 'sqlite:':
+            return {}
+        return {
+            'poolclass': QueuePool,
+            'pool_size': pool_size,
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 4),
+            'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5), 'check_same_thread': False},
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 4),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+def init_app(app):
+    """应用数据库引擎配置，需在 db.init_app(app) 之前调用
+
+    行情库（股票、K线）使用 MARKET_DATABASE_URL，未配置时与账本同库；
+    配置了 LEDGER_REPLICA_URL 时，分析类路由的账本查询从只读副本读取。
+    各数据库的连接池参数由 Database.create_engine 按地址调用 engine_options 设置。
+    """
+    install_sqlite_pragmas(app.config)
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('market', app.config.get('MARKET_DATABASE_URL') or app.config['SQLALCHEMY_DATABASE_URI'])
+    if app.config.get('LEDGER_REPLICA_URL'):
+        binds.setdefault('ledger_replica', app.config['LEDGER_REPLICA_URL'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def benchmark(readers=8, duration=3.0, stocks=5000, tick_interval=0.05, journal_modes=('DELETE', 'WAL')):
+    """行情写线程与多个读线程并发访问同一 SQLite 文件时的延迟对比
+
+    写线程按 tick_interval 批量更新全部股票价格并提交，读线程不断执行
+    持仓页面类似的联表查询，统计两种日志模式下的读写延迟和锁等待失败次数。
+    """
+    results = {}
+    for journal_mode in journal_modes:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'bench.db')
+        install_sqlite_pragmas({'SQLITE_JOURNAL_MODE': journal_mode})
+        engine = create_engine(f'sqlite:///{path}', **engine_options(
+            {'DB_WEB_POOL_SIZE': readers, 'DB_BACKGROUND_POOL_SIZE': 1}, f'sqlite:///{path}'))
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE stock (id INTEGER PRIMARY KEY, last_price FLOAT)'))
+            conn.execute(text('CREATE TABLE position (id INTEGER PRIMARY KEY, user_id INTEGER, '
+                              'stock_id INTEGER, quantity INTEGER)'))
+            conn.execute(text('INSERT INTO stock (id, last_price) VALUES (:id, 10.0)'),
+                         [{'id': i} for i in range(1, stocks + 1)])
+            conn.execute(text('INSERT INTO position (user_id, stock_id, quantity) VALUES (:u, :s, 100)'),
+                         [{'u': i % 100, 's': i % stocks + 1} for i in range(2000)])
+
+        stop = threading.Event()
+        read_times, write_times, errors = [], [], [0]
+        lock = threading.Lock()
+
+        def writer():
+            rng = np.random.default_rng(0)
+            while not stop.is_set():
+                prices = [{'p': float(p), 'id': i + 1} for i, p in enumerate(rng.uniform(5, 15, stocks))]
+                start = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text('UPDATE stock SET last_price = :p WHERE id = :id'), prices)
+                    write_times.append(time.perf_counter() - start)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+                time.sleep(tick_interval)
+
+        def reader(user_id):
+            query = text('SELECT p.stock_id, p.quantity * s.last_price FROM position p '
+                         'JOIN stock s ON s.id = p.stock_id WHERE p.user_id = :u')
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(query, {'u': user_id}).fetchall()
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        read_times.append(elapsed)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=writer)] + \
+                  [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+        reads = np.asarray(read_times) * 1000
+        writes = np.asarray(write_times) * 1000
+        results[journal_mode] = {
+            'reads_per_sec': len(reads) / duration,
+            'read_p50_ms': float(np.percentile(reads, 50)) if len(reads) else None,
+            'read_p99_ms': float(np.percentile(reads, 99)) if len(reads) else None,
+            'write_p50_ms': float(np.percentile(writes, 50)) if len(writes) else None,
+            'write_p99_ms': float(np.percentile(writes, 99)) if len(writes) else None,
+            'errors': errors[0],
+        }
+        stats = results[journal_mode]
+        print(f"{journal_mode}: 读 {stats['reads_per_sec']:.0f} 次/秒, "
+              f"读延迟 p50 {stats['read_p50_ms']:.2f} ms / p99 {stats['read_p99_ms']:.2f} ms, "
+              f"写延迟 p50 {stats['write_p50_ms']:.2f} ms / p99 {stats['write_p99_ms']:.2f} ms, "
+              f"失败 {stats['errors']} 次")
+    return results
+
+
+def pool_benchmark(requests=24, duration=3.0, hold=0.05, tick_interval=0.05, web_pool=8, background_pool=4):
+    """请求线程占满连接池时，行情写线程取得连接的等待时间对比
+
+    shared 为网页请求和后台线程共用一个连接池（大小为两者之和），split 为两者
+    各自建立引擎。requests 个请求线程每次持有连接 hold 秒，写线程按
+    tick_interval 取连接、更新价格并提交，统计写线程等待连接的时间。
+    """
+    config = {'DB_WEB_POOL_SIZE': web_pool, 'DB_BACKGROUND_POOL_SIZE': background_pool,
+              'DB_MAX_OVERFLOW': 0}
+    results = {}
+    for mode in ('shared', 'split'):
+        directory = tempfile.mkdtemp()
+        uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        install_sqlite_pragmas({'SQLITE_JOURNAL_MODE': 'WAL'})
+        if mode == 'shared':
+            web_engine = background_engine = create_engine(uri, **engine_options(
+                dict(config, DB_WEB_POOL_SIZE=web_pool + background_pool), uri))
+        else:
+            web_engine = create_engine(uri, **engine_options(config, uri))
+            background_engine = create_engine(uri, **engine_options(config, uri, 'background'))
+        with background_engine.begin() as conn:
+            conn.execute(text('CREATE TABLE stock (id INTEGER PRIMARY KEY, last_price FLOAT)'))
+            conn.execute(text('INSERT INTO stock (id, last_price) VALUES (:id, 10.0)'),
+                         [{'id': i} for i in range(1, 501)])
+
+        stop = threading.Event()
+        waits = []
+
+        def writer():
+            while not stop.is_set():
+                start = time.perf_counter()
+                with background_engine.connect() as conn:
+                    waits.append(time.perf_counter() - start)
+                    with conn.begin():
+                        conn.execute(text('UPDATE stock SET last_price = last_price + 0.01'))
+                time.sleep(tick_interval)
+
+        def request():
+            while not stop.is_set():
+                with web_engine.connect() as conn:
+                    conn.execute(text('SELECT SUM(last_price) FROM stock')).fetchall()
+                    time.sleep(hold)
+
+        threads = [threading.Thread(target=request) for _ in range(requests)]
+        for thread in threads:
+            thread.start()
+        # 请求线程占满连接池后再启动写线程
+        time.sleep(hold)
+        threads.append(threading.Thread(target=writer))
+        threads[-1].start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        web_engine.dispose()
+        background_engine.dispose()
+        shutil.rmtree(directory, ignore_errors=True)
+
+        waits_ms = np.asarray(waits) * 1000
+        results[mode] = {
+            'ticks': len(waits_ms),
+            'wait_p50_ms': float(np.percentile(waits_ms, 50)) if len(waits_ms) else None,
+            'wait_p99_ms': float(np.percentile(waits_ms, 99)) if len(waits_ms) else None,
+            'wait_max_ms': float(waits_ms.max()) if len(waits_ms) else None,
+        }
+        stats = results[mode]
+        print(f"{mode}: 写线程提交 {stats['ticks']} 次, 等待连接 p50 {stats['wait_p50_ms']:.2f} ms / "
+              f"p99 {stats['wait_p99_ms']:.2f} ms / 最长 {stats['wait_max_ms']:.2f} ms")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
+    pool_benchmark()
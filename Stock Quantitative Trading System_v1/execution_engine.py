@@ -0,0 +1,356 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database import db, User, Position, Trade, QuantStrategy, RestingOrder, DailyPnl
+
+BUY = 'BUY'
+SELL = 'SELL'
+
+
+class Order(namedtuple('Order', ['user_id', 'stock_id', 'side', 'quantity', 'price',
+                                   'strategy_id', 'resting_order_id'])):
+    """市价委托；strategy_id 不为空时表示由量化策略发出，
+    resting_order_id 不为空时表示由订单簿中触发的挂单发出"""
+    __slots__ = ()
+
+    def __new__(cls, user_id, stock_id, side, quantity, price, strategy_id=None, resting_order_id=None):
+        return super().__new__(cls, user_id, stock_id, side, quantity, price, strategy_id, resting_order_id)
+
+
+# 委托的执行结果；filled 为 False 时 reason 说明拒绝原因
+Fill = namedtuple('Fill', [
+    'order', 'filled', 'reason', 'trade_id', 'quantity', 'price',
+    'commission', 'total_amount', 'balance', 'profit'
+])
+
+
+def _rejected(order, reason):
+    return Fill(order, False, reason, None, 0, order.price, 0.0, 0.0, None, 0.0)
+
+
+class ExecutionEngine:
+    """唯一修改账户余额和持仓的写线程
+
+    网页交易和量化策略都把委托放入队列，由一个后台线程按到达顺序
+    逐个执行，同一用户的委托天然按提交顺序串行。写线程每次取出队列中
+    积压的一批委托，在同一个事务中执行后一次提交，调用方通过 Future
+    取得各自的成交结果。
+
+    多进程部署时每个进程各有一个写线程，事务开始时先锁定本批涉及的
+    用户行（PostgreSQL 等使用 SELECT ... FOR UPDATE，SQLite 使用
+    BEGIN IMMEDIATE 取得写锁），同一用户的余额和持仓在进程之间也串行修改。
+    """
+
+    def __init__(self, app=None, max_batch=256, max_wait=0.002):
+        self.app = None
+        self.commission_rate = 0.0
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self.batches = 0
+        self.orders = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.commission_rate = app.config['COMMISSION_RATE']
+        self.max_batch = app.config.get('EXECUTION_MAX_BATCH', self.max_batch)
+
+    def add_listener(self, listener):
+        """注册回调 listener(fills)，每次提交后在写线程中收到本批成交"""
+        self._listeners.append(listener)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='execution-engine', daemon=True)
+                self._thread.start()
+
+    def submit(self, order):
+        """提交委托，返回 Future，结果为 Fill"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((order, future))
+        return future
+
+    def execute(self, order, timeout=None):
+        """提交委托并等待成交结果"""
+        return self.submit(order).result(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                batch = [(order, future) for order, future in batch if future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                try:
+                    fills = self._commit([order for order, _ in batch])
+                except Exception as e:
+                    # 整批提交失败时逐个重试，只让出错的委托失败
+                    print(f"批量执行委托失败，逐个重试: {str(e)}")
+                    db.session.rollback()
+                    fills = []
+                    for order, future in batch:
+                        try:
+                            fills.append(self._commit([order])[0])
+                        except Exception as error:
+                            db.session.rollback()
+                            fills.append(error)
+                finally:
+                    db.session.remove()
+
+                # 先通知回调再返回结果，调用方拿到成交时各缓存已经更新
+                self._notify([fill for fill in fills if not isinstance(fill, Exception) and fill.filled])
+                for (_, future), fill in zip(batch, fills):
+                    if isinstance(fill, Exception):
+                        future.set_exception(fill)
+                    else:
+                        future.set_result(fill)
+
+    def _notify(self, fills):
+        if not fills:
+            return
+        for listener in self._listeners:
+            try:
+                listener(fills)
+            except Exception as e:
+                print(f"成交回调出错: {str(e)}")
+
+    def _commit(self, orders):
+        """在一个事务中执行一批委托并提交，返回与 orders 对应的 Fill 列表"""
+        users = {user.id: user for user in self._lock_users({order.user_id for order in orders})}
+
+        manual = [order for order in orders if order.strategy_id is None]
+        positions = {}
+        if manual:
+            for position in Position.query.filter(
+                Position.user_id.in_({order.user_id for order in manual}),
+                Position.stock_id.in_({order.stock_id for order in manual})
+            ).all():
+                positions.setdefault((position.user_id, position.stock_id), position)
+
+        strategy_ids = {order.strategy_id for order in orders if order.strategy_id is not None}
+        strategies = {}
+        if strategy_ids:
+            strategies = {strategy.id: strategy for strategy in
+                          QuantStrategy.query.filter(QuantStrategy.id.in_(strategy_ids)).all()}
+
+        claimed = self._claim_resting_orders(orders)
+
+        results = []
+        for order in orders:
+            user = users.get(order.user_id)
+            if order.resting_order_id is not None and order.resting_order_id not in claimed:
+                results.append((_rejected(order, '挂单已撤销或已处理'), None))
+            elif user is None:
+                results.append((_rejected(order, '用户不存在'), None))
+            elif order.strategy_id is None:
+                results.append(self._apply_manual(order, user, positions))
+            else:
+                results.append(self._apply_strategy(order, user, strategies.get(order.strategy_id)))
+
+        # 清仓的持仓在提交前统一删除，同批后续买入可以复用同一行
+        for position in positions.values():
+            if position.quantity == 0:
+                if position in db.session.new:
+                    db.session.expunge(position)
+                else:
+                    db.session.delete(position)
+
+        db.session.flush()
+        fills = [fill if trade is None else fill._replace(trade_id=trade.id) for fill, trade in results]
+        self._settle_resting_orders(fills, claimed)
+        self._record_daily_pnl(results)
+        db.session.commit()
+        self.batches += 1
+        self.orders += len(orders)
+        return fills
+
+    def _lock_users(self, user_ids):
+        """开始事务并锁定用户行，本批的读取和写入都在锁内完成
+
+        持仓、策略和每日盈亏都属于用户，锁定用户行即可让其他进程的写线程
+        等待本事务提交后再读取。按 id 顺序加锁，避免两个进程互相等待。
+        """
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # SQLite 不支持 FOR UPDATE，pysqlite 默认只在写语句前开始事务，
+            # 显式 BEGIN IMMEDIATE 让读取也处于持有写锁的事务中
+            db.session.execute(text('BEGIN IMMEDIATE'))
+        return User.query.filter(User.id.in_(user_ids)).order_by(User.id).with_for_update().all()
+
+    def _claim_resting_orders(self, orders):
+        """把挂单按状态条件标记为成交，返回仍处于 OPEN/TRIGGERED 的挂单 id
+
+        撤单同样按状态条件更新，两者在数据库中只有一个能成功：已被撤销或
+        过期的挂单不再成交，已进入成交事务的挂单也不能再撤销。
+        """
+        claimed = set()
+        for order_id in {order.resting_order_id for order in orders if order.resting_order_id is not None}:
+            updated = RestingOrder.query.filter(
+                RestingOrder.id == order_id,
+                RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+            ).update({'status': 'FILLED'}, synchronize_session=False)
+            if updated:
+                claimed.add(order_id)
+        return claimed
+
+    def _settle_resting_orders(self, fills, claimed):
+        """在同一事务中写入挂单的成交结果，挂单和成交记录一起提交"""
+        resting = {fill.order.resting_order_id: fill for fill in fills
+                   if fill.order.resting_order_id in claimed}
+        if not resting:
+            return
+        for order in RestingOrder.query.filter(RestingOrder.id.in_(resting)).all():
+            fill = resting[order.id]
+            if fill.filled:
+                order.status = 'FILLED'
+                order.fill_price = fill.price
+                order.trade_id = fill.trade_id
+            else:
+                order.status = 'REJECTED'
+                order.reason = fill.reason
+
+    def _record_daily_pnl(self, results):
+        """在同一事务中把本批成交累加到每日盈亏汇总表"""
+        trades = [(fill, trade) for fill, trade in results if trade is not None]
+        if not trades:
+            return
+        keys = {(trade.user_id, trade.stock_id, trade.created_at.date()) for _, trade in trades}
+        rows = {
+            (row.user_id, row.stock_id, row.trade_date): row
+            for row in DailyPnl.query.filter(
+                DailyPnl.user_id.in_({user_id for user_id, _, _ in keys}),
+                DailyPnl.trade_date.in_({day for _, _, day in keys})
+            ).all()
+        }
+        for fill, trade in trades:
+            key = (trade.user_id, trade.stock_id, trade.created_at.date())
+            row = rows.get(key)
+            if row is None:
+                row = DailyPnl(*key)
+                db.session.add(row)
+                rows[key] = row
+            row.add_trade(trade.type, trade.quantity, trade.total_amount, trade.commission, fill.profit)
+
+    def _trade(self, order, quantity, commission, amount):
+        trade = Trade(
+            user_id=order.user_id,
+            stock_id=order.stock_id,
+            type=order.side,
+            quantity=quantity,
+            price=order.price,
+            commission=commission,
+            total_amount=amount
+        )
+        db.session.add(trade)
+        return trade
+
+    def _apply_manual(self, order, user, positions):
+        if order.quantity <= 0 or not order.price or order.price <= 0:
+            return _rejected(order, '委托数量或价格无效'), None
+        amount = order.quantity * order.price
+        commission = amount * self.commission_rate
+        key = (order.user_id, order.stock_id)
+        position = positions.get(key)
+
+        if order.side == BUY:
+            # 检查余额是否足够
+            if user.balance < amount + commission:
+                return _rejected(order, '余额不足'), None
+            user.balance -= amount + commission
+
+            # 更新或创建持仓
+            if position:
+                # 计算新的平均成本
+                total_cost = position.average_price * position.quantity + amount
+                position.quantity += order.quantity
+                position.average_price = total_cost / position.quantity
+            else:
+                position = Position(
+                    user_id=order.user_id,
+                    stock_id=order.stock_id,
+                    quantity=order.quantity,
+                    average_price=order.price
+                )
+                db.session.add(position)
+                positions[key] = position
+            profit = 0.0
+        elif order.side == SELL:
+            # 检查持仓是否足够
+            if not position or position.quantity < order.quantity:
+                return _rejected(order, '持仓不足'), None
+            user.balance += amount - commission
+            profit = amount - order.quantity * position.average_price - commission
+            position.quantity -= order.quantity
+        else:
+            return _rejected(order, f'未知的委托方向: {order.side}'), None
+
+        trade = self._trade(order, order.quantity, commission, amount)
+        return Fill(order, True, None, None, order.quantity, order.price,
+                    commission, amount, user.balance, profit), trade
+
+    def _apply_strategy(self, order, user, strategy):
+        """量化策略委托：按策略自身的持仓记账，与手动持仓分开"""
+        if strategy is None or not strategy.is_active:
+            return _rejected(order, '策略不存在或已停止'), None
+        if not order.price or order.price <= 0:
+            return _rejected(order, '委托价格无效'), None
+        today = datetime.now().date()
+
+        if order.side == BUY:
+            if strategy.position > 0:
+                return _rejected(order, '策略已持仓'), None
+            quantity = strategy.position_size
+            amount = quantity * order.price
+            commission = amount * self.commission_rate
+            if user.balance < amount + commission:
+                return _rejected(order, '余额不足'), None
+            user.balance -= amount + commission
+            strategy.position = quantity
+            strategy.avg_price = order.price
+            profit = 0.0
+        elif order.side == SELL:
+            if strategy.position <= 0:
+                return _rejected(order, '策略无持仓'), None
+            quantity = strategy.position
+            amount = quantity * order.price
+            commission = amount * self.commission_rate
+            profit = amount - (quantity * strategy.avg_price) - commission
+            strategy.total_profit += profit
+            user.balance += amount - commission
+            strategy.position = 0
+            strategy.avg_price = 0
+        else:
+            return _rejected(order, f'未知的委托方向: {order.side}'), None
+
+        strategy.last_trade_date = today
+        trade = self._trade(order, quantity, commission, amount)
+        return Fill(order, True, None, None, quantity, order.price,
+                    commission, amount, user.balance, profit), trade
+
+
+execution_engine = ExecutionEngine()
@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from bar_store import bar_store, DAILY, day_bucket
+from signals import ma_signals, to_cents
+
+
+class RollingSum:
+    """固定窗口的滑动求和，每次更新 O(1)
+
+    价格按整数分保存，加减没有舍入误差，窗口和始终与直接求和相同。
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.total = 0
+
+    @property
+    def ready(self):
+        return len(self.values) == self.window
+
+    def update(self, value):
+        if self.ready:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    def total_with(self, value):
+        """假设再追加 value 后的窗口和，不修改状态"""
+        total = self.total + value
+        if self.ready:
+            total -= self.values[0]
+        return total
+
+
+class IncrementalSignal:
+    """QuantStrategy.calculate_signal 的增量版本
+
+    短期/长期均线用整数分的滑动求和维护，动量用长度为 momentum_days 的环形
+    缓冲保存回看价格，每个新价格的更新和信号计算都是 O(1)。信号由
+    signals.ma_signals 给出，与批量评估和回测相同。
+    """
+
+    def __init__(self, ma_short, ma_long, momentum_days):
+        self.ma_short = RollingSum(ma_short)
+        self.ma_long = RollingSum(ma_long)
+        self.lookback = deque(maxlen=momentum_days)
+        self.momentum_days = momentum_days
+        self.required = max(ma_short, ma_long, momentum_days)
+        self.count = 0
+
+    def update(self, price):
+        price = int(to_cents(price))
+        self.ma_short.update(price)
+        self.ma_long.update(price)
+        self.lookback.append(price)
+        self.count += 1
+
+    def signal(self):
+        """与 calculate_signal(已更新的全部价格) 结果一致"""
+        if self.count < self.required:
+            return 0
+        return self._decide(self.ma_short.total, self.ma_long.total, self.lookback[-1], self.lookback[0])
+
+    def signal_with(self, price):
+        """假设再追加一个临时价格（例如盘中最新价）后的信号，不修改状态"""
+        if self.count + 1 < self.required:
+            return 0
+        price = int(to_cents(price))
+        # 追加后 prices[-momentum_days] 是缓冲中第二旧的价格（缓冲未满时为最旧）
+        if len(self.lookback) == self.momentum_days:
+            base = self.lookback[1] if self.momentum_days > 1 else price
+        else:
+            base = self.lookback[0]
+        return self._decide(self.ma_short.total_with(price), self.ma_long.total_with(price), price, base)
+
+    def _decide(self, short_sum, long_sum, price, base):
+        return int(ma_signals(short_sum, self.ma_short.window, long_sum, self.ma_long.window, price, base))
+
+
+class IndicatorEngine:
+    """按策略保存增量指标状态
+
+    首次评估时从K线存储读取最近一个窗口的日线预热；之后每天只读取
+    新增的日线，盘中每次评估只做 O(1) 的临时计算。指标状态只包含今天
+    之前已完成的日线，今天的价格只来自评估时传入的最新价；盘中定期写入
+    的今天的日线不进入状态。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._states = {}  # strategy_id -> (params, IncrementalSignal, last_bar_time, synced_on)
+
+    def _warm_up(self, params, stock_id, today):
+        ma_short, ma_long, momentum_days = params
+        state = IncrementalSignal(ma_short, ma_long, momentum_days)
+        bars = self.store.read_last(stock_id, DAILY, state.required, before=day_bucket(today))
+        for close in bars['close'].tolist():
+            state.update(close)
+        last_time = bars['time'][-1].astype(datetime) if len(bars['time']) else None
+        return state, last_time
+
+    def _catch_up(self, state, stock_id, last_time, today):
+        start = None if last_time is None else last_time + timedelta(microseconds=1)
+        bars = self.store.read_range(stock_id, DAILY, start=start, before=day_bucket(today))
+        for close in bars['close'].tolist():
+            state.update(close)
+        return bars['time'][-1].astype(datetime) if len(bars['time']) else last_time
+
+    def evaluate(self, strategy, stock_id, current_price, today=None):
+        """返回策略在当前价格下的信号：1 买入，-1 卖出，0 持有"""
+        today = today or datetime.now().date()
+        params = (strategy.ma_short, strategy.ma_long, strategy.momentum_days)
+        with self._lock:
+            entry = self._states.get(strategy.id)
+            if entry is None or entry[0] != params:
+                state, last_time = self._warm_up(params, stock_id, today)
+            else:
+                _, state, last_time, synced_on = entry
+                if synced_on != today:
+                    last_time = self._catch_up(state, stock_id, last_time, today)
+            self._states[strategy.id] = (params, state, last_time, today)
+        return state.signal_with(current_price)
+
+    def discard(self, strategy_id):
+        with self._lock:
+            self._states.pop(strategy_id, None)
+
+
+indicator_engine = IndicatorEngine(bar_store)
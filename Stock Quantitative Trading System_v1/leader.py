@@ -0,0 +1,197 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from database import db, SchedulerLease
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _holder_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class FileLock:
+    """单机部署：用操作系统的文件锁选举，持有锁的进程退出后锁自动释放"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """获取或保持锁，返回是否持有"""
+        if self._file is not None:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(_holder_name() + '\n')
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class DatabaseLease:
+    """多主机部署：在数据库中保存带有效期的租约
+
+    持有者每次调用 acquire 时续约；持有者停止续约、租约过期后，其他进程的
+    acquire 才能接管。续约因数据库繁忙等原因失败时，在半个有效期内仍视为
+    持有，不会因一次失败就停下后台任务。
+    """
+
+    def __init__(self, name='scheduler', ttl=30, holder=None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{_holder_name()}:{uuid.uuid4().hex[:8]}"
+        self._valid_until = 0.0
+        self._table_ready = False
+
+    def acquire(self):
+        """获取或续约租约，返回是否持有，需在应用上下文中调用"""
+        if not self._table_ready:
+            # 其他表由当选的领导者创建，租约表需要在选举之前存在
+            SchedulerLease.__table__.create(bind=db.engine, checkfirst=True)
+            self._table_ready = True
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        try:
+            updated = SchedulerLease.query.filter(
+                SchedulerLease.name == self.name,
+                or_(SchedulerLease.holder == self.holder, SchedulerLease.expires_at < now)
+            ).update({'holder': self.holder, 'expires_at': expires_at}, synchronize_session=False)
+            if not updated:
+                db.session.add(SchedulerLease(name=self.name, holder=self.holder, expires_at=expires_at))
+            db.session.commit()
+        except IntegrityError:
+            # 租约由其他进程持有且未过期
+            db.session.rollback()
+            self._valid_until = 0.0
+            return False
+        except Exception as e:
+            db.session.rollback()
+            print(f"续约后台任务租约失败: {str(e)}")
+            return time.monotonic() < self._valid_until
+        self._valid_until = time.monotonic() + self.ttl / 2
+        return True
+
+    def release(self):
+        self._valid_until = 0.0
+        try:
+            SchedulerLease.query.filter_by(name=self.name, holder=self.holder) \
+                .update({'expires_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"释放后台任务租约失败: {str(e)}")
+
+
+class LeaderElection:
+    """后台任务的领导者选举
+
+    每个进程启动一个选举线程，每隔 interval 秒获取或续约锁，同一时刻只有
+    持有锁的进程是领导者。每轮选举后调用 on_cycle(is_leader)：调用方在成为
+    领导者时启动后台任务，不是领导者时从数据库同步其他进程写入的数据。
+    candidate 为 False 的进程（只处理网页请求）从不参选。
+    """
+
+    def __init__(self, lock=None, interval=10):
+        self.app = None
+        self.lock = lock
+        self.interval = interval
+        self._leader = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('LEADER_CHECK_INTERVAL', self.interval)
+        if app.config.get('LEADER_ELECTION', 'file') == 'db':
+            self.lock = DatabaseLease(ttl=app.config.get('LEADER_LEASE_TTL', 30))
+        else:
+            self.lock = FileLock(app.config.get('LEADER_LOCK_FILE', 'cache/scheduler.lock'))
+
+    @property
+    def is_leader(self):
+        return self._leader.is_set()
+
+    def run_once(self, candidate=True):
+        """执行一轮选举，返回本进程是否为领导者"""
+        try:
+            leader = candidate and self.lock.acquire()
+        except Exception as e:
+            print(f"后台任务领导者选举失败: {str(e)}")
+            leader = False
+        if leader and not self.is_leader:
+            self._leader.set()
+            print(f"本进程成为后台任务领导者: {_holder_name()}")
+        elif not leader and self.is_leader:
+            self._leader.clear()
+            print(f"本进程不再是后台任务领导者: {_holder_name()}")
+        return leader
+
+    def _cycle(self, on_cycle, candidate):
+        with self.app.app_context():
+            try:
+                on_cycle(self.run_once(candidate))
+            except Exception as e:
+                print(f"后台任务调度出错: {str(e)}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _run(self, on_cycle, candidate):
+        while True:
+            time.sleep(self.interval)
+            self._cycle(on_cycle, candidate)
+
+    def start(self, on_cycle, candidate=True):
+        """同步执行第一轮选举，然后在后台线程中定期选举"""
+        if self._thread is not None:
+            return
+        self._cycle(on_cycle, candidate)
+        self._thread = threading.Thread(target=self._run, args=(on_cycle, candidate),
+                                        name='leader-election', daemon=True)
+        self._thread.start()
+
+    def release(self):
+        """进程退出前主动释放，其他进程不必等待租约过期"""
+        self._leader.clear()
+        with self.app.app_context():
+            self.lock.release()
+
+
+leader_election = LeaderElection()
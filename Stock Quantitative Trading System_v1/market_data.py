@@ -0,0 +1,178 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import bindparam
+
+from database import db, Stock
+from bar_store import DAILY
+from quote_cache import quote_cache
+
+
+class TushareSource:
+    """通过 Tushare daily 接口获取最近收盘价，一次请求多只股票"""
+
+    def __init__(self, pro, lookback_days=7):
+        self.pro = pro
+        self.lookback_days = lookback_days
+
+    def fetch_latest(self, codes):
+        """返回 {code: 最新收盘价}，没有数据的代码不出现在结果中"""
+        start_date = (datetime.now() - timedelta(days=self.lookback_days)).strftime('%Y%m%d')
+        df = self.pro.daily(ts_code=','.join(codes), start_date=start_date)
+        if df is None or df.empty:
+            return {}
+        latest = df.sort_values('trade_date').groupby('ts_code').tail(1)
+        return {code: float(close) for code, close in zip(latest['ts_code'], latest['close'])}
+
+
+class LocalSource:
+    """离线数据源：使用K线存储中最近一根日线的收盘价"""
+
+    def __init__(self, store, cache):
+        self.store = store
+        self.cache = cache
+
+    def fetch_latest(self, codes):
+        prices = {}
+        for code in codes:
+            quote = self.cache.get(code)
+            if quote is None:
+                continue
+            bars = self.store.read_last(quote.id, DAILY, 1)
+            if len(bars['close']):
+                prices[code] = float(bars['close'][-1])
+        return prices
+
+
+class MarketDataService:
+    """后台行情刷新服务
+
+    请求处理函数只读取行情缓存，不再同步访问外部接口。读取时如果某只
+    股票距上次从数据源刷新已超过 max_age 秒，就把它加入待刷新集合并
+    唤醒后台线程；后台线程按批向数据源请求，写回数据库和行情缓存。
+    读取方拿到的价格最多比数据源旧 max_age 加一次刷新的时间。
+    """
+
+    def __init__(self, cache, source=None, max_age=300, batch_size=100, retry_interval=60):
+        self.app = None
+        self.cache = cache
+        self.source = source
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = set()
+        self._refreshed = {}  # code -> 上次从数据源成功刷新的时间戳
+        self._attempted = {}  # code -> 上次向数据源请求的时间戳
+        self._thread = None
+
+        stock_table = Stock.__table__
+        self._update_stmt = stock_table.update().where(
+            stock_table.c.id == bindparam('_id')
+        ).values(
+            last_price=bindparam('_last_price'),
+            last_update=bindparam('_last_update')
+        )
+
+    def init_app(self, app, source):
+        self.app = app
+        self.source = source
+        self.max_age = app.config.get('MARKET_DATA_MAX_AGE', self.max_age)
+        self.batch_size = app.config.get('MARKET_DATA_BATCH_SIZE', self.batch_size)
+
+    def age(self, code):
+        """距上次从数据源刷新的秒数，从未刷新时返回 None"""
+        refreshed = self._refreshed.get(code)
+        return None if refreshed is None else time.time() - refreshed
+
+    def quote(self, code):
+        """读取缓存中的行情，数据过旧时在后台刷新，不阻塞调用方"""
+        if not self.cache.loaded:
+            self.cache.load_from_db()
+        quote = self.cache.get(code)
+        if quote is not None:
+            age = self.age(code)
+            if age is None or age > self.max_age:
+                self.request([code])
+        return quote
+
+    def request(self, codes):
+        """把股票加入待刷新集合并唤醒后台线程"""
+        if self.source is None:
+            return
+        with self._lock:
+            self._pending.update(codes)
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='market-data', daemon=True)
+                self._thread.start()
+
+    def _take_pending(self):
+        now = time.time()
+        with self._lock:
+            # 最近刚请求过的股票（无论成功与否）不重复请求
+            codes = [code for code in self._pending
+                     if now - self._attempted.get(code, 0) > min(self.max_age, self.retry_interval)]
+            self._pending.clear()
+        return sorted(codes)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            codes = self._take_pending()
+            if not codes:
+                continue
+            with self.app.app_context():
+                for start in range(0, len(codes), self.batch_size):
+                    self.refresh(codes[start:start + self.batch_size])
+
+    def refresh(self, codes):
+        """从数据源刷新一批股票，返回更新的数量"""
+        now = time.time()
+        for code in codes:
+            self._attempted[code] = now
+        try:
+            prices = self.source.fetch_latest(codes)
+        except Exception as e:
+            print(f"刷新行情失败: {str(e)}")
+            return 0
+        # 数据源没有返回的股票同样视为已刷新，避免反复请求
+        for code in codes:
+            self._refreshed[code] = now
+
+        quotes = [(self.cache.get(code), price) for code, price in prices.items() if price and price > 0]
+        quotes = sorted((quote, price) for quote, price in quotes if quote is not None)
+        if not quotes:
+            return 0
+        try:
+            updated_at = datetime.now()
+            db.session.execute(self._update_stmt, [
+                {'_id': quote.id, '_last_price': price, '_last_update': updated_at}
+                for quote, price in quotes
+            ])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"保存行情失败: {str(e)}")
+            return 0
+        finally:
+            db.session.remove()
+
+        ids = np.asarray([quote.id for quote, _ in quotes], dtype=np.int64)
+        last_prices = np.asarray([price for _, price in quotes])
+        prev_prices = np.asarray([quote.prev_price for quote, _ in quotes])
+        self.cache.update(ids, last_prices, prev_prices)
+        return len(quotes)
+
+
+market_data = MarketDataService(quote_cache)
@@ -0,0 +1,284 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backtest import backtest_stats
+
+# 可用于比较参数优劣的指标（越大越好）
+METRICS = ('total_return', 'annual_return', 'sharpe', 'realized_profit', 'win_rate')
+
+# 工作进程内已挂载的共享内存：名称 -> (SharedMemory, 价格数组)，只保留最近使用的几块
+_blocks = OrderedDict()
+MAX_ATTACHED_BLOCKS = 8
+
+
+def parse_range(text, default):
+    """解析 "start:stop[:step]" 形式的闭区间参数范围，例如 "5:60:5" """
+    if not text:
+        return default
+    parts = [int(part) for part in text.split(':')]
+    if parts[0] < 1:
+        raise ValueError(f'无效的参数范围: {text}')
+    if len(parts) == 1:
+        return range(parts[0], parts[0] + 1)
+    step = parts[2] if len(parts) > 2 else 1
+    if step < 1 or parts[1] < parts[0]:
+        raise ValueError(f'无效的参数范围: {text}')
+    return range(parts[0], parts[1] + 1, step)
+
+
+def parameter_grid(ma_short, ma_long, momentum_days):
+    """全部 ma_short < ma_long 的 (ma_short, ma_long, momentum_days) 组合"""
+    return [
+        (short, long, momentum)
+        for short in ma_short
+        for long in ma_long if short < long
+        for momentum in momentum_days
+    ]
+
+
+def random_parameters(ma_short, ma_long, momentum_days, samples, seed=None):
+    """从参数网格中不重复地随机抽取 samples 组参数"""
+    grid = parameter_grid(ma_short, ma_long, momentum_days)
+    if samples >= len(grid):
+        return grid
+    picks = np.random.default_rng(seed).choice(len(grid), size=samples, replace=False)
+    return [grid[i] for i in np.sort(picks).tolist()]
+
+
+def _evaluate(closes, params, settings):
+    position_size, commission_rate, initial_capital = settings
+    return [
+        (combination, backtest_stats(closes, *combination, position_size, commission_rate, initial_capital))
+        for combination in params
+    ]
+
+
+def _attach(name, size):
+    """在工作进程中挂载父进程创建的共享内存，同一块只挂载一次，价格序列不随任务传递"""
+    entry = _blocks.get(name)
+    if entry is None:
+        block = shared_memory.SharedMemory(name=name)
+        entry = (block, np.ndarray((size,), dtype=np.float64, buffer=block.buf))
+        _blocks[name] = entry
+        while len(_blocks) > MAX_ATTACHED_BLOCKS:
+            _, (old_block, _) = _blocks.popitem(last=False)
+            old_block.close()
+    else:
+        _blocks.move_to_end(name)
+    return entry[1]
+
+
+def _run_task(task):
+    name, size, index, start, end, settings, params = task
+    closes = _attach(name, size)[start:end]
+    return index, _evaluate(closes, params, settings)
+
+
+class SweepPool:
+    """进程内共用的寻优进程池
+
+    工作进程在第一次寻优时创建并一直保留，之后的寻优不再重新启动进程
+    （spawn 方式下每个工作进程启动时都要重新导入主模块）。同时进行的寻优
+    不超过 max_sweeps 个，超出时 acquire 返回 False。
+    """
+
+    def __init__(self, processes=None, max_sweeps=2, start_method='spawn'):
+        self.processes = processes or os.cpu_count() or 1
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(max_sweeps)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def init_app(self, app):
+        self.processes = app.config.get('OPTIMIZER_PROCESSES') or os.cpu_count() or 1
+        self._slots = threading.BoundedSemaphore(app.config.get('OPTIMIZER_MAX_SWEEPS', 2))
+
+    def acquire(self):
+        """占用一个寻优名额，名额已满时返回 False"""
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+    def get(self):
+        """返回进程池，第一次调用时创建"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.get_context(self.start_method).Pool(self.processes)
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+
+class BestParameters:
+    """按股票记录目前为止指标最好的参数组合"""
+
+    def __init__(self, metric='total_return'):
+        if metric not in METRICS:
+            raise ValueError(f'不支持的指标: {metric}')
+        self.metric = metric
+        self.evaluated = 0
+        self.best = {}  # key -> (params, stats)
+
+    def add(self, key, results):
+        """合并一批结果，返回该股票的最优结果是否变化"""
+        self.evaluated += len(results)
+        current = self.best.get(key)
+        improved = False
+        for params, stats in results:
+            if current is None or stats[self.metric] > current[1][self.metric]:
+                current = (params, stats)
+                improved = True
+        self.best[key] = current
+        return improved
+
+    def to_dict(self, key=None):
+        keys = self.best if key is None else [key]
+        return {
+            k: {
+                'ma_short': self.best[k][0][0],
+                'ma_long': self.best[k][0][1],
+                'momentum_days': self.best[k][0][2],
+                'stats': self.best[k][1]
+            }
+            for k in keys
+        }
+
+
+class ParameterSweep:
+    """在多个进程上并行回测参数组合
+
+    所有股票的收盘价拼接后放入一块共享内存，工作进程第一次用到时挂载，
+    每个任务只携带 (共享内存名称, 股票序号和区间, 一小批参数)。结果按完成
+    顺序逐批返回，调用方可以边计算边展示。传入 pool（SweepPool）时使用
+    其中长期保留的进程池，同时提交的任务不超过 max_pending 个；调用方提前
+    关闭生成器时不再提交剩余任务，等已提交的任务完成后才返回。不传 pool
+    时本次寻优临时创建进程池，结束时终止。
+    """
+
+    def __init__(self, processes=None, chunk_size=64, start_method='spawn', pool=None, max_pending=None):
+        self.pool = pool
+        self.processes = pool.processes if pool is not None else (processes or os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.start_method = start_method
+        self.max_pending = max_pending or self.processes * 2
+
+    def _tasks(self, count, params):
+        return [
+            (index, params[start:start + self.chunk_size])
+            for index in range(count)
+            for start in range(0, len(params), self.chunk_size)
+        ]
+
+    def run(self, series, params, position_size, commission_rate, initial_capital):
+        """series 为 {key: 收盘价数组}，逐批生成 (key, [(params, stats), ...])"""
+        keys = list(series)
+        settings = (position_size, commission_rate, initial_capital)
+
+        if self.processes == 1:
+            for index, batch in self._tasks(len(keys), params):
+                yield keys[index], _evaluate(np.asarray(series[keys[index]], dtype=np.float64), batch, settings)
+            return
+
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(series[key]) for key in keys], out=offsets[1:])
+        block = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 8, 8))
+        try:
+            prices = np.ndarray((int(offsets[-1]),), dtype=np.float64, buffer=block.buf)
+            for index, key in enumerate(keys):
+                prices[offsets[index]:offsets[index + 1]] = series[key]
+            del prices
+
+            size = int(offsets[-1])
+            tasks = [
+                (block.name, size, index, int(offsets[index]), int(offsets[index + 1]), settings, batch)
+                for index, batch in self._tasks(len(keys), params)
+            ]
+            if self.pool is not None:
+                for index, batch in self._imap_bounded(self.pool.get(), tasks):
+                    yield keys[index], batch
+            else:
+                with multiprocessing.get_context(self.start_method).Pool(self.processes) as pool:
+                    for index, batch in pool.imap_unordered(_run_task, tasks):
+                        yield keys[index], batch
+        finally:
+            block.close()
+            block.unlink()
+
+
+    def _imap_bounded(self, pool, tasks):
+        """在共用进程池上按完成顺序返回结果，未完成的任务不超过 max_pending 个
+
+        进程池中的任务无法撤销，所以按窗口逐个提交：生成器提前关闭时剩余
+        任务不再提交，已提交的任务完成后才返回，寻优名额不会在工作进程
+        仍在计算时被释放。
+        """
+        results = queue.Queue()
+        tasks = iter(tasks)
+        pending = 0
+
+        def submit(task):
+            pool.apply_async(_run_task, (task,), callback=lambda result: results.put((True, result)),
+                             error_callback=lambda error: results.put((False, error)))
+
+        try:
+            for task in itertools.islice(tasks, self.max_pending):
+                submit(task)
+                pending += 1
+            while pending:
+                ok, value = results.get()
+                pending -= 1
+                if not ok:
+                    raise value
+                task = next(tasks, None)
+                if task is not None:
+                    submit(task)
+                    pending += 1
+                yield value
+        finally:
+            while pending:
+                results.get()
+                pending -= 1
+
+
+def benchmark(symbols=8, years=10, processes=None, seed=0):
+    """比较单进程与多进程的回测吞吐量（次/秒）"""
+    rng = np.random.default_rng(seed)
+    bars = years * 252
+    series = {
+        f'S{i}': 10 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+        for i in range(symbols)
+    }
+    params = parameter_grid(range(2, 21, 2), range(10, 61, 5), range(2, 21, 3))
+
+    results = {}
+    for count in sorted({1, processes or os.cpu_count() or 1}):
+        best = BestParameters()
+        start = time.perf_counter()
+        for key, batch in ParameterSweep(processes=count).run(series, params, 100, 0.0003, 100000):
+            best.add(key, batch)
+        elapsed = time.perf_counter() - start
+        results[count] = best.evaluated / elapsed
+        print(f"参数寻优基准: {count} 个进程, {best.evaluated} 次回测, "
+              f"{elapsed:.2f} 秒, {results[count]:.0f} 次/秒")
+    return results
+
+
+sweep_pool = SweepPool()
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,447 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from database import db, RestingOrder
+from execution_engine import execution_engine, Order, BUY, SELL
+
+LIMIT = 'LIMIT'
+STOP = 'STOP'
+STOP_LIMIT = 'STOP_LIMIT'
+ORDER_TYPES = (LIMIT, STOP, STOP_LIMIT)
+
+# 订单簿中的挂单；triggered 表示止损限价单已触发、转为限价单
+BookEntry = namedtuple('BookEntry', [
+    'id', 'user_id', 'stock_id', 'side', 'order_type', 'quantity',
+    'limit_price', 'stop_price', 'expires_at', 'triggered'
+])
+
+# 每只股票的四个阈值：买入限价最高价、卖出限价最低价、买入止损最低触发价、卖出止损最高触发价
+_BUY_LIMIT, _SELL_LIMIT, _BUY_STOP, _SELL_STOP = range(4)
+_EMPTY_BOUNDS = (-np.inf, np.inf, np.inf, -np.inf)
+
+
+class _SymbolBook:
+    """单只股票的挂单，四个堆的堆顶都是最先可能被价格穿越的挂单"""
+
+    __slots__ = ('buy_limits', 'sell_limits', 'buy_stops', 'sell_stops')
+
+    def __init__(self):
+        self.buy_limits = []   # (-limit_price, seq, order_id)
+        self.sell_limits = []  # (limit_price, seq, order_id)
+        self.buy_stops = []    # (stop_price, seq, order_id)
+        self.sell_stops = []   # (-stop_price, seq, order_id)
+
+    def __len__(self):
+        return len(self.buy_limits) + len(self.sell_limits) + len(self.buy_stops) + len(self.sell_stops)
+
+
+class OrderBook:
+    """按股票组织的内存订单簿
+
+    每只股票的限价单和止损单分别放在按价格排序的堆中，另用 NumPy 数组
+    保存每只股票四个堆顶的价格。每次 tick 先用一次向量化比较找出价格
+    穿越了阈值的股票，只对这些股票弹出被穿越的挂单，不再遍历全部挂单。
+    撤单和过期采用延迟删除：只从 orders 中移除，堆中的残留在弹出时跳过。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self.orders = {}  # order_id -> BookEntry
+        self._books = {}  # stock_id -> _SymbolBook
+        self._expiries = []  # (expires_at, order_id)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._bounds = np.empty((4, 0))
+
+    def __len__(self):
+        return len(self.orders)
+
+    def clear(self):
+        with self._lock:
+            self.orders.clear()
+            self._books.clear()
+            self._expiries = []
+            self._ids = np.empty(0, dtype=np.int64)
+            self._bounds = np.empty((4, 0))
+
+    def _slot(self, stock_id):
+        slot = int(np.searchsorted(self._ids, stock_id))
+        if slot < len(self._ids) and self._ids[slot] == stock_id:
+            return slot
+        self._ids = np.insert(self._ids, slot, stock_id)
+        self._bounds = np.insert(self._bounds, slot, _EMPTY_BOUNDS, axis=1)
+        return slot
+
+    def _top(self, heap):
+        """清除堆顶已撤销的挂单，返回堆顶键值"""
+        while heap and heap[0][2] not in self.orders:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def _refresh(self, stock_id):
+        book = self._books[stock_id]
+        slot = self._slot(stock_id)
+        top = self._top(book.buy_limits)
+        self._bounds[_BUY_LIMIT, slot] = -top if top is not None else -np.inf
+        top = self._top(book.sell_limits)
+        self._bounds[_SELL_LIMIT, slot] = top if top is not None else np.inf
+        top = self._top(book.buy_stops)
+        self._bounds[_BUY_STOP, slot] = top if top is not None else np.inf
+        top = self._top(book.sell_stops)
+        self._bounds[_SELL_STOP, slot] = -top if top is not None else -np.inf
+
+    def _push(self, entry):
+        book = self._books.setdefault(entry.stock_id, _SymbolBook())
+        seq = next(self._seq)
+        if entry.order_type == LIMIT or entry.triggered:
+            if entry.side == BUY:
+                heapq.heappush(book.buy_limits, (-entry.limit_price, seq, entry.id))
+            else:
+                heapq.heappush(book.sell_limits, (entry.limit_price, seq, entry.id))
+        elif entry.side == BUY:
+            heapq.heappush(book.buy_stops, (entry.stop_price, seq, entry.id))
+        else:
+            heapq.heappush(book.sell_stops, (-entry.stop_price, seq, entry.id))
+
+    def add(self, entry):
+        with self._lock:
+            self.orders[entry.id] = entry
+            self._push(entry)
+            if entry.expires_at is not None:
+                heapq.heappush(self._expiries, (entry.expires_at, entry.id))
+            self._refresh(entry.stock_id)
+
+    def add_many(self, entries):
+        """批量载入挂单，每只股票的阈值只刷新一次"""
+        with self._lock:
+            touched = set()
+            for entry in entries:
+                self.orders[entry.id] = entry
+                self._push(entry)
+                if entry.expires_at is not None:
+                    self._expiries.append((entry.expires_at, entry.id))
+                touched.add(entry.stock_id)
+            heapq.heapify(self._expiries)
+            new_ids = np.setdiff1d(np.fromiter(touched, dtype=np.int64, count=len(touched)), self._ids)
+            if len(new_ids):
+                ids = np.union1d(self._ids, new_ids)
+                bounds = np.repeat(np.asarray(_EMPTY_BOUNDS)[:, None], len(ids), axis=1)
+                bounds[:, np.searchsorted(ids, self._ids)] = self._bounds
+                self._ids, self._bounds = ids, bounds
+            for stock_id in touched:
+                self._refresh(stock_id)
+
+    def remove(self, order_id):
+        """撤销挂单，返回被移除的挂单；已成交或不存在时返回 None"""
+        with self._lock:
+            return self.orders.pop(order_id, None)
+
+    def expire(self, now):
+        """移除到期的挂单，返回被移除的挂单列表"""
+        expired = []
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                _, order_id = heapq.heappop(self._expiries)
+                entry = self.orders.pop(order_id, None)
+                if entry is not None:
+                    expired.append(entry)
+        return expired
+
+    def _match_symbol(self, stock_id, price):
+        """弹出被 price 穿越的挂单，返回 (待成交列表 [(entry, 成交价)], 新触发的止损限价单)"""
+        book = self._books[stock_id]
+        fills = []
+        triggered = []
+
+        # 止损单先触发：止损单按市价成交，止损限价单转入限价队列
+        for heap, crossed in ((book.buy_stops, lambda key: key <= price),
+                              (book.sell_stops, lambda key: -key >= price)):
+            while True:
+                key = self._top(heap)
+                if key is None or not crossed(key):
+                    break
+                entry = self.orders[heapq.heappop(heap)[2]]
+                if entry.order_type == STOP:
+                    del self.orders[entry.id]
+                    fills.append((entry, price))
+                else:
+                    entry = entry._replace(triggered=True)
+                    self.orders[entry.id] = entry
+                    self._push(entry)
+                    triggered.append(entry)
+
+        for heap, crossed in ((book.buy_limits, lambda key: -key >= price),
+                              (book.sell_limits, lambda key: key <= price)):
+            while True:
+                key = self._top(heap)
+                if key is None or not crossed(key):
+                    break
+                entry = self.orders.pop(heapq.heappop(heap)[2])
+                fills.append((entry, price))
+
+        self._refresh(stock_id)
+        return fills, triggered
+
+    def match(self, ids, prices):
+        """用一次 tick 的价格向量撮合，ids 需按升序排列
+
+        返回 (待成交列表 [(entry, 成交价)], 新触发的止损限价单列表)。
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        fills = []
+        triggered = []
+        with self._lock:
+            if len(self._ids) == 0 or len(ids) == 0:
+                return fills, triggered
+            rows = np.minimum(np.searchsorted(ids, self._ids), len(ids) - 1)
+            book_prices = np.where(ids[rows] == self._ids, prices[rows], np.nan)
+            bounds = self._bounds
+            with np.errstate(invalid='ignore'):
+                crossed = ((book_prices <= bounds[_BUY_LIMIT]) | (book_prices >= bounds[_SELL_LIMIT]) |
+                           (book_prices >= bounds[_BUY_STOP]) | (book_prices <= bounds[_SELL_STOP]))
+            for slot in np.flatnonzero(crossed).tolist():
+                symbol_fills, symbol_triggered = self._match_symbol(int(self._ids[slot]), float(book_prices[slot]))
+                fills.extend(symbol_fills)
+                triggered.extend(symbol_triggered)
+        return fills, triggered
+
+    def match_symbol(self, stock_id, price):
+        """单只股票价格变化时撮合（例如新挂单立即检查是否可成交）"""
+        with self._lock:
+            if stock_id not in self._books:
+                return [], []
+            return self._match_symbol(stock_id, price)
+
+
+def _entry(order):
+    return BookEntry(order.id, order.user_id, order.stock_id, order.side, order.order_type,
+                     order.quantity, order.limit_price, order.stop_price, order.expires_at,
+                     order.status == 'TRIGGERED')
+
+
+class RestingOrderService:
+    """挂单的持久化和撮合
+
+    挂单保存在 resting_order 表，启动时载入内存订单簿；撮合出的成交
+    交给委托执行引擎，挂单的成交状态与成交记录在同一事务中写入。
+
+    多进程部署时只有运行行情的进程持有订单簿（owner 为 True）。其他进程
+    的 place 只写入数据库，由持有订单簿的进程每次 tick 前通过 sync_from_db
+    载入；cancel 直接按状态条件更新数据库，持有订单簿的进程同步时移除。
+    执行引擎同样按状态条件把挂单改为成交，撤单和成交只有一个会生效。
+    """
+
+    def __init__(self, book, engine):
+        self.book = book
+        self.engine = engine
+        self.loaded = False
+        self.owner = True
+        self._inflight = set()  # 已提交给执行引擎、尚未写入成交状态的挂单 id
+        self._touched = None  # sync_from_db 查询期间新增、撮合或完成的挂单 id
+        self._lock = threading.Lock()  # 保护撮合出队到登记 _inflight 之间的状态
+
+    def set_owner(self, owner):
+        """切换本进程是否持有订单簿，不再持有时清空订单簿"""
+        if self.owner and not owner:
+            self.book.clear()
+            self.loaded = False
+        self.owner = owner
+
+    def load_from_db(self):
+        """从数据库重建订单簿"""
+        self.book.clear()
+        self.book.add_many(
+            _entry(order) for order in
+            RestingOrder.query.filter(RestingOrder.status.in_(['OPEN', 'TRIGGERED'])).all()
+        )
+        self.loaded = True
+        return len(self.book)
+
+    def sync_from_db(self):
+        """载入其他进程新增的挂单，移除在其他进程撤销的挂单，返回 (新增, 移除) 数量"""
+        if not self.loaded:
+            return self.load_from_db(), 0
+        with self._lock:
+            self._touched = set()
+        active = {order_id for order_id, in db.session.query(RestingOrder.id).filter(
+            RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+        )}
+        # 查询期间本进程新增、撮合或完成的挂单，查询结果可能已经过时，留到下次同步
+        with self._lock:
+            skipped = self._touched | self._inflight
+            self._touched = None
+            removed = [order_id for order_id in list(self.book.orders)
+                       if order_id not in active and order_id not in skipped]
+            for order_id in removed:
+                self.book.remove(order_id)
+            missing = active - set(self.book.orders) - skipped
+        if missing:
+            self.book.add_many(_entry(order) for order in RestingOrder.query.filter(
+                RestingOrder.id.in_(missing),
+                RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+            ).all())
+        return len(missing), len(removed)
+
+    def _touch(self, order_ids):
+        """记录 sync_from_db 查询期间状态变化的挂单，调用方需持有 _lock"""
+        if self._touched is not None:
+            self._touched.update(order_ids)
+
+    def place(self, user_id, stock_id, side, order_type, quantity, limit_price=None, stop_price=None,
+              expires_at=None, current_price=None):
+        """新增挂单；当前价格已满足条件时立即提交成交，返回 RestingOrder"""
+        if order_type not in ORDER_TYPES:
+            raise ValueError(f'未知的挂单类型: {order_type}')
+        if side not in (BUY, SELL):
+            raise ValueError(f'未知的委托方向: {side}')
+        if quantity <= 0:
+            raise ValueError('委托数量必须大于 0')
+        if order_type in (LIMIT, STOP_LIMIT) and not (limit_price and limit_price > 0):
+            raise ValueError('限价必须大于 0')
+        if order_type in (STOP, STOP_LIMIT) and not (stop_price and stop_price > 0):
+            raise ValueError('触发价必须大于 0')
+        if expires_at is not None and expires_at <= datetime.now():
+            raise ValueError('有效期必须晚于当前时间')
+
+        order = RestingOrder(
+            user_id=user_id,
+            stock_id=stock_id,
+            side=side,
+            order_type=order_type,
+            quantity=quantity,
+            limit_price=limit_price if order_type != STOP else None,
+            stop_price=stop_price if order_type != LIMIT else None,
+            expires_at=expires_at,
+            status='OPEN'
+        )
+        db.session.add(order)
+        db.session.commit()
+
+        if not self.owner:
+            return order
+        if not self.loaded:
+            self.load_from_db()
+        else:
+            with self._lock:
+                if order.id not in self.book.orders:
+                    self.book.add(_entry(order))
+                self._touch([order.id])
+        if current_price:
+            with self._lock:
+                fills, triggered = self.book.match_symbol(stock_id, current_price)
+                self._start(fills)
+            self._dispatch(fills, triggered)
+        return order
+
+    def cancel(self, order_id, user_id):
+        """撤销挂单，已进入成交流程或不属于该用户时返回 False"""
+        if self.owner:
+            with self._lock:
+                entry = self.book.orders.get(order_id)
+                if order_id in self._inflight or (entry is not None and entry.user_id != user_id):
+                    return False
+                if entry is not None and self.book.remove(order_id) is None:
+                    return False
+        # 撮合出的挂单由执行引擎按同样的状态条件写入成交，两者只有一个会成功
+        cancelled = RestingOrder.query.filter(
+            RestingOrder.id == order_id,
+            RestingOrder.user_id == user_id,
+            RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+        ).update({'status': 'CANCELLED'}, synchronize_session=False)
+        db.session.commit()
+        return cancelled > 0
+
+    def on_tick(self, ids, prices, now=None):
+        """行情引擎每次 tick 后调用：处理过期挂单并撮合，返回提交的成交数量"""
+        now = now or datetime.now()
+        with self._lock:
+            expired = self.book.expire(now)
+            fills, triggered = self.book.match(ids, prices)
+            self._start(fills)
+        if expired:
+            RestingOrder.query.filter(
+                RestingOrder.id.in_([entry.id for entry in expired]),
+                RestingOrder.status.in_(['OPEN', 'TRIGGERED'])
+            ).update({'status': 'EXPIRED'}, synchronize_session=False)
+            db.session.commit()
+        return self._dispatch(fills, triggered)
+
+    def _start(self, fills):
+        """撮合出的挂单登记为进行中，调用方需在撮合时持有 _lock"""
+        order_ids = [entry.id for entry, _ in fills]
+        self._inflight.update(order_ids)
+        self._touch(order_ids)
+
+    def _finish(self, order_id):
+        with self._lock:
+            self._inflight.discard(order_id)
+            self._touch([order_id])
+
+    def _dispatch(self, fills, triggered):
+        if triggered:
+            RestingOrder.query.filter(
+                RestingOrder.id.in_([entry.id for entry in triggered]),
+                RestingOrder.status == 'OPEN'
+            ).update({'status': 'TRIGGERED'}, synchronize_session=False)
+            db.session.commit()
+        for entry, price in fills:
+            # 不等待结果，执行线程会在同一事务中按状态条件更新挂单
+            future = self.engine.submit(Order(entry.user_id, entry.stock_id, entry.side, entry.quantity,
+                                              price, resting_order_id=entry.id))
+            future.add_done_callback(lambda _, order_id=entry.id: self._finish(order_id))
+        return len(fills)
+
+
+order_book = OrderBook()
+resting_orders = RestingOrderService(order_book, execution_engine)
+
+
+def benchmark(orders=100000, symbols=5000, ticks=20, seed=0):
+    """10 万挂单分布在全市场时，每次 tick 撮合的耗时（毫秒）"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, symbols + 1, dtype=np.int64)
+    prices = np.round(rng.uniform(5, 100, symbols), 2)
+    book = OrderBook()
+
+    stock_ids = rng.integers(1, symbols + 1, orders)
+    sides = rng.integers(0, 2, orders)
+    kinds = rng.integers(0, 3, orders)
+    offsets = rng.uniform(0.02, 0.3, orders)
+    entries = []
+    for order_id in range(orders):
+        stock_id = int(stock_ids[order_id])
+        base = float(prices[stock_id - 1])
+        side = BUY if sides[order_id] else SELL
+        order_type = ORDER_TYPES[kinds[order_id]]
+        # 限价单挂在不利方向，止损单挂在有利方向，初始都不会成交
+        direction = -1 if (side == BUY) == (order_type == LIMIT) else 1
+        trigger = round(base * (1 + direction * offsets[order_id]), 2)
+        entries.append(BookEntry(order_id, 1, stock_id, side, order_type, 100,
+                                 trigger if order_type != STOP else None,
+                                 trigger if order_type != LIMIT else None, None, False))
+    start = time.perf_counter()
+    book.add_many(entries)
+    print(f"订单簿基准: 载入 {orders} 笔挂单 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    matched = 0
+    elapsed = []
+    for _ in range(ticks):
+        prices = np.round(prices * (1 + rng.uniform(-0.02, 0.02, symbols)), 2)
+        start = time.perf_counter()
+        fills, _ = book.match(ids, prices)
+        elapsed.append((time.perf_counter() - start) * 1000)
+        matched += len(fills)
+    print(f"订单簿基准: {symbols} 只股票 {ticks} 次 tick, 平均每次 {np.mean(elapsed):.2f} ms, "
+          f"最长 {np.max(elapsed):.2f} ms, 共成交 {matched} 笔, 剩余 {len(book)} 笔")
+    return float(np.mean(elapsed))
+
+
+if __name__ == '__main__':
+    benchmark()
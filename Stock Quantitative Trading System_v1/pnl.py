@@ -0,0 +1,181 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from database import db, Trade, DailyPnl, reads_replica
+from bar_store import bar_store, DAILY
+
+# 收益曲线支持的时间范围（天数），None 表示从第一笔成交开始
+RANGES = {'1M': 30, '1Y': 365, 'all': None}
+
+
+def rebuild_daily_pnl():
+    """按交易记录重建每日盈亏汇总表，返回写入的行数
+
+    成交时由执行引擎增量维护汇总表，这里只用于首次建表或数据修复。
+    已实现盈亏按 (用户, 股票) 的移动平均成本逐笔回放计算。
+    """
+    costs = {}  # (user_id, stock_id) -> [持仓数量, 平均成本]
+    rows = {}
+    trades = db.session.query(
+        Trade.user_id, Trade.stock_id, Trade.type, Trade.quantity,
+        Trade.price, Trade.commission, Trade.total_amount, Trade.created_at
+    ).order_by(Trade.created_at, Trade.id)
+    for user_id, stock_id, side, quantity, price, commission, amount, created_at in trades.yield_per(1000):
+        holding = costs.setdefault((user_id, stock_id), [0, 0.0])
+        if side == 'BUY':
+            total_cost = holding[0] * holding[1] + amount
+            holding[0] += quantity
+            holding[1] = total_cost / holding[0] if holding[0] else 0.0
+            profit = 0.0
+        else:
+            profit = amount - quantity * holding[1] - commission
+            holding[0] = max(holding[0] - quantity, 0)
+
+        key = (user_id, stock_id, created_at.date())
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = DailyPnl(*key)
+        row.add_trade(side, quantity, amount, commission, profit)
+
+    try:
+        DailyPnl.query.delete()
+        db.session.add_all(rows.values())
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"重建每日盈亏失败: {str(e)}")
+        raise
+    return len(rows)
+
+
+def ensure_daily_pnl():
+    """汇总表为空而已有交易记录时（例如升级后首次启动）重建汇总表"""
+    if DailyPnl.query.first() is None and Trade.query.first() is not None:
+        count = rebuild_daily_pnl()
+        print(f"已根据交易记录重建每日盈亏: {count} 行")
+
+
+class PositionPnlEngine:
+    """持仓收益曲线
+
+    从每日盈亏汇总表读取该股票每天的成交，按日向量化累加：
+        总收益 = 累计资金净流入 + 持仓数量 × 当日收盘价
+        已实现收益 = 累计已实现盈亏，浮动收益 = 总收益 - 已实现收益
+    收盘价取K线存储中的日线，缺失的日期沿用前一个收盘价。
+    截至昨天的曲线按 (用户, 股票, 范围) 缓存到该股票下一次成交或
+    跨日为止，今天这一点每次请求用最新价格计算。从只读副本读取的
+    曲线可能缺少刚复制过来的成交，只用于本次请求，不进入缓存。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._cache = {}  # (user_id, stock_id, range_key) -> (日期, 曲线)
+        self._versions = {}  # (user_id, stock_id) -> 成交次数，避免计算期间发生的成交被旧结果覆盖
+        self._generation = 0  # reset 次数，与成交次数一起判断计算期间缓存是否失效
+        self._lock = threading.Lock()
+
+    def on_fills(self, fills):
+        """执行引擎的成交回调：清除成交股票的缓存"""
+        keys = {(fill.order.user_id, fill.order.stock_id) for fill in fills}
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            for key in [key for key in self._cache if key[:2] in keys]:
+                del self._cache[key]
+
+    def reset(self):
+        """清空全部缓存（例如其他进程写入了成交）"""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def history(self, position, range_key='1M', price=None):
+        """返回持仓在指定范围内每天的总收益、已实现收益和浮动收益"""
+        if range_key not in RANGES:
+            raise ValueError(f'不支持的时间范围: {range_key}')
+        today = datetime.now().date()
+        key = (position.user_id, position.stock_id, range_key)
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != today:
+            version = (self._generation, self._versions.get(key[:2], 0))
+            cached = (today, self._compute(position, RANGES[range_key], today))
+            if not reads_replica():
+                with self._lock:
+                    if (self._generation, self._versions.get(key[:2], 0)) == version:
+                        self._cache[key] = cached
+        curve = cached[1]
+
+        # 今天用最新价格计算，不进入缓存
+        if price is None:
+            price = curve['last_close'] if curve['last_close'] is not None else position.average_price
+        total = curve['cash'] + curve['quantity'] * price
+        return {
+            'dates': curve['dates'] + [today.strftime('%Y-%m-%d')],
+            'profits': curve['profits'] + [round(total, 2)],
+            'realized': curve['realized'] + [round(curve['realized_total'], 2)],
+            'unrealized': curve['unrealized'] + [round(total - curve['realized_total'], 2)]
+        }
+
+    def _compute(self, position, days, today):
+        rows = db.session.query(
+            DailyPnl.trade_date, DailyPnl.buy_quantity, DailyPnl.sell_quantity, DailyPnl.buy_amount,
+            DailyPnl.sell_amount, DailyPnl.commission, DailyPnl.realized_profit
+        ).filter(
+            DailyPnl.user_id == position.user_id,
+            DailyPnl.stock_id == position.stock_id,
+            DailyPnl.trade_date <= today
+        ).order_by(DailyPnl.trade_date).all()
+        daily = pd.DataFrame(rows, columns=['trade_date', 'buy_quantity', 'sell_quantity', 'buy_amount',
+                                            'sell_amount', 'commission', 'realized_profit'])
+        daily.index = pd.to_datetime(daily.pop('trade_date'))
+        # 没有成交时 DataFrame 的列是 object 类型，统一转换为浮点数
+        daily = daily.astype(float)
+        net_quantity = daily['buy_quantity'] - daily['sell_quantity']
+        cash_flow = daily['sell_amount'] - daily['buy_amount'] - daily['commission']
+
+        # 持仓中没有对应成交记录的部分（例如导入的初始持仓）按成本价视为期初持仓
+        opening = position.quantity - int(net_quantity.sum())
+        end = pd.Timestamp(today)
+        first = daily.index[0] if len(daily) else end
+        start = first if days is None else end - pd.Timedelta(days=days)
+        calendar = pd.date_range(min(first, start), end, freq='D')
+
+        frame = pd.DataFrame({
+            'quantity': net_quantity,
+            'cash': cash_flow,
+            'realized': daily['realized_profit']
+        }).reindex(calendar, fill_value=0.0).cumsum()
+        frame['quantity'] += opening
+        frame['cash'] -= opening * position.average_price
+        realized_total = float(frame['realized'].iloc[-1])
+        cash_total = float(frame['cash'].iloc[-1])
+        quantity_total = int(frame['quantity'].iloc[-1])
+
+        # 截至昨天的收盘价，往前多取一段以便范围起点之前的收盘价可以沿用
+        history = frame.loc[start:end - pd.Timedelta(days=1)]
+        bars = self.store.read_range(position.stock_id, DAILY, (start - pd.Timedelta(days=30)).to_pydatetime(),
+                                     end.to_pydatetime() - timedelta(microseconds=1))
+        closes = pd.Series(bars['close'], index=pd.DatetimeIndex(bars['time']).normalize())
+        closes = closes[~closes.index.duplicated(keep='last')]
+        closes = closes.reindex(closes.index.union(history.index)).ffill().reindex(history.index)
+        # 最早一根日线之前没有价格，按成本价计算，不产生浮动收益
+        closes = closes.fillna(position.average_price).to_numpy()
+
+        profits = history['cash'].to_numpy() + history['quantity'].to_numpy() * closes
+        realized = history['realized'].to_numpy()
+        return {
+            'dates': history.index.strftime('%Y-%m-%d').tolist(),
+            'profits': np.round(profits, 2).tolist(),
+            'realized': np.round(realized, 2).tolist(),
+            'unrealized': np.round(profits - realized, 2).tolist(),
+            'cash': cash_total,
+            'quantity': quantity_total,
+            'realized_total': realized_total,
+            'last_close': float(closes[-1]) if len(closes) else None
+        }
+
+
+position_pnl = PositionPnlEngine(bar_store)
@@ -0,0 +1,174 @@
+import threading
+
+from database import Position
+from execution_engine import BUY, SELL
+from quote_cache import quote_cache
+
+
+class _Holding:
+    __slots__ = ('id', 'stock_id', 'code', 'name', 'quantity', 'average_price', 'price')
+
+    def __init__(self, position_id, stock_id, code, name, quantity, average_price, price):
+        self.id = position_id
+        self.stock_id = stock_id
+        self.code = code
+        self.name = name
+        self.quantity = quantity
+        self.average_price = average_price
+        self.price = price
+
+
+class _Account:
+    """单个用户的持仓和汇总值，market_value 和 cost 随成交和行情增量更新"""
+    __slots__ = ('holdings', 'market_value', 'cost')
+
+    def __init__(self):
+        self.holdings = {}  # stock_id -> _Holding
+        self.market_value = 0.0
+        self.cost = 0.0
+
+
+class PortfolioService:
+    """持仓估值服务
+
+    按用户在内存中保存持仓和总市值、总成本，另维护 股票代码 -> 持有用户
+    的索引。行情变化时只调整持有这些股票的用户，成交时只调整成交的持仓，
+    读取汇总值不再遍历持仓。用户第一次访问时从数据库加载一次。
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._accounts = {}  # user_id -> _Account
+        self._holders = {}  # code -> {user_id: _Holding}
+        self._versions = {}  # user_id -> 成交次数，加载期间发生成交时放弃加载结果
+
+    def _add_holding(self, user_id, account, holding):
+        account.holdings[holding.stock_id] = holding
+        account.market_value += holding.quantity * holding.price
+        account.cost += holding.quantity * holding.average_price
+        self._holders.setdefault(holding.code, {})[user_id] = holding
+
+    def _remove_holding(self, user_id, account, holding):
+        del account.holdings[holding.stock_id]
+        account.market_value -= holding.quantity * holding.price
+        account.cost -= holding.quantity * holding.average_price
+        self._unindex(user_id, holding)
+
+    def _unindex(self, user_id, holding):
+        holders = self._holders.get(holding.code)
+        if holders is not None:
+            holders.pop(user_id, None)
+            if not holders:
+                del self._holders[holding.code]
+
+    def _drop(self, user_id):
+        account = self._accounts.pop(user_id, None)
+        if account is None:
+            return
+        for holding in account.holdings.values():
+            self._unindex(user_id, holding)
+
+    def _load(self, user_id):
+        if not self.cache.loaded:
+            self.cache.load_from_db()
+        version = self._versions.get(user_id, 0)
+        positions = Position.query.filter_by(user_id=user_id).order_by(Position.id).all()
+        account = _Account()
+        with self._lock:
+            if self._versions.get(user_id, 0) != version:
+                return None
+            self._drop(user_id)
+            for position in positions:
+                quote = self.cache.get_by_id(position.stock_id)
+                if quote is None:
+                    continue
+                self._add_holding(user_id, account, _Holding(
+                    position.id, position.stock_id, quote.code, quote.name,
+                    position.quantity, position.average_price, quote.last_price
+                ))
+            self._accounts[user_id] = account
+        return account
+
+    def _account(self, user_id):
+        account = self._accounts.get(user_id)
+        while account is None:
+            account = self._load(user_id)
+        return account
+
+    def summary(self, user_id):
+        """返回 (总持仓市值, 总盈亏)"""
+        account = self._account(user_id)
+        with self._lock:
+            return account.market_value, account.market_value - account.cost
+
+    def positions(self, user_id):
+        """返回 (持仓明细, 总持仓市值, 总盈亏)，明细格式与持仓页面一致"""
+        account = self._account(user_id)
+        with self._lock:
+            details = []
+            for holding in account.holdings.values():
+                market_value = holding.quantity * holding.price
+                profit = holding.quantity * (holding.price - holding.average_price)
+                details.append({
+                    'id': holding.id,
+                    'stock_id': holding.stock_id,
+                    'code': holding.code,
+                    'name': holding.name,
+                    'quantity': holding.quantity,
+                    'average_price': holding.average_price,
+                    'current_price': holding.price,
+                    'market_value': market_value,
+                    'profit': profit,
+                    'profit_color': 'text-danger' if profit > 0 else 'text-success'
+                })
+            return details, account.market_value, account.market_value - account.cost
+
+    def held_codes(self, user_id):
+        """用户当前持有的股票代码，持仓未加载时从数据库加载"""
+        account = self._account(user_id)
+        with self._lock:
+            return [holding.code for holding in account.holdings.values()]
+
+    def on_quotes(self, version, codes, last_prices, prev_prices, changes):
+        """行情缓存回调：只重新估值持有变化股票的用户"""
+        with self._lock:
+            for code, price in zip(codes, last_prices.tolist()):
+                for user_id, holding in self._holders.get(code, {}).items():
+                    self._accounts[user_id].market_value += holding.quantity * (price - holding.price)
+                    holding.price = price
+
+    def on_fills(self, fills):
+        """执行引擎的成交回调：按成交调整手动持仓，计算方式与执行引擎一致"""
+        with self._lock:
+            for fill in fills:
+                order = fill.order
+                if order.strategy_id is not None:
+                    continue
+                self._versions[order.user_id] = self._versions.get(order.user_id, 0) + 1
+                account = self._accounts.get(order.user_id)
+                if account is None:
+                    continue
+                holding = account.holdings.get(order.stock_id)
+                if holding is None:
+                    # 新建的持仓需要数据库中的 id，下次读取时重新加载
+                    self._drop(order.user_id)
+                    continue
+                self._remove_holding(order.user_id, account, holding)
+                if order.side == BUY:
+                    total_cost = holding.average_price * holding.quantity + fill.total_amount
+                    holding.quantity += fill.quantity
+                    holding.average_price = total_cost / holding.quantity
+                elif order.side == SELL:
+                    holding.quantity -= fill.quantity
+                if holding.quantity > 0:
+                    self._add_holding(order.user_id, account, holding)
+
+    def reset(self):
+        """清空全部缓存（例如股票列表重新加载后）"""
+        with self._lock:
+            self._accounts.clear()
+            self._holders.clear()
+
+
+portfolio = PortfolioService(quote_cache)
@@ -0,0 +1,124 @@
+import time
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import bindparam, func, select
+
+from database import db, Stock, MarketState
+
+# market_state 表中保存最后一次 tick 所在交易日的名称
+TRADING_DAY_STATE = 'price_engine.trading_day'
+
+
+class PriceTickEngine:
+    """向量化的模拟行情引擎
+
+    每次 tick 一次性读取整个股票池的价格向量，用 NumPy 生成随机波动，
+    再通过单条 executemany 批量写回数据库。传入 cache 时价格向量从
+    行情缓存读取，写库后同步写回缓存；传入 bars 时每次 tick 同时聚合
+    成K线写入K线存储；传入 orders 时每次 tick 后用新价格撮合挂单。
+    传入 trading_day 时，与上一次 tick 所在的交易日不同即把前收盘价滚动为
+    上一次的最新价。上一次 tick 所在的交易日与价格在同一事务中写入
+    market_state 表，进程重启后从表中读取；行情刷新等其他写入股票更新
+    时间的操作不影响交易日切换。
+    """
+
+    def __init__(self, volatility=0.02, universe_size=None, seed=None, cache=None, bars=None, orders=None):
+        self.volatility = volatility
+        self.universe_size = universe_size
+        self.cache = cache
+        self.bars = bars
+        self.orders = orders
+        self.rng = np.random.default_rng(seed)
+        self.trading_day = None  # 上一次 tick 所在的交易日
+        self._saved_day = None  # market_state 表中保存的交易日
+
+        stock_table = Stock.__table__
+        self._update_stmt = stock_table.update().where(
+            stock_table.c.id == bindparam('_id')
+        ).values(
+            last_price=bindparam('_last_price'),
+            prev_price=bindparam('_prev_price'),
+            last_update=bindparam('_last_update')
+        )
+
+    def load_universe(self):
+        """读取股票池，返回 (ids, last_prices, prev_prices) 三个数组"""
+        stock_table = Stock.__table__
+        query = select(stock_table.c.id, stock_table.c.last_price, stock_table.c.prev_price) \
+            .order_by(stock_table.c.id)
+        if self.universe_size:
+            query = query.limit(self.universe_size)
+        rows = db.session.execute(query).fetchall()
+        if not rows:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty
+        ids, last_prices, prev_prices = zip(*rows)
+        return (np.asarray(ids, dtype=np.int64),
+                np.asarray(last_prices, dtype=np.float64),
+                np.asarray(prev_prices, dtype=np.float64))
+
+    def step(self, last_prices, prev_prices, new_trading_day=False):
+        """根据当前价格向量计算新的 (last_prices, prev_prices)，不涉及数据库"""
+        if new_trading_day:
+            # 新交易日，前收盘价更新为上一次的最新价
+            prev_prices = last_prices.copy()
+        changes = self.rng.uniform(-self.volatility, self.volatility, len(last_prices))
+        new_prices = np.round(last_prices * (1 + changes), 2)
+        # 没有前收盘价时使用当前价格
+        prev_prices = np.where(np.isnan(prev_prices) | (prev_prices <= 0), new_prices, prev_prices)
+        return new_prices, prev_prices
+
+    def is_new_trading_day(self, trading_day):
+        """trading_day 是否晚于上一次 tick 所在的交易日"""
+        if self.trading_day is None:
+            self.trading_day = self._saved_day = self.load_trading_day()
+            if self.trading_day is None:
+                # 升级前没有保存交易日，按股票的最后更新时间估计一次，之后以保存的为准
+                last_update = db.session.query(func.max(Stock.last_update)).scalar()
+                self.trading_day = last_update.date() if last_update else trading_day
+        return trading_day > self.trading_day
+
+    def load_trading_day(self):
+        """读取 market_state 表中保存的上一次 tick 所在交易日，没有时返回 None"""
+        state = MarketState.query.get(TRADING_DAY_STATE)
+        return date.fromisoformat(state.value) if state else None
+
+    def tick(self, new_trading_day=False, trading_day=None):
+        """执行一次价格更新，返回 (更新数量, 耗时秒数)"""
+        start = time.perf_counter()
+        if trading_day is not None:
+            new_trading_day = new_trading_day or self.is_new_trading_day(trading_day)
+        if self.cache is not None:
+            if not self.cache.loaded:
+                self.cache.load_from_db()
+            ids, last_prices, prev_prices = self.cache.price_vectors(self.universe_size)
+        else:
+            ids, last_prices, prev_prices = self.load_universe()
+
+        # 没有有效价格的股票不参与模拟
+        valid = np.isfinite(last_prices) & (last_prices > 0)
+        ids, last_prices, prev_prices = ids[valid], last_prices[valid], prev_prices[valid]
+        if len(ids) == 0:
+            return 0, time.perf_counter() - start
+
+        new_prices, prev_prices = self.step(last_prices, prev_prices, new_trading_day)
+        now = datetime.now()
+        params = [
+            {'_id': stock_id, '_last_price': price, '_prev_price': prev, '_last_update': now}
+            for stock_id, price, prev in zip(ids.tolist(), new_prices.tolist(), prev_prices.tolist())
+        ]
+        db.session.execute(self._update_stmt, params)
+        if self.bars is not None:
+            self.bars.on_tick(ids, new_prices, now)
+        if trading_day is not None and trading_day != self._saved_day:
+            # 交易日与滚动后的前收盘价一起提交
+            db.session.merge(MarketState(name=TRADING_DAY_STATE, value=trading_day.isoformat()))
+        db.session.commit()
+        if self.cache is not None:
+            self.cache.update(ids, new_prices, prev_prices)
+        if self.orders is not None:
+            self.orders.on_tick(ids, new_prices, now)
+        if trading_day is not None:
+            self.trading_day = self._saved_day = trading_day
+        return len(ids), time.perf_counter() - start
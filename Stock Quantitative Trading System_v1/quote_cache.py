@@ -0,0 +1,235 @@
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import select
+
+from database import db, Stock
+
+
+class Quote(namedtuple('Quote', ['id', 'code', 'name', 'industry', 'last_price', 'prev_price'])):
+    """单只股票的行情快照，字段与 Stock 模型保持一致，可直接用于模板"""
+    __slots__ = ()
+
+    @property
+    def change(self):
+        """涨跌幅（百分比）"""
+        if self.prev_price and self.prev_price > 0:
+            return (self.last_price - self.prev_price) / self.prev_price * 100
+        return 0.0
+
+
+# 一次完整的缓存状态；写入时整体替换，读取方无需加锁
+_CacheState = namedtuple('_CacheState', [
+    'version', 'updated_at', 'ids', 'codes', 'names', 'industries',
+    'last_prices', 'prev_prices', 'code_index'
+])
+
+
+def _changes(last_prices, prev_prices):
+    """向量化计算涨跌幅（百分比），前收盘价无效时为 0"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(prev_prices > 0, (last_prices - prev_prices) / prev_prices * 100, 0.0)
+
+
+def _differs(new_values, old_values):
+    """逐元素比较价格，两边都是 NaN 时视为相同"""
+    return (new_values != old_values) & ~(np.isnan(new_values) & np.isnan(old_values))
+
+
+def _empty_state():
+    return _CacheState(0, None, np.empty(0, dtype=np.int64), [], [], [],
+                       np.empty(0), np.empty(0), {})
+
+
+class QuoteCache:
+    """进程内行情缓存
+
+    价格以 NumPy 数组按股票 id 升序存放，另维护 code -> 行号的索引。
+    行情引擎每次 tick 后写入，请求处理函数直接读取，不再访问数据库。
+    每次写入 version 加一，调用方可据此判断数据是否变化或过期。
+    通过 add_listener 注册的回调会在每次写入后收到发生变化的行情。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = _empty_state()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """注册回调 listener(version, codes, last_prices, prev_prices, changes)"""
+        self._listeners.append(listener)
+
+    def _notify(self, state, rows):
+        if not self._listeners or len(rows) == 0:
+            return
+        codes = [state.codes[row] for row in rows]
+        last_prices = state.last_prices[rows]
+        prev_prices = state.prev_prices[rows]
+        changes = _changes(last_prices, prev_prices)
+        for listener in self._listeners:
+            try:
+                listener(state.version, codes, last_prices, prev_prices, changes)
+            except Exception as e:
+                print(f"行情推送回调出错: {str(e)}")
+
+    @property
+    def loaded(self):
+        return self._state.version > 0
+
+    @property
+    def version(self):
+        return self._state.version
+
+    @property
+    def updated_at(self):
+        return self._state.updated_at
+
+    def age(self):
+        """距离上次写入的秒数，未加载时返回 None"""
+        updated_at = self._state.updated_at
+        return None if updated_at is None else time.time() - updated_at
+
+    def is_stale(self, max_age):
+        age = self.age()
+        return age is None or age > max_age
+
+    def load_from_db(self):
+        """从数据库重建整个缓存（股票列表变化时调用）"""
+        stock_table = Stock.__table__
+        rows = db.session.execute(
+            select(stock_table.c.id, stock_table.c.code, stock_table.c.name, stock_table.c.industry,
+                   stock_table.c.last_price, stock_table.c.prev_price).order_by(stock_table.c.id)
+        ).fetchall()
+        self.load(rows)
+
+    def sync_from_db(self):
+        """行情由其他进程写入数据库时，把变化的价格同步到缓存
+
+        股票列表变化时整体重建缓存并返回 True；价格没有变化时不增加版本号。
+        """
+        stock_table = Stock.__table__
+        rows = db.session.execute(
+            select(stock_table.c.id, stock_table.c.last_price, stock_table.c.prev_price).order_by(stock_table.c.id)
+        ).fetchall()
+        state = self._state
+        ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+        if not self.loaded or not np.array_equal(ids, state.ids):
+            self.load_from_db()
+            return True
+        last_prices = np.asarray([row[1] if row[1] is not None else np.nan for row in rows], dtype=np.float64)
+        prev_prices = np.asarray([row[2] if row[2] is not None else np.nan for row in rows], dtype=np.float64)
+        if not (np.array_equal(last_prices, state.last_prices, equal_nan=True) and
+                np.array_equal(prev_prices, state.prev_prices, equal_nan=True)):
+            self.update(ids, last_prices, prev_prices)
+        return False
+
+    def load(self, rows):
+        """rows 为按 id 升序排列的 (id, code, name, industry, last_price, prev_price) 序列"""
+        rows = list(rows)
+        ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+        codes = [row[1] for row in rows]
+        last_prices = np.asarray([row[4] if row[4] is not None else np.nan for row in rows], dtype=np.float64)
+        prev_prices = np.asarray([row[5] if row[5] is not None else np.nan for row in rows], dtype=np.float64)
+        with self._lock:
+            self._state = _CacheState(
+                version=self._state.version + 1,
+                updated_at=time.time(),
+                ids=ids,
+                codes=codes,
+                names=[row[2] for row in rows],
+                industries=[row[3] for row in rows],
+                last_prices=last_prices,
+                prev_prices=prev_prices,
+                code_index={code: i for i, code in enumerate(codes)}
+            )
+
+    def update(self, ids, last_prices, prev_prices):
+        """按股票 id 批量写入新价格，返回新的版本号"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            state = self._state
+            if len(state.ids) == 0:
+                return state.version
+            rows = np.minimum(np.searchsorted(state.ids, ids), len(state.ids) - 1)
+            known = state.ids[rows] == ids
+            rows = rows[known]
+            new_last = state.last_prices.copy()
+            new_prev = state.prev_prices.copy()
+            new_last[rows] = np.asarray(last_prices, dtype=np.float64)[known]
+            new_prev[rows] = np.asarray(prev_prices, dtype=np.float64)[known]
+            changed = rows[_differs(new_last[rows], state.last_prices[rows]) |
+                           _differs(new_prev[rows], state.prev_prices[rows])]
+            self._state = state._replace(
+                version=state.version + 1,
+                updated_at=time.time(),
+                last_prices=new_last,
+                prev_prices=new_prev
+            )
+            state = self._state
+        self._notify(state, changed)
+        return state.version
+
+    def set_price(self, stock_id, last_price, prev_price=None):
+        """更新单只股票价格（例如交易前从外部行情刷新）"""
+        state = self._state
+        row = np.searchsorted(state.ids, stock_id)
+        if row >= len(state.ids) or state.ids[row] != stock_id:
+            return state.version
+        if prev_price is None:
+            prev_price = state.prev_prices[row]
+        return self.update([stock_id], [last_price], [prev_price])
+
+    def price_vectors(self, limit=None):
+        """返回 (ids, last_prices, prev_prices) 数组副本，供行情引擎使用"""
+        state = self._state
+        end = limit if limit else len(state.ids)
+        return state.ids[:end].copy(), state.last_prices[:end].copy(), state.prev_prices[:end].copy()
+
+    def _quote(self, state, row):
+        return Quote(int(state.ids[row]), state.codes[row], state.names[row], state.industries[row],
+                     float(state.last_prices[row]), float(state.prev_prices[row]))
+
+    def get(self, code):
+        """按股票代码读取行情，不存在时返回 None"""
+        state = self._state
+        row = state.code_index.get(code)
+        return None if row is None else self._quote(state, row)
+
+    def get_by_id(self, stock_id):
+        state = self._state
+        row = np.searchsorted(state.ids, stock_id)
+        if row >= len(state.ids) or state.ids[row] != stock_id:
+            return None
+        return self._quote(state, row)
+
+    def columns(self, codes=None, stock_ids=None):
+        """按列返回行情 (version, codes, last_prices, prev_prices, changes)
+
+        codes 和 stock_ids 都为 None 时返回全部股票，未知的代码或 id 会被忽略。
+        """
+        state = self._state
+        if codes is not None:
+            rows = np.asarray([state.code_index[code] for code in codes if code in state.code_index],
+                              dtype=np.int64)
+        elif stock_ids is not None and len(state.ids) > 0:
+            stock_ids = np.asarray(stock_ids, dtype=np.int64)
+            rows = np.minimum(np.searchsorted(state.ids, stock_ids), len(state.ids) - 1)
+            rows = rows[state.ids[rows] == stock_ids]
+        elif stock_ids is not None:
+            rows = np.empty(0, dtype=np.int64)
+        else:
+            rows = np.arange(len(state.ids))
+        last_prices = state.last_prices[rows]
+        prev_prices = state.prev_prices[rows]
+        return state.version, [state.codes[row] for row in rows], last_prices, prev_prices, \
+            _changes(last_prices, prev_prices)
+
+    def all(self):
+        """全部股票行情列表"""
+        state = self._state
+        return [self._quote(state, row) for row in range(len(state.ids))]
+
+
+quote_cache = QuoteCache()
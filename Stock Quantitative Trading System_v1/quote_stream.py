@@ -0,0 +1,114 @@
+import json
+import queue
+import threading
+
+
+def format_sse(data, event=None, event_id=None):
+    """按 Server-Sent Events 格式编码一条消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def float_column(values, ndigits):
+    """将数组转换为可序列化的列表，NaN 转为 None（JSON 中没有 NaN）"""
+    return [None if value != value else value for value in values.round(ndigits).tolist()]
+
+
+class Subscription:
+    """单个 SSE 连接的订阅
+
+    codes 为 None 表示订阅全部股票。user_id 不为空时订阅该用户的持仓，
+    每次推送前按当前持仓重新确定股票范围，连接后新买入的股票也会推送。
+    队列满时丢弃积压的增量并标记 resync，由连接方重新发送一次完整快照。
+    """
+
+    def __init__(self, codes=None, max_queue=20, user_id=None):
+        self.codes = None if codes is None else set(codes)
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.resync = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.resync = True
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+
+class QuoteBroadcaster:
+    """把每次 tick 中变化的行情分发给所有订阅连接"""
+
+    def __init__(self, max_queue=20, holdings=None):
+        self.max_queue = max_queue
+        self.holdings = holdings  # holdings(user_id) -> 当前持有的股票代码集合
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, codes=None, user_id=None):
+        subscription = Subscription(codes, self.max_queue, user_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, version, codes, last_prices, prev_prices, changes):
+        """行情缓存回调：按订阅过滤后只推送变化的行情"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+
+        prices = float_column(last_prices, 2)
+        prev = float_column(prev_prices, 2)
+        change_list = float_column(changes, 2)
+        full = None
+        index = None
+        for subscription in subscribers:
+            if subscription.codes is None:
+                if full is None:
+                    full = {'version': version, 'codes': codes, 'prices': prices,
+                            'prev_prices': prev, 'changes': change_list}
+                subscription.put(full)
+                continue
+
+            if subscription.user_id is not None and self.holdings is not None:
+                try:
+                    subscription.codes = set(self.holdings(subscription.user_id))
+                except Exception as e:
+                    # 无法读取持仓时沿用上一次的股票范围
+                    print(f"读取持仓股票失败: {str(e)}")
+            if index is None:
+                index = {code: i for i, code in enumerate(codes)}
+            rows = [index[code] for code in subscription.codes if code in index]
+            if not rows:
+                continue
+            subscription.put({
+                'version': version,
+                'codes': [codes[i] for i in rows],
+                'prices': [prices[i] for i in rows],
+                'prev_prices': [prev[i] for i in rows],
+                'changes': [change_list[i] for i in rows]
+            })
+
+
+quote_broadcaster = QuoteBroadcaster()
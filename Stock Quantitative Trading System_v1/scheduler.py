@@ -0,0 +1,246 @@
+import bisect
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database import db
+
+# 耗时和延迟直方图的桶上限（毫秒）
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """固定分桶的直方图，记录次数、总和和最大值，分位数按桶上限估算"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """累计占比首次达到 q 的桶上限，落在最后一个桶时返回最大值"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self):
+        labels = [f'le_{bound}' for bound in self.buckets] + ['inf']
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else None,
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count}
+        }
+
+
+class Clock:
+    """调度器使用的时钟，测试中可以换成手动推进的时钟"""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def wait(self, event, timeout):
+        """等待 timeout 秒或 event 被设置，返回 event 是否已设置"""
+        return event.wait(timeout)
+
+
+class Job:
+    """定时任务的配置和运行统计"""
+
+    def __init__(self, name, func, interval, jitter=0.0, max_backoff=None, condition=None, calendar=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff or interval * 16
+        self.condition = condition
+        self.calendar = calendar
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.skipped = 0  # condition 不满足而跳过的次数
+        self.missed = 0  # 上一次执行超时而错过的计划次数
+        self.overlaps = 0  # 上一次尚未结束而放弃的次数
+        self.suspended = 0  # 非交易时段暂停的次数
+        self.last_error = None
+        self.last_run_at = None
+        self.last_success_at = None
+        self.next_run_at = None
+        self.duration = Histogram()
+        self.lag = Histogram()
+        self._running = threading.Lock()
+        self._lock = threading.Lock()
+
+    def backoff_slots(self):
+        """连续失败后需要等待的计划周期数：1、2、4、8……不超过 max_backoff"""
+        if not self.consecutive_failures:
+            return 1
+        return max(1, min(2 ** self.consecutive_failures, int(self.max_backoff // self.interval)))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'runs': self.runs,
+                'failures': self.failures,
+                'consecutive_failures': self.consecutive_failures,
+                'skipped': self.skipped,
+                'missed': self.missed,
+                'overlaps': self.overlaps,
+                'suspended': self.suspended,
+                'running': self._running.locked(),
+                'last_error': self.last_error,
+                'last_run_at': self.last_run_at,
+                'last_success_at': self.last_success_at,
+                'next_run_at': self.next_run_at,
+                'duration_ms': self.duration.snapshot(),
+                'lag_ms': self.lag.snapshot()
+            }
+
+
+class Scheduler:
+    """后台定时任务调度器
+
+    每个任务在独立线程中按固定频率执行：第 n 次的计划时间是 起点 + n × interval，
+    再加不超过 jitter 秒的随机延迟，避免多个任务同时访问数据库；执行耗时不会
+    让之后的计划时间漂移。同一任务上一次尚未结束时不会开始下一次，执行超时
+    错过的计划时间直接跳过。任务抛出异常后按 1、2、4…… 个周期退避（不超过
+    max_backoff 秒），成功一次即恢复。condition 返回 False 时（例如非交易时段、
+    本进程不是领导者）跳过本次执行。传入 calendar 的任务在非交易时段不唤醒，
+    线程一直等待到下一次开盘再按固定频率执行。每次执行记录耗时和相对计划时间的延迟。
+    计时和等待都经过 clock，测试可以传入手动推进的时钟。
+    """
+
+    def __init__(self, app=None, clock=None):
+        self.app = app
+        self.clock = clock or Clock()
+        self.jobs = {}
+        self._threads = {}
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+
+    def add_job(self, name, func, interval, jitter=0.0, max_backoff=None, condition=None, calendar=None):
+        """注册任务，返回 Job；需在 start 之前调用，calendar 为交易日历时只在交易时段执行"""
+        if name in self.jobs:
+            raise ValueError(f'任务已存在: {name}')
+        job = Job(name, func, interval, jitter, max_backoff, condition, calendar)
+        self.jobs[name] = job
+        return job
+
+    def start(self):
+        """为每个尚未启动的任务启动线程"""
+        self._stop.clear()
+        for name, job in self.jobs.items():
+            thread = self._threads.get(name)
+            if thread is not None and thread.is_alive():
+                continue
+            thread = threading.Thread(target=self._run, args=(job,), name=f'job-{name}', daemon=True)
+            self._threads[name] = thread
+            thread.start()
+
+    def stop(self, timeout=None):
+        """通知所有任务线程退出，正在执行的任务会执行完"""
+        self._stop.set()
+        for thread in self._threads.values():
+            thread.join(timeout)
+        self._threads.clear()
+
+    def run_once(self, job, scheduled=None):
+        """执行一次任务，返回 True（成功）、False（失败）或 None（跳过）"""
+        if isinstance(job, str):
+            job = self.jobs[job]
+        if not job._running.acquire(blocking=False):
+            with job._lock:
+                job.overlaps += 1
+            return None
+        try:
+            with self.app.app_context():
+                try:
+                    if job.condition is not None and not job.condition():
+                        with job._lock:
+                            job.skipped += 1
+                        return None
+                    started = self.clock.monotonic()
+                    job.func()
+                except Exception as e:
+                    db.session.rollback()
+                    with job._lock:
+                        job.failures += 1
+                        job.consecutive_failures += 1
+                        job.last_error = f'{type(e).__name__}: {str(e)}'
+                        job.last_run_at = self.clock.now().isoformat(timespec='seconds')
+                    print(f"任务 {job.name} 执行失败（连续 {job.consecutive_failures} 次）: {str(e)}")
+                    return False
+                finally:
+                    db.session.remove()
+            finished = self.clock.monotonic()
+            with job._lock:
+                job.runs += 1
+                job.consecutive_failures = 0
+                job.last_error = None
+                job.last_run_at = job.last_success_at = self.clock.now().isoformat(timespec='seconds')
+                job.duration.observe((finished - started) * 1000)
+                if scheduled is not None:
+                    job.lag.observe(max(0.0, started - scheduled) * 1000)
+            return True
+        finally:
+            job._running.release()
+
+    def _run(self, job):
+        clock = self.clock
+        start = clock.monotonic()
+        slot = 0
+        while not self._stop.is_set():
+            scheduled = start + slot * job.interval + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+            wall = clock.now() + timedelta(seconds=scheduled - clock.monotonic())
+            if job.calendar is not None and not job.calendar.is_open(wall):
+                # 计划时间不在交易时段，等到下一次开盘后重新对齐固定频率时刻
+                resume = job.calendar.next_open(wall)
+                job.next_run_at = resume.isoformat(timespec='seconds')
+                with job._lock:
+                    job.suspended += 1
+                if clock.wait(self._stop, max(0.0, (resume - clock.now()).total_seconds())):
+                    break
+                start, slot = clock.monotonic(), 0
+                continue
+            job.next_run_at = wall.isoformat(timespec='seconds')
+            if clock.wait(self._stop, max(0.0, scheduled - clock.monotonic())):
+                break
+            self.run_once(job, scheduled)
+
+            # 下一个尚未到期的固定频率时刻；失败时至少等待退避的周期数
+            due = max(slot + 1, math.ceil((clock.monotonic() - start) / job.interval))
+            with job._lock:
+                job.missed += due - slot - 1
+            slot = max(due, slot + job.backoff_slots())
+
+    def snapshot(self):
+        """各任务的运行统计和耗时、延迟直方图（毫秒）"""
+        return {name: job.snapshot() for name, job in self.jobs.items()}
+
+
+scheduler = Scheduler()
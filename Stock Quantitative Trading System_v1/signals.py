@@ -0,0 +1,37 @@
+import numpy as np
+
+# A 股价格的最小变动单位为 0.01 元，均线按整数分求和，比较结果没有浮点误差
+PRICE_SCALE = 100
+
+
+def to_cents(prices):
+    """价格转换为整数分，NaN 按 0 处理（由调用方另行排除）"""
+    prices = np.nan_to_num(np.asarray(prices, dtype=np.float64))
+    return np.rint(prices * PRICE_SCALE).astype(np.int64)
+
+
+def ma_signals(short_sum, ma_short, long_sum, ma_long, price, base):
+    """均线动量策略的信号：1 买入，-1 卖出，0 持有
+
+    short_sum/long_sum 为短期、长期窗口内价格（分）的和，price/base 为最新价格和
+    momentum_days 天前的价格（分）。短期均线与长期均线的大小用交叉相乘的整数
+    比较，两条均线相等时一定持有；动量 (price - base) / base 的符号在 base > 0
+    时与 price - base 相同。参数可以是标量或等长数组，实盘、批量评估和回测
+    都通过这里得到信号，保证结果一致。
+    """
+    trend = np.sign(np.asarray(short_sum, dtype=np.int64) * ma_long - np.asarray(long_sum, dtype=np.int64) * ma_short)
+    momentum = np.sign(np.asarray(price, dtype=np.int64) - base)
+    # 回看价格缺失（base <= 0）时动量没有意义，持有
+    valid = np.asarray(base) > 0
+    return np.where(valid & (trend > 0) & (momentum > 0), 1,
+                    np.where(valid & (trend < 0) & (momentum < 0), -1, 0)).astype(np.int8)
+
+
+def latest_signal(prices, ma_short, ma_long, momentum_days):
+    """对整段价格序列的最后一个价格计算信号，价格不足时持有"""
+    if len(prices) < max(ma_short, ma_long, momentum_days):
+        return 0
+    cents = to_cents(prices)
+    signal = ma_signals(cents[-ma_short:].sum(), ma_short, cents[-ma_long:].sum(), ma_long,
+                        cents[-1], cents[-momentum_days])
+    return int(signal)
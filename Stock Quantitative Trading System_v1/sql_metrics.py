@@ -0,0 +1,103 @@
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class SqlMetrics:
+    """按路由统计 SQL 语句数和耗时
+
+    在 SQLAlchemy 的 Engine 上监听语句执行，只统计请求线程中执行的语句，
+    行情、委托执行等后台线程不计入。每个请求结束时把本次的语句数和耗时
+    累加到所属路由，响应头 X-SQL-Statements 带上本次请求的语句数，
+    语句数达到 log_statements 时打印一行日志。
+    """
+
+    def __init__(self, app=None, log_statements=20):
+        self.log_statements = log_statements
+        self._lock = threading.Lock()
+        self._routes = {}  # endpoint -> 累计统计
+        self._installed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.log_statements = app.config.get('SQL_LOG_STATEMENTS', self.log_statements)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        if not self._installed:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._installed = True
+
+    def _start(self):
+        g.sql_statements = 0
+        g.sql_time = 0.0
+        g.sql_request_start = time.perf_counter()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'sql_statements' in g:
+            conn.info.setdefault('sql_metrics_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._stop(conn)
+
+    def _handle_error(self, context):
+        # 出错的语句不会触发 after_cursor_execute，在这里弹出开始时间，
+        # 否则计时栈随连接留在连接池中越积越多
+        if context.connection is not None:
+            self._stop(context.connection)
+
+    def _stop(self, conn):
+        starts = conn.info.get('sql_metrics_start')
+        if not starts:
+            return
+        start = starts.pop()
+        if not has_request_context() or 'sql_statements' not in g:
+            return
+        g.sql_time += time.perf_counter() - start
+        g.sql_statements += 1
+
+    def _finish(self, response):
+        if 'sql_statements' not in g:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        statements, sql_time = g.sql_statements, g.sql_time
+        elapsed = time.perf_counter() - g.sql_request_start
+        with self._lock:
+            route = self._routes.setdefault(endpoint, {
+                'requests': 0, 'statements': 0, 'max_statements': 0, 'sql_time': 0.0, 'request_time': 0.0
+            })
+            route['requests'] += 1
+            route['statements'] += statements
+            route['max_statements'] = max(route['max_statements'], statements)
+            route['sql_time'] += sql_time
+            route['request_time'] += elapsed
+        response.headers['X-SQL-Statements'] = str(statements)
+        if statements >= self.log_statements:
+            print(f"SQL 统计: {endpoint} 执行 {statements} 条语句, SQL 耗时 {sql_time * 1000:.1f} ms, "
+                  f"请求耗时 {elapsed * 1000:.1f} ms")
+        return response
+
+    def snapshot(self):
+        """各路由的累计和平均值"""
+        with self._lock:
+            routes = {endpoint: dict(route) for endpoint, route in self._routes.items()}
+        for route in routes.values():
+            count = route['requests']
+            route['avg_statements'] = route['statements'] / count
+            route['avg_sql_ms'] = route['sql_time'] / count * 1000
+            route['avg_request_ms'] = route['request_time'] / count * 1000
+            route['sql_time'] = round(route['sql_time'], 6)
+            route['request_time'] = round(route['request_time'], 6)
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+sql_metrics = SqlMetrics()
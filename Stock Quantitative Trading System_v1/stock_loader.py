@@ -0,0 +1,109 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from database import db, Stock
+
+
+class PhaseTimer:
+    """记录各阶段耗时，用于输出冷启动耗时报告"""
+
+    def __init__(self):
+        self.phases = []
+        self._start = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._start))
+        self._start = now
+
+    def report(self):
+        total = sum(seconds for _, seconds in self.phases)
+        lines = [f"  {name:<12s} {seconds * 1000:10.1f} ms" for name, seconds in self.phases]
+        lines.append(f"  {'total':<12s} {total * 1000:10.1f} ms")
+        return "\n".join(lines)
+
+
+def merge_stock_frames(stocks, price_df):
+    """将 stock_basic 与 daily 行情按 ts_code 一次性合并"""
+    columns = ['ts_code', 'name', 'industry', 'market']
+    merged = stocks[columns].drop_duplicates('ts_code')
+    if price_df is not None and not price_df.empty:
+        prices = price_df[['ts_code', 'close', 'pre_close']].drop_duplicates('ts_code')
+        merged = merged.merge(prices, on='ts_code', how='left')
+    else:
+        merged = merged.assign(close=float('nan'), pre_close=float('nan'))
+    # 缺少前收盘价时使用当前价格
+    merged['pre_close'] = merged['pre_close'].fillna(merged['close'])
+    return merged
+
+
+def _clean(value):
+    return None if pd.isna(value) else value
+
+
+def bulk_load_stocks(stocks, price_df=None, chunk_size=1000, update_existing=True, timer=None):
+    """批量写入股票基础信息和最新价格
+
+    stocks 需包含 ts_code/name/industry/market 列；price_df 需包含
+    ts_code/close/pre_close 列。已存在的股票只更新有行情的价格字段。
+    返回 (新增数量, 更新数量)。
+    """
+    timer = timer or PhaseTimer()
+
+    merged = merge_stock_frames(stocks, price_df)
+    timer.mark('merge')
+
+    existing = dict(db.session.query(Stock.code, Stock.id).all())
+    timer.mark('load_codes')
+
+    now = datetime.now()
+    has_price = merged['close'].notna()
+    is_new = ~merged['ts_code'].isin(existing.keys())
+
+    inserts = []
+    for code, name, industry, market, close, pre_close in merged.loc[
+            is_new, ['ts_code', 'name', 'industry', 'market', 'close', 'pre_close']].itertuples(index=False):
+        priced = not pd.isna(close)
+        inserts.append({
+            'code': code,
+            'name': name,
+            'industry': _clean(industry),
+            'market': _clean(market),
+            'last_price': float(close) if priced else 0.0,
+            'prev_price': float(pre_close) if priced else 0.0,
+            'last_update': now if priced else None
+        })
+
+    updates = []
+    if update_existing:
+        for code, close, pre_close in merged.loc[
+                ~is_new & has_price, ['ts_code', 'close', 'pre_close']].itertuples(index=False):
+            updates.append({
+                'id': existing[code],
+                'last_price': float(close),
+                'prev_price': float(pre_close),
+                'last_update': now
+            })
+    timer.mark('prepare')
+
+    for start in range(0, len(inserts), chunk_size):
+        db.session.bulk_insert_mappings(Stock, inserts[start:start + chunk_size])
+    timer.mark('insert')
+
+    for start in range(0, len(updates), chunk_size):
+        db.session.bulk_update_mappings(Stock, updates[start:start + chunk_size])
+    timer.mark('update')
+
+    db.session.commit()
+    timer.mark('commit')
+
+    return len(inserts), len(updates)
+
+
+def default_stock_frame():
+    """将内置默认股票列表转换为与 Tushare 相同结构的 DataFrame"""
+    frame = pd.DataFrame(Stock.get_default_stocks())
+    frame = frame.rename(columns={'code': 'ts_code', 'last_price': 'close', 'prev_price': 'pre_close'})
+    return frame[['ts_code', 'name', 'industry', 'market']], frame[['ts_code', 'close', 'pre_close']]
@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from database import db, QuantStrategy
+from execution_engine import Order, BUY, SELL
+from bar_store import DAILY, day_bucket
+from signals import ma_signals, to_cents
+
+
+def compute_signals(panel, lengths, current_prices, rows, ma_short, ma_long, momentum_days):
+    """对一批策略一次性计算信号
+
+    panel/lengths 为 read_close_panel 返回的历史收盘价面板；current_prices
+    为面板每行对应的当前价格；rows、ma_short、ma_long、momentum_days 为
+    每个策略一项的数组。结果与对 (历史收盘价 + [当前价格]) 调用
+    QuantStrategy.calculate_signal 一致：1 买入，-1 卖出，0 持有。
+    前缀和按整数分计算，窗口和是精确值，两条均线相等时同样持有。
+    """
+    extended = to_cents(np.concatenate([panel, current_prices[:, None]], axis=1))
+    width = extended.shape[1]
+    sums = np.zeros((extended.shape[0], width + 1), dtype=np.int64)
+    np.cumsum(extended, axis=1, out=sums[:, 1:])
+
+    short_sum = sums[rows, width] - sums[rows, width - ma_short]
+    long_sum = sums[rows, width] - sums[rows, width - ma_long]
+    signals = ma_signals(short_sum, ma_short, long_sum, ma_long,
+                         extended[rows, width - 1], extended[rows, width - momentum_days])
+
+    required = np.maximum(np.maximum(ma_short, ma_long), momentum_days)
+    ready = (lengths[rows] + 1 >= required) & np.isfinite(current_prices[rows])
+    signals[~ready] = 0
+    return signals
+
+
+class BatchStrategyRunner:
+    """批量执行所有活跃的量化策略
+
+    按股票把策略映射到收盘价面板的行，所有策略的均线和动量信号用一次
+    向量化计算得到；历史面板每个交易日只读取一次，只含昨天及之前已完成
+    的日线，盘中只替换当前价格这一列。产生的委托一次性交给委托执行引擎，由其成批提交。
+    """
+
+    def __init__(self, store, cache, engine, timeout=None):
+        self.store = store
+        self.cache = cache
+        self.engine = engine
+        self.timeout = timeout
+        self._panel_key = None
+        self._panel = None
+
+    def _load_panel(self, stock_ids, window, today):
+        key = (today, window, tuple(stock_ids.tolist()))
+        if key != self._panel_key:
+            self._panel = self.store.read_close_panel(stock_ids, DAILY, window, before=day_bucket(today))
+            self._panel_key = key
+        return self._panel
+
+    def run_cycle(self, today=None):
+        """执行一轮策略检查，返回 (策略数量, 成交数量, 耗时秒数)"""
+        start = time.perf_counter()
+        today = today or datetime.now().date()
+        if not self.cache.loaded:
+            self.cache.load_from_db()
+
+        strategies = QuantStrategy.query.filter(
+            QuantStrategy.is_active == True,
+            db.or_(QuantStrategy.last_trade_date == None, QuantStrategy.last_trade_date != today)
+        ).all()
+
+        # 通过行情缓存把股票代码映射为股票 id 和当前价格
+        quotes = [self.cache.get(strategy.stock_code) for strategy in strategies]
+        candidates = [(strategy, quote) for strategy, quote in zip(strategies, quotes) if quote is not None]
+        for strategy, quote in zip(strategies, quotes):
+            if quote is None:
+                print(f"未找到股票: {strategy.stock_code}")
+        if not candidates:
+            return len(strategies), 0, time.perf_counter() - start
+
+        stock_ids = np.unique([quote.id for _, quote in candidates])
+        ma_short = np.asarray([strategy.ma_short for strategy, _ in candidates], dtype=np.int64)
+        ma_long = np.asarray([strategy.ma_long for strategy, _ in candidates], dtype=np.int64)
+        momentum_days = np.asarray([strategy.momentum_days for strategy, _ in candidates], dtype=np.int64)
+        window = int(max(ma_short.max(), ma_long.max(), momentum_days.max()))
+
+        panel, lengths = self._load_panel(stock_ids, window, today)
+        rows = np.searchsorted(stock_ids, [quote.id for _, quote in candidates])
+        current_prices = np.full(len(stock_ids), np.nan)
+        current_prices[rows] = [quote.last_price for _, quote in candidates]
+        signals = compute_signals(panel, lengths, current_prices, rows, ma_short, ma_long, momentum_days)
+
+        fills = self.apply_fills(candidates, signals, today)
+        return len(strategies), fills, time.perf_counter() - start
+
+    def apply_fills(self, candidates, signals, today):
+        """根据信号向执行引擎提交委托并等待结果，返回成交数量"""
+        orders = [
+            (strategy.stock_code, Order(strategy.user_id, quote.id, BUY if signal == 1 else SELL,
+                                        strategy.position_size if signal == 1 else strategy.position,
+                                        quote.last_price, strategy.id))
+            for (strategy, quote), signal in zip(candidates, signals.tolist())
+            if (signal == 1 and strategy.position == 0) or (signal == -1 and strategy.position > 0)
+        ]
+        if not orders:
+            return 0
+
+        # 策略状态由执行线程修改，这里结束读事务，下一轮重新读取
+        db.session.close()
+        futures = [(stock_code, self.engine.submit(order)) for stock_code, order in orders]
+        fills = 0
+        for stock_code, future in futures:
+            fill = future.result(self.timeout)
+            if not fill.filled:
+                print(f"委托未成交: {stock_code}, 原因: {fill.reason}")
+            elif fill.order.side == BUY:
+                fills += 1
+                print(f"执行买入: {stock_code}, 数量: {fill.quantity}, 价格: {fill.price}")
+            else:
+                fills += 1
+                print(f"执行卖出: {stock_code}, 收益: {fill.profit}")
+        return fills
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# 项目模块位于上一级目录，测试直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 网页测试使用临时数据库和离线行情，需在导入 config 之前设置
+_TEST_DIR = tempfile.mkdtemp(prefix='stock-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ['MARKET_DATABASE_URL'] = os.environ['DATABASE_URL']
+os.environ.pop('LEDGER_REPLICA_URL', None)
+os.environ['TUSHARE_BACKEND'] = 'fake'
+os.environ['TUSHARE_CACHE_DIR'] = os.path.join(_TEST_DIR, 'tushare')
+os.environ['APP_ROLE'] = 'web'
+
+
+@pytest.fixture(scope='session')
+def app():
+    """建好表的应用，不启动后台服务"""
+    from flask_sqlalchemy import get_state
+
+    from app import app as flask_app
+    from database import db
+
+    flask_app.config['TESTING'] = True
+    # 跳过 before_first_request 中的领导者选举和后台任务
+    flask_app._got_first_request = True
+    with flask_app.app_context():
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+    # 网页请求和后台线程的引擎都要释放
+    for connector in get_state(flask_app).connectors.values():
+        connector.get_engine().dispose()
+    shutil.rmtree(_TEST_DIR, ignore_errors=True)
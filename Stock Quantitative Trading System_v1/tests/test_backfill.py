@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from backfill import Backfill, BackfillCheckpoint
+from bar_store import BarStore, DAILY
+from database import db, Stock, StockBar
+from tushare_client import FakeTushareBackend, TushareClient
+
+END_DATE = '20200131'
+YEARS = 0.1
+
+
+class CrashingStore(BarStore):
+    """第 crash_on 次写入时抛出异常，模拟回补进程中途退出"""
+
+    def __init__(self, crash_on):
+        super().__init__()
+        self.crash_on = crash_on
+        self.appends = 0
+
+    def append(self, rows):
+        self.appends += 1
+        if self.appends == self.crash_on:
+            raise RuntimeError('回补中断')
+        super().append(rows)
+
+
+class CrashingCheckpoint(BackfillCheckpoint):
+    """K线已提交、进度还没保存时退出"""
+
+    def save(self):
+        raise RuntimeError('回补中断')
+
+
+@pytest.fixture
+def stocks(app, request):
+    """每个测试使用独立的一组股票，返回 {code: stock_id}"""
+    base = request.param
+    backend = FakeTushareBackend(stock_count=6)
+    codes = {code: base + index for index, code in enumerate(backend.codes())}
+    with app.app_context():
+        db.session.add_all([Stock(id=stock_id, code=code, name=code) for code, stock_id in codes.items()])
+        db.session.commit()
+        yield codes
+        # 模拟数据源的代码固定，删除本测试的股票和K线，不影响其他测试的股票 id 和代码
+        db.session.rollback()
+        StockBar.query.filter(StockBar.stock_id.in_(list(codes.values()))).delete(synchronize_session=False)
+        Stock.query.filter(Stock.id.in_(list(codes.values()))).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def expected_days():
+    start = np.datetime64(datetime.strptime(END_DATE, '%Y%m%d').date()) - int(365.25 * YEARS)
+    days = np.arange(start, np.datetime64('2020-01-31') + 1)
+    return set(days[np.is_busday(days)].astype('datetime64[us]').tolist())
+
+
+def assert_complete(codes):
+    store = BarStore()
+    for stock_id in codes.values():
+        bars = store.read_range(stock_id, DAILY)
+        times = bars['time'].astype('datetime64[us]').tolist()
+        assert len(times) == len(set(times))
+        assert set(times) == expected_days()
+
+
+def run_backfill(store, checkpoint, codes):
+    backend = FakeTushareBackend(stock_count=6)
+    backfill = Backfill(TushareClient(backend, rate_limit=None), store, checkpoint=checkpoint,
+                        workers=2, write_batch=40)
+    return backend, backfill.run(years=YEARS, codes=list(codes), end_date=END_DATE)
+
+
+@pytest.mark.parametrize('stocks', [9301], indirect=True)
+def test_resume_after_interrupted_write(stocks, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with pytest.raises(RuntimeError):
+        run_backfill(CrashingStore(crash_on=2), BackfillCheckpoint(path), stocks)
+    db.session.rollback()
+
+    checkpoint = BackfillCheckpoint(path)
+    finished = set(checkpoint.done)
+    assert 0 < len(finished) < len(stocks)
+
+    backend, stats = run_backfill(BarStore(), checkpoint, stocks)
+    # 已提交并记录进度的股票不再请求
+    assert {params['ts_code'] for _, params in backend.calls}.isdisjoint(finished)
+    assert stats['skipped'] == len(finished)
+    assert_complete(stocks)
+
+
+@pytest.mark.parametrize('stocks', [9311], indirect=True)
+def test_resume_after_commit_before_checkpoint_saved(stocks, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with pytest.raises(RuntimeError):
+        run_backfill(BarStore(), CrashingCheckpoint(path), stocks)
+
+    assert any(len(BarStore().read_range(stock_id, DAILY)['time']) for stock_id in stocks.values())
+
+    # 进度文件没有写出，重新回补全部股票，已写入的K线被覆盖而不是重复
+    checkpoint = BackfillCheckpoint(path)
+    assert checkpoint.done == {}
+    backend, stats = run_backfill(BarStore(), checkpoint, stocks)
+    assert stats['symbols'] == len(stocks)
+    assert_complete(stocks)
+
+    _, stats = run_backfill(BarStore(), BackfillCheckpoint(path), stocks)
+    assert stats['skipped'] == len(stocks)
+    assert_complete(stocks)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from bar_store import BarAggregator, BarStore, DAILY, day_bucket
+from database import db, QuantStrategy
+from indicators import IndicatorEngine
+from signals import latest_signal
+from strategy_engine import BatchStrategyRunner, compute_signals
+
+TODAY = datetime(2026, 3, 10)
+PARAMS = (1, 2, 3)
+
+
+@pytest.fixture
+def store(app):
+    with app.app_context():
+        yield BarStore()
+        db.session.rollback()
+
+
+def seed_history(store, stock_id, closes):
+    """写入截至昨天的日线，最后一根是昨天"""
+    store.append([
+        {'stock_id': stock_id, 'freq': DAILY, 'bar_time': TODAY - timedelta(days=len(closes) - index),
+         'open': close, 'high': close, 'low': close, 'close': close, 'volume': 0.0}
+        for index, close in enumerate(closes)
+    ])
+    db.session.commit()
+
+
+def flush_partial_bar(store, stock_id, price):
+    """盘中定期写入今天未完成的日线"""
+    aggregator = BarAggregator(store)
+    aggregator.on_tick(np.asarray([stock_id]), np.asarray([price]), TODAY + timedelta(hours=10))
+    aggregator.flush()
+    db.session.commit()
+
+
+def test_readers_exclude_todays_partial_bar(store):
+    seed_history(store, 9101, [13.0, 12.0, 11.0])
+    flush_partial_bar(store, 9101, 21.0)
+
+    before = day_bucket(TODAY)
+    assert store.read_last(9101, DAILY, 3, before=before)['close'].tolist() == [13.0, 12.0, 11.0]
+    assert store.read_range(9101, DAILY, before=before)['close'].tolist() == [13.0, 12.0, 11.0]
+    panel, lengths = store.read_close_panel([9101], DAILY, 3, before=before)
+    assert panel[0].tolist() == [13.0, 12.0, 11.0] and lengths.tolist() == [3]
+    # 不加上界时能读到今天的日线
+    assert store.read_last(9101, DAILY, 1)['close'].tolist() == [21.0]
+
+
+def test_flush_between_evaluations_keeps_signals(store):
+    history = [9.5, 9.8, 9.6, 9.7]
+    seed_history(store, 9102, history)
+    strategy = QuantStrategy(1, '009102', *PARAMS, 100)
+    strategy.id = 9102
+    price = 9.9
+    expected = latest_signal(history + [price], *PARAMS)
+    before = day_bucket(TODAY)
+
+    def batch_signal():
+        panel, lengths = store.read_close_panel([9102], DAILY, max(PARAMS), before=before)
+        return int(compute_signals(panel, lengths, np.asarray([price]), np.asarray([0]),
+                                   *(np.asarray([value]) for value in PARAMS))[0])
+
+    engine = IndicatorEngine(store)
+    assert engine.evaluate(strategy, 9102, price, TODAY.date()) == expected
+    assert batch_signal() == expected
+
+    # 两次评估之间盘中写入了今天的日线，今天的价格仍只计算一次
+    flush_partial_bar(store, 9102, 12.0)
+    assert IndicatorEngine(store).evaluate(strategy, 9102, price, TODAY.date()) == expected
+    assert engine.evaluate(strategy, 9102, price, TODAY.date()) == expected
+    assert batch_signal() == expected
+
+
+def test_next_day_catch_up_uses_final_close(store):
+    history = [9.5, 9.8, 9.6, 9.7]
+    seed_history(store, 9103, history)
+    strategy = QuantStrategy(1, '009103', *PARAMS, 100)
+    strategy.id = 9103
+    engine = IndicatorEngine(store)
+
+    # 预热时表中已有今天未完成的日线，收盘后写入的最终收盘价不同
+    flush_partial_bar(store, 9103, 12.0)
+    engine.evaluate(strategy, 9103, 12.0, TODAY.date())
+    aggregator = BarAggregator(store)
+    aggregator.on_tick(np.asarray([9103]), np.asarray([9.9]), TODAY + timedelta(hours=14, minutes=59))
+    aggregator.flush()
+    db.session.commit()
+
+    tomorrow = (TODAY + timedelta(days=1)).date()
+    expected = latest_signal(history + [9.9, 10.0], *PARAMS)
+    assert engine.evaluate(strategy, 9103, 10.0, tomorrow) == expected
+    assert expected != latest_signal(history + [12.0, 10.0], *PARAMS)
+
+
+def test_batch_panel_is_prior_closes_regardless_of_flush_timing(store):
+    seed_history(store, 9104, [10.0, 10.5, 11.0])
+    ids = np.asarray([9104])
+    early = BatchStrategyRunner(store, cache=None, engine=None)
+    panel, _ = early._load_panel(ids, 3, TODAY.date())
+
+    # 开盘后才第一次载入面板的进程与开盘前载入的进程得到相同的历史收盘价
+    flush_partial_bar(store, 9104, 12.5)
+    late = BatchStrategyRunner(store, cache=None, engine=None)
+    assert late._load_panel(ids, 3, TODAY.date())[0].tolist() == panel.tolist() == [[10.0, 10.5, 11.0]]
@@ -0,0 +1,53 @@
+import threading
+
+from sqlalchemy import text
+
+import db_engine
+from database import MARKET_BIND, db
+
+
+def test_background_threads_use_their_own_pool(app):
+    with app.test_request_context():
+        web = db.get_engine(app)
+        assert db.get_engine(app, MARKET_BIND) is web
+    with app.app_context():
+        background = db.get_engine(app)
+        assert db.get_engine(app, MARKET_BIND) is background
+    assert web is not background
+    assert web.pool.size() == app.config['DB_WEB_POOL_SIZE']
+    assert background.pool.size() == app.config['DB_BACKGROUND_POOL_SIZE']
+
+
+def test_background_connection_available_when_web_pool_exhausted(app):
+    with app.test_request_context():
+        web = db.get_engine(app)
+    held = [web.connect() for _ in range(web.pool.size() + web.pool._max_overflow)]
+    try:
+        result = []
+
+        def background_write():
+            with app.app_context():
+                with db.get_engine(app).connect() as conn:
+                    result.append(conn.execute(text('SELECT 1')).scalar())
+
+        thread = threading.Thread(target=background_write)
+        thread.start()
+        thread.join(timeout=5)
+        assert result == [1]
+    finally:
+        for conn in held:
+            conn.close()
+
+
+def test_background_engine_sized_separately():
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite:////tmp/x.db', 'DB_WEB_POOL_SIZE': 8,
+              'DB_BACKGROUND_POOL_SIZE': 4}
+    assert db_engine.engine_options(config)['pool_size'] == 8
+    assert db_engine.engine_options(config, workload='background')['pool_size'] == 4
+    assert db_engine.engine_options({}, 'sqlite://', 'background') == {}
+
+
+def test_pool_benchmark_writer_not_starved():
+    results = db_engine.pool_benchmark(requests=12, duration=1.0, web_pool=4, background_pool=2)
+    assert results['split']['ticks'] > results['shared']['ticks']
+    assert results['split']['wait_max_ms'] < 100
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from database import db, User, Position, Trade
+from execution_engine import BUY, SELL, ExecutionEngine, Order
+
+
+def create_user(app, username, balance, positions=()):
+    """创建用户和持仓 positions=[(stock_id, quantity)]，返回用户 id"""
+    with app.app_context():
+        user = User(username=username, balance=balance)
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        for stock_id, quantity in positions:
+            db.session.add(Position(user_id=user.id, stock_id=stock_id, quantity=quantity, average_price=10.0))
+        db.session.commit()
+        return user.id
+
+
+def submit_concurrently(engines, orders):
+    """每个委托一个线程同时提交，轮流使用 engines 中的写线程（模拟多个进程），返回成交结果"""
+    barrier = threading.Barrier(len(orders))
+    fills = [None] * len(orders)
+
+    def worker(index):
+        barrier.wait()
+        fills[index] = engines[index % len(engines)].execute(orders[index], timeout=30)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(orders))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return fills
+
+
+def account(app, user_id, stock_id):
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        position = Position.query.filter_by(user_id=user_id, stock_id=stock_id).first()
+        trades = Trade.query.filter_by(user_id=user_id).count()
+        result = user.balance, position.quantity if position else 0, trades
+        db.session.remove()
+        return result
+
+
+@pytest.mark.parametrize('writers', [1, 2])
+def test_parallel_sells_never_oversell(app, writers):
+    stock_id = 9400 + writers
+    user_id = create_user(app, f'oversell-{writers}', 0.0, [(stock_id, 500)])
+    engines = [ExecutionEngine(app) for _ in range(writers)]
+    fills = submit_concurrently(engines, [Order(user_id, stock_id, SELL, 100, 10.0) for _ in range(20)])
+
+    filled = [fill for fill in fills if fill.filled]
+    assert len(filled) == 5
+    assert {fill.reason for fill in fills if not fill.filled} == {'持仓不足'}
+    commission = 1000.0 * app.config['COMMISSION_RATE']
+    balance, quantity, trades = account(app, user_id, stock_id)
+    assert quantity == 0
+    assert trades == 5
+    assert balance == pytest.approx(5 * (1000.0 - commission))
+
+
+@pytest.mark.parametrize('writers', [1, 2])
+def test_parallel_buys_never_overdraw(app, writers):
+    stock_id = 9410 + writers
+    user_id = create_user(app, f'overdraft-{writers}', 10000.0)
+    engines = [ExecutionEngine(app) for _ in range(writers)]
+    fills = submit_concurrently(engines, [Order(user_id, stock_id, BUY, 100, 10.0) for _ in range(20)])
+
+    cost = 1000.0 * (1 + app.config['COMMISSION_RATE'])
+    expected = int(10000.0 // cost)
+    assert sum(fill.filled for fill in fills) == expected
+    assert {fill.reason for fill in fills if not fill.filled} == {'余额不足'}
+    balance, quantity, trades = account(app, user_id, stock_id)
+    assert balance >= 0
+    assert balance == pytest.approx(10000.0 - expected * cost)
+    assert quantity == expected * 100
+    assert trades == expected
+
+
+def test_failed_batch_rolls_back_and_retries_each_order(app):
+    stock_id = 9421
+    user_id = create_user(app, 'rollback', 10000.0, [(stock_id, 100)])
+    # 等待时间足够长，三笔委托进入同一批
+    engine = ExecutionEngine(app, max_wait=0.5)
+    commits = []
+    commit = engine._commit
+
+    def recording_commit(orders):
+        commits.append(len(orders))
+        return commit(orders)
+
+    engine._commit = recording_commit
+    futures = [
+        engine.submit(Order(user_id, stock_id, BUY, 100, 10.0)),
+        # stock_id 为空的持仓违反非空约束，整批提交失败
+        engine.submit(Order(user_id, None, BUY, 100, 10.0)),
+        engine.submit(Order(user_id, stock_id, SELL, 50, 10.0)),
+    ]
+    assert futures[0].result(30).filled
+    with pytest.raises(Exception):
+        futures[1].result(30)
+    assert futures[2].result(30).filled
+    # 失败的一批没有提交，逐个重试时只有两笔成功
+    assert commits == [3, 1, 1, 1]
+    assert engine.batches == 2
+    assert engine.orders == 2
+
+    commission = app.config['COMMISSION_RATE']
+    balance, quantity, trades = account(app, user_id, stock_id)
+    assert quantity == 150
+    assert trades == 2
+    assert balance == pytest.approx(10000.0 - 1000.0 * (1 + commission) + 500.0 * (1 - commission))
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from database import db, User
+from optimizer import ParameterSweep, parameter_grid, parse_range
+
+
+class RecordingPool:
+    """同步执行任务的进程池替身，记录提交的任务数"""
+
+    def __init__(self, processes=2):
+        self.processes = processes
+        self.submitted = 0
+
+    def get(self):
+        return self
+
+    def apply_async(self, func, args, callback=None, error_callback=None):
+        self.submitted += 1
+        try:
+            result = func(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+
+@pytest.mark.parametrize('text', ['0', '-3', '0:5', '5:2', '2:9:0'])
+def test_parse_range_rejects_values_below_one(text):
+    with pytest.raises(ValueError):
+        parse_range(text, range(2, 3))
+
+
+def test_parse_range_single_value():
+    assert list(parse_range('7', range(2, 3))) == [7]
+    assert list(parse_range('', range(2, 3))) == [2]
+
+
+def test_optimize_rejects_zero_momentum_days(app):
+    with app.app_context():
+        user = User(username='optimizer')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': 'optimizer', 'password': 'secret'})
+    response = client.get('/quant/optimize?stock_codes=000001&momentum_days=0')
+    assert response.status_code == 400
+
+
+def sweep_inputs():
+    rng = np.random.default_rng(0)
+    series = {f'S{i}': np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, 200))), 2) for i in range(3)}
+    return series, parameter_grid(range(2, 8), range(10, 31, 5), range(2, 9, 3))
+
+
+def test_closed_sweep_stops_submitting_to_shared_pool():
+    series, params = sweep_inputs()
+    pool = RecordingPool()
+    sweep = ParameterSweep(chunk_size=4, pool=pool, max_pending=3)
+    results = sweep.run(series, params, 100, 0.0003, 100000)
+    next(results)
+    results.close()
+    # 客户端断开后剩余任务不再提交，只有窗口内已提交的任务会执行
+    assert pool.submitted <= 3 + 1 < len(params) * len(series) // 4
+
+
+def test_shared_pool_sweep_returns_every_combination():
+    series, params = sweep_inputs()
+    pool = RecordingPool()
+    evaluated = sum(len(batch) for _, batch in
+                    ParameterSweep(chunk_size=4, pool=pool, max_pending=3).run(series, params, 100, 0.0003, 100000))
+    assert evaluated == len(params) * len(series)
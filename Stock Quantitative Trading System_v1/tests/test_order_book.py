@@ -0,0 +1,152 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, User, Position, RestingOrder
+from execution_engine import BUY, SELL, ExecutionEngine
+from order_book import BookEntry, LIMIT, STOP, STOP_LIMIT, OrderBook, RestingOrderService
+
+STOCK = 7
+
+
+def entry(order_id, side, order_type, limit_price=None, stop_price=None, stock_id=STOCK, expires_at=None):
+    return BookEntry(order_id, 1, stock_id, side, order_type, 100, limit_price, stop_price, expires_at, False)
+
+
+def tick(book, price, stock_id=STOCK):
+    fills, triggered = book.match([stock_id], [price])
+    return [(e.id, fill_price) for e, fill_price in fills], [e.id for e in triggered]
+
+
+def test_limit_orders_fill_when_price_crosses():
+    book = OrderBook()
+    book.add(entry(1, BUY, LIMIT, limit_price=10.0))
+    book.add(entry(2, SELL, LIMIT, limit_price=11.0))
+    assert tick(book, 10.5) == ([], [])
+    assert tick(book, 10.0) == ([(1, 10.0)], [])
+    assert tick(book, 11.2) == ([(2, 11.2)], [])
+    assert len(book) == 0
+
+
+def test_stop_orders_fill_at_market_once_triggered():
+    book = OrderBook()
+    book.add(entry(1, SELL, STOP, stop_price=9.5))
+    book.add(entry(2, BUY, STOP, stop_price=11.0))
+    assert tick(book, 10.0) == ([], [])
+    assert tick(book, 9.3) == ([(1, 9.3)], [])
+    assert tick(book, 11.4) == ([(2, 11.4)], [])
+
+
+def test_stop_limit_becomes_limit_after_trigger():
+    book = OrderBook()
+    book.add(entry(1, SELL, STOP_LIMIT, limit_price=9.4, stop_price=9.5))
+    # 跌破触发价但低于限价：只触发，不成交
+    assert tick(book, 9.3) == ([], [1])
+    assert book.orders[1].triggered
+    # 触发后价格回到限价之上才成交，不再重复触发
+    assert tick(book, 9.35) == ([], [])
+    assert tick(book, 9.45) == ([(1, 9.45)], [])
+
+
+def test_stop_limit_fills_in_the_triggering_tick_when_limit_also_crossed():
+    book = OrderBook()
+    book.add(entry(1, BUY, STOP_LIMIT, limit_price=11.5, stop_price=11.0))
+    assert tick(book, 11.2) == ([(1, 11.2)], [1])
+
+
+def test_removed_and_expired_orders_never_fill():
+    book = OrderBook()
+    now = datetime(2026, 3, 10, 10)
+    book.add(entry(1, BUY, LIMIT, limit_price=10.0))
+    book.add(entry(2, BUY, LIMIT, limit_price=10.0, expires_at=now))
+    book.add(entry(3, BUY, LIMIT, limit_price=10.0, stock_id=STOCK + 1))
+    assert book.remove(1).id == 1
+    assert [e.id for e in book.expire(now)] == [2]
+    assert tick(book, 9.0) == ([], [])
+    # 不在本次 tick 中的股票不撮合
+    assert 3 in book.orders
+
+
+class PendingEngine:
+    """记录提交的委托，结果由测试决定何时返回"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, order):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.submitted.append((order, future))
+        return future
+
+
+@pytest.fixture
+def user_id(app, request):
+    with app.app_context():
+        user = User(username=f'resting-{request.node.name}')
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Position(user_id=user.id, stock_id=9501, quantity=1000, average_price=10.0))
+        db.session.commit()
+        yield user.id
+        db.session.remove()
+
+
+def status(order_id):
+    db.session.expire_all()
+    return db.session.get(RestingOrder, order_id).status
+
+
+def test_cancel_refused_while_order_is_claimed(app, user_id):
+    engine = PendingEngine()
+    service = RestingOrderService(OrderBook(), engine)
+    order = service.place(user_id, 9501, SELL, LIMIT, 100, limit_price=11.0)
+    assert service.on_tick([9501], [11.1]) == 1
+
+    # 已提交给执行引擎、尚未写入成交状态
+    assert service.cancel(order.id, user_id) is False
+    assert status(order.id) == 'OPEN'
+
+    submitted, future = engine.submitted[0]
+    fill = ExecutionEngine(app).execute(submitted, timeout=30)
+    future.set_result(fill)
+    assert fill.filled
+    assert status(order.id) == 'FILLED'
+    assert service.cancel(order.id, user_id) is False
+    assert order.id not in service._inflight
+
+
+def test_engine_rejects_order_cancelled_by_another_process(app, user_id):
+    engine = PendingEngine()
+    owner = RestingOrderService(OrderBook(), engine)
+    other = RestingOrderService(OrderBook(), engine)
+    other.set_owner(False)
+    order = owner.place(user_id, 9501, SELL, STOP, 100, stop_price=9.5)
+    owner.on_tick([9501], [9.4])
+
+    # 另一个进程不持有订单簿，直接按状态条件撤单
+    assert other.cancel(order.id, user_id) is True
+    fill = ExecutionEngine(app).execute(engine.submitted[0][0], timeout=30)
+    assert not fill.filled
+    assert fill.reason == '挂单已撤销或已处理'
+    assert status(order.id) == 'CANCELLED'
+
+
+def test_sync_loads_and_removes_orders_from_other_processes(app, user_id):
+    owner = RestingOrderService(OrderBook(), PendingEngine())
+    owner.load_from_db()
+    other = RestingOrderService(OrderBook(), PendingEngine())
+    other.set_owner(False)
+
+    order = other.place(user_id, 9501, SELL, LIMIT, 100, limit_price=12.0,
+                        expires_at=datetime.now() + timedelta(days=1))
+    assert order.id not in owner.book.orders
+    owner.sync_from_db()
+    assert owner.book.orders[order.id].limit_price == 12.0
+
+    assert other.cancel(order.id, user_id) is True
+    assert owner.sync_from_db()[1] >= 1
+    assert order.id not in owner.book.orders
+    assert owner.on_tick([9501], [12.5]) == 0
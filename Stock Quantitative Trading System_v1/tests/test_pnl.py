@@ -0,0 +1,60 @@
+import pytest
+
+from database import db, User, QuantStrategy, DailyPnl
+from execution_engine import BUY, SELL, ExecutionEngine, Order
+from pnl import rebuild_daily_pnl
+
+MANUAL_STOCK, STRATEGY_STOCK = 9601, 9602
+FIELDS = ('trades', 'buy_quantity', 'sell_quantity', 'buy_amount', 'sell_amount', 'commission', 'realized_profit')
+
+
+def daily_rows(user_id):
+    db.session.expire_all()
+    return {
+        (row.stock_id, row.trade_date): tuple(getattr(row, field) for field in FIELDS)
+        for row in DailyPnl.query.filter_by(user_id=user_id)
+    }
+
+
+def test_incremental_daily_pnl_matches_rebuild(app):
+    with app.app_context():
+        user = User(username='pnl-rebuild')
+        db.session.add(user)
+        db.session.flush()
+        strategy = QuantStrategy(user_id=user.id, stock_code='009602', ma_short=5, ma_long=20,
+                                 momentum_days=10, position_size=300)
+        db.session.add(strategy)
+        db.session.commit()
+        user_id, strategy_id = user.id, strategy.id
+
+        engine = ExecutionEngine(app)
+        orders = [
+            Order(user_id, MANUAL_STOCK, BUY, 200, 10.0),
+            Order(user_id, MANUAL_STOCK, BUY, 100, 13.0),
+            Order(user_id, MANUAL_STOCK, SELL, 150, 12.5),
+            # 持仓不足，被拒绝的委托不计入汇总
+            Order(user_id, MANUAL_STOCK, SELL, 1000, 12.5),
+            Order(user_id, MANUAL_STOCK, SELL, 150, 9.0),
+            # 清仓后重新买入，成本从新的成交开始计算
+            Order(user_id, MANUAL_STOCK, BUY, 100, 8.0),
+            Order(user_id, MANUAL_STOCK, SELL, 40, 8.8),
+            Order(user_id, STRATEGY_STOCK, BUY, 0, 20.0, strategy_id=strategy_id),
+            Order(user_id, STRATEGY_STOCK, SELL, 0, 21.5, strategy_id=strategy_id),
+            Order(user_id, STRATEGY_STOCK, BUY, 0, 19.0, strategy_id=strategy_id),
+        ]
+        # 一部分逐笔执行，一部分同批提交，两种路径都要与重建结果一致
+        fills = [engine.execute(order, timeout=30) for order in orders[:4]]
+        fills += [future.result(30) for future in [engine.submit(order) for order in orders[4:]]]
+        assert [fill.filled for fill in fills] == [True, True, True, False] + [True] * 6
+
+        incremental = daily_rows(user_id)
+        assert {stock_id for stock_id, _ in incremental} == {MANUAL_STOCK, STRATEGY_STOCK}
+        rebuild_daily_pnl()
+        rebuilt = daily_rows(user_id)
+
+        assert incremental.keys() == rebuilt.keys()
+        for key, values in incremental.items():
+            assert values == pytest.approx(rebuilt[key]), key
+        realized = sum(fill.profit for fill in fills if fill.filled)
+        assert sum(values[-1] for values in rebuilt.values()) == pytest.approx(realized)
+        db.session.remove()
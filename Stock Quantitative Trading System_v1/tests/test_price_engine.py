@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+import pytest
+
+from database import db, Stock, MarketState
+from market_data import MarketDataService
+from price_engine import PriceTickEngine, TRADING_DAY_STATE
+from quote_cache import QuoteCache
+
+STOCK_ID = 9701
+
+
+class FixedSource:
+    def __init__(self, prices):
+        self.prices = prices
+
+    def fetch_latest(self, codes):
+        return {code: self.prices[code] for code in codes if code in self.prices}
+
+
+def stock_prices():
+    db.session.expire_all()
+    stock = db.session.get(Stock, STOCK_ID)
+    return stock.last_price, stock.prev_price
+
+
+@pytest.fixture
+def stock(app):
+    with app.app_context():
+        db.session.add(Stock(id=STOCK_ID, code='P9701', name='行情引擎', last_price=10.0, prev_price=9.0))
+        db.session.commit()
+        yield
+        db.session.rollback()
+        Stock.query.filter_by(id=STOCK_ID).delete()
+        MarketState.query.filter_by(name=TRADING_DAY_STATE).delete()
+        db.session.commit()
+
+
+def test_rollover_after_restart_following_pre_open_refresh(stock):
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+
+    PriceTickEngine(seed=1).tick(trading_day=yesterday)
+    closing_price, _ = stock_prices()
+    assert db.session.get(MarketState, TRADING_DAY_STATE).value == yesterday.isoformat()
+
+    # 开盘前行情刷新把最新价和更新时间改成今天，但不是行情 tick，不应影响交易日切换
+    cache = QuoteCache()
+    cache.load_from_db()
+    refreshed = round(closing_price * 1.05, 2)
+    assert MarketDataService(cache, FixedSource({'P9701': refreshed})).refresh(['P9701']) == 1
+    assert db.session.get(Stock, STOCK_ID).last_update.date() == today
+
+    # 进程重启：新引擎从 market_state 读取上一次 tick 的交易日，第一次 tick 滚动前收盘价
+    restarted = PriceTickEngine(seed=2)
+    restarted.tick(trading_day=today)
+    _, prev_price = stock_prices()
+    assert prev_price == refreshed
+    db.session.expire_all()
+    assert db.session.get(MarketState, TRADING_DAY_STATE).value == today.isoformat()
+
+    # 同一交易日再次重启不会重复滚动
+    PriceTickEngine(seed=3).tick(trading_day=today)
+    assert stock_prices()[1] == refreshed
+
+
+def test_same_day_restart_keeps_prev_price(stock):
+    today = date.today()
+    PriceTickEngine(seed=1).tick(trading_day=today)
+    _, prev_price = stock_prices()
+    engine = PriceTickEngine(seed=2)
+    assert not engine.is_new_trading_day(today)
+    engine.tick(trading_day=today)
+    assert stock_prices()[1] == prev_price
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, User, Stock, Position, Trade, DailyPnl, QuantStrategy
+
+# 两个用户的持仓数；页面的 SQL 语句数不应随持仓数增长
+FEW, MANY = 1, 12
+
+
+def seed_user(username, positions):
+    """创建用户和 positions 笔持仓，每笔持仓带一条买入成交、当天的盈亏汇总和一个量化策略，
+    返回第一笔持仓的 id"""
+    user = User(username=username)
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.flush()
+    created_at = datetime.now() - timedelta(days=3)
+    first = None
+    for stock_id in range(1, positions + 1):
+        position = Position(user_id=user.id, stock_id=stock_id, quantity=100, average_price=10.0)
+        db.session.add(position)
+        db.session.add(Trade(user_id=user.id, stock_id=stock_id, type='BUY', quantity=100,
+                             price=10.0, total_amount=1000.0, commission=0.0, created_at=created_at))
+        daily = DailyPnl(user.id, stock_id, created_at.date())
+        daily.add_trade('BUY', 100, 1000.0, 0.0, 0.0)
+        db.session.add(daily)
+        db.session.add(QuantStrategy(user_id=user.id, stock_code=f'{stock_id:06d}', ma_short=5, ma_long=20,
+                                     momentum_days=10, position_size=100))
+        db.session.flush()
+        first = first or position.id
+    db.session.commit()
+    return first
+
+
+@pytest.fixture(scope='module')
+def accounts(app):
+    with app.app_context():
+        for index in range(1, MANY + 1):
+            db.session.add(Stock(code=f'{index:06d}', name=f'股票{index}', last_price=10.0 + index,
+                                 last_update=datetime.now()))
+        db.session.commit()
+        return {
+            'warmup': seed_user('warmup', FEW),
+            'few': seed_user('few', FEW),
+            'many': seed_user('many', MANY),
+        }
+
+
+def login(app, username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': 'secret'})
+    assert response.status_code == 302
+    return client
+
+
+def statements(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, url
+    return int(response.headers['X-SQL-Statements'])
+
+
+def route_urls(position_id):
+    return ['/dashboard', '/positions', '/quant', '/trade', f'/api/position/{position_id}/history']
+
+
+@pytest.fixture(scope='module')
+def counts(app, accounts):
+    """每个路由在 1 笔和多笔持仓时各自第一次请求的 SQL 语句数
+
+    先用另一个用户请求一遍，行情缓存等全局状态已经载入，两个用户的
+    持仓估值和收益曲线缓存都是第一次计算。
+    """
+    result = {}
+    for username in ('warmup', 'few', 'many'):
+        client = login(app, username)
+        result[username] = [statements(client, url) for url in route_urls(accounts[username])]
+    return result
+
+
+@pytest.mark.parametrize('index,route', list(enumerate(route_urls('<id>'))))
+def test_statement_count_does_not_grow_with_positions(counts, index, route):
+    assert counts['few'][index] == counts['many'][index], route
+
+
+def test_failed_statement_does_not_leak_timing_entry(app):
+    from sqlalchemy import text
+    from sql_metrics import sql_metrics
+
+    with app.test_request_context():
+        sql_metrics._start()
+        # info 随底层数据库连接保留在连接池中，出错的语句不能留下计时记录
+        info = db.session.connection().info
+        with pytest.raises(Exception):
+            db.session.execute(text('SELECT * FROM missing_table'))
+        db.session.rollback()
+        assert not info.get('sql_metrics_start')
+
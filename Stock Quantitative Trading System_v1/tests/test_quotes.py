@@ -0,0 +1,57 @@
+import pytest
+
+from database import Stock, User, db
+from quote_cache import quote_cache
+
+
+@pytest.fixture(scope='module')
+def quote_stocks(app):
+    with app.app_context():
+        db.session.add_all([Stock(id=9201, code='Q9201', name='行情一', last_price=10.0, prev_price=9.5),
+                            Stock(id=9202, code='Q9202', name='行情二', last_price=20.0, prev_price=21.0)])
+        db.session.commit()
+        quote_cache.load_from_db()
+    yield
+    # 删除本模块的股票，不影响其他测试按自增分配的股票 id
+    with app.app_context():
+        Stock.query.filter(Stock.id.in_([9201, 9202])).delete(synchronize_session=False)
+        db.session.commit()
+        quote_cache.load_from_db()
+
+
+def logged_in_client(app, username):
+    with app.app_context():
+        user = User(username=username)
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': 'secret'})
+    return client
+
+
+def test_quote_etag_follows_prices_not_version(app, quote_stocks):
+    client = logged_in_client(app, 'quotes')
+    url = '/api/quotes?codes=Q9201,Q9202'
+
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    # 价格不变只增加版本号（相当于另一个进程上的同一份行情），仍然命中 304
+    quote_cache.update([9201, 9202], [10.0, 20.0], [9.5, 21.0])
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    quote_cache.update([9201], [10.5], [9.5])
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['prices'][0] == 10.5
+
+
+def test_quote_etag_differs_by_scope(app, quote_stocks):
+    client = logged_in_client(app, 'quotes-scope')
+    one = client.get('/api/quotes?codes=Q9201').headers['ETag']
+    both = client.get('/api/quotes?codes=Q9201,Q9202').headers['ETag']
+    assert one != both
@@ -0,0 +1,135 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from scheduler import Scheduler
+from trading_calendar import TradingCalendar
+
+
+class FakeClock:
+    """手动推进的时钟：wait 直接把时间推进 timeout 秒（再加 overshoot 模拟唤醒延迟）"""
+
+    def __init__(self, now, overshoot=0.0):
+        self.start = now
+        self.elapsed = 0.0
+        self.overshoot = overshoot
+
+    def monotonic(self):
+        return self.elapsed
+
+    def now(self):
+        return self.start + timedelta(seconds=self.elapsed)
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        self.elapsed += timeout + (self.overshoot if timeout > 0 else 0.0)
+        return event.is_set()
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+
+def run_job(app, clock, runs, durations=(), failures=(), interval=10, **options):
+    """在当前线程执行任务循环，第 runs 次执行后停止，返回 (job, 各次开始的单调时间)"""
+    scheduler = Scheduler(app, clock=clock)
+    starts = []
+
+    def func():
+        index = len(starts)
+        starts.append(clock.monotonic())
+        clock.advance(durations[index] if index < len(durations) else 0.0)
+        if len(starts) >= runs:
+            scheduler._stop.set()
+        if index in failures:
+            raise RuntimeError('失败')
+
+    job = scheduler.add_job('job', func, interval, **options)
+    scheduler._run(job)
+    return job, starts
+
+
+def test_fixed_rate_does_not_drift(app):
+    job, starts = run_job(app, FakeClock(datetime(2026, 3, 10, 10)), 4, durations=[3, 3, 3, 3])
+    assert starts == [0, 10, 20, 30]
+    assert job.runs == 4 and job.missed == 0
+
+
+def test_overrunning_job_skips_missed_slots(app):
+    job, starts = run_job(app, FakeClock(datetime(2026, 3, 10, 10)), 3, durations=[25, 1, 1])
+    assert starts == [0, 30, 40]
+    assert job.missed == 2
+
+
+def test_run_once_refuses_to_overlap(app):
+    scheduler = Scheduler(app, clock=FakeClock(datetime(2026, 3, 10, 10)))
+    nested = []
+    job = scheduler.add_job('job', lambda: nested.append(scheduler.run_once('job')), 10)
+    assert scheduler.run_once(job) is True
+    assert nested == [None]
+    assert job.overlaps == 1 and job.runs == 1
+
+
+def test_failures_back_off_by_doubling_slots(app):
+    job, starts = run_job(app, FakeClock(datetime(2026, 3, 10, 10)), 7, failures={0, 1, 2, 3, 4})
+    # 连续失败后等待 2、4、8、16 个周期，max_backoff 默认为 16 个周期；成功后恢复每个周期执行
+    assert starts == [0, 20, 60, 140, 300, 460, 470]
+    assert job.failures == 5
+    assert job.consecutive_failures == 0
+    assert job.missed == 0
+
+
+def test_condition_skips_without_backoff(app):
+    clock = FakeClock(datetime(2026, 3, 10, 10))
+    scheduler = Scheduler(app, clock=clock)
+    calls = []
+
+    def condition():
+        calls.append(clock.monotonic())
+        if len(calls) == 3:
+            scheduler._stop.set()
+        return False
+
+    job = scheduler.add_job('job', lambda: None, 10, condition=condition)
+    scheduler._run(job)
+    assert calls == [0, 10, 20]
+    assert job.skipped == 3 and job.runs == 0
+
+
+@pytest.fixture
+def calendar():
+    calendar = TradingCalendar()
+    # 2026-03-11（周三）休市
+    calendar.set_days([date(2026, 3, 9), date(2026, 3, 10), date(2026, 3, 12), date(2026, 3, 13)],
+                      date(2026, 3, 1), date(2026, 3, 31))
+    return calendar
+
+
+def test_calendar_suspends_over_lunch_break(app, calendar):
+    clock = FakeClock(datetime(2026, 3, 10, 11, 29, 40))
+    job, starts = run_job(app, clock, 4, calendar=calendar)
+    times = [clock.start + timedelta(seconds=start) for start in starts]
+    assert times == [datetime(2026, 3, 10, 11, 29, 40), datetime(2026, 3, 10, 11, 29, 50),
+                     datetime(2026, 3, 10, 13, 0), datetime(2026, 3, 10, 13, 0, 10)]
+    assert job.suspended == 1
+
+
+def test_calendar_skips_holiday_to_next_open(app, calendar):
+    clock = FakeClock(datetime(2026, 3, 10, 14, 59, 50))
+    job, starts = run_job(app, clock, 2, calendar=calendar)
+    times = [clock.start + timedelta(seconds=start) for start in starts]
+    assert times == [datetime(2026, 3, 10, 14, 59, 50), datetime(2026, 3, 12, 9, 30)]
+    assert job.suspended == 1
+    assert job.next_run_at == '2026-03-12T09:30:00'
+
+
+def test_duration_and_lag_histograms(app):
+    # 每次唤醒晚 30 毫秒，任务耗时 3 秒
+    job, _ = run_job(app, FakeClock(datetime(2026, 3, 10, 10), overshoot=0.03), 4, durations=[3, 3, 3, 3])
+    snapshot = job.snapshot()
+    assert snapshot['duration_ms']['count'] == 4
+    assert snapshot['duration_ms']['p50'] == pytest.approx(3000)
+    assert snapshot['duration_ms']['buckets'] == {'le_5000': 4}
+    # 第一次立即执行没有延迟，之后每次延迟 30 毫秒
+    assert snapshot['lag_ms']['buckets'] == {'le_1': 1, 'le_50': 3}
+    assert snapshot['lag_ms']['max'] == pytest.approx(30)
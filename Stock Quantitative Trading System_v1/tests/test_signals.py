@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import rolling_signals
+from database import QuantStrategy
+from indicators import IncrementalSignal
+from strategy_engine import compute_signals
+
+PARAMS = [(1, 2, 3), (2, 3, 2), (3, 5, 4), (5, 20, 5), (5, 3, 7), (10, 10, 1)]
+
+
+def price_series(seed, count=120):
+    """两位小数的随机价格，包含大量平盘，均线经常相等"""
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([-2, -1, 0, 0, 0, 0, 1, 2], size=count)
+    return np.round(np.maximum(900 + np.cumsum(steps), 100) / 100, 2)
+
+
+def baseline_signal(prices, ma_short, ma_long, momentum_days):
+    """改为整数分比较之前 QuantStrategy.calculate_signal 的 pandas 实现，作为基准"""
+    if len(prices) < max(ma_long, momentum_days):
+        return 0
+    ma_short_values = pd.Series(prices).rolling(window=ma_short).mean()
+    ma_long_values = pd.Series(prices).rolling(window=ma_long).mean()
+    momentum = (prices[-1] - prices[-momentum_days]) / prices[-momentum_days]
+    if ma_short_values.iloc[-1] > ma_long_values.iloc[-1] and momentum > 0:
+        return 1
+    elif ma_short_values.iloc[-1] < ma_long_values.iloc[-1] and momentum < 0:
+        return -1
+    return 0
+
+
+def exact_tie(prices, ma_short, ma_long):
+    """按整数分计算时两条均线是否相等"""
+    cents = np.rint(np.asarray(prices) * 100).astype(np.int64)
+    return int(cents[-ma_short:].sum()) * ma_long == int(cents[-ma_long:].sum()) * ma_short
+
+
+def reference(closes, params):
+    strategy = QuantStrategy(1, '000001.SZ', *params, 100)
+    return np.asarray([strategy.calculate_signal(closes[:end + 1].tolist()) for end in range(len(closes))])
+
+
+def test_tied_moving_averages_hold():
+    closes = np.asarray([9.64, 9.8, 9.8])
+    assert reference(closes, (1, 2, 3))[-1] == 0
+    assert rolling_signals(closes, 1, 2, 3)[-1] == 0
+    state = IncrementalSignal(1, 2, 3)
+    for close in closes:
+        state.update(close)
+    assert state.signal() == 0
+
+
+def test_calculate_signal_matches_pandas_baseline():
+    """与原 pandas 实现只在两条均线实际相等时不同：浮点均线偏离相等时原实现会买入或卖出，现在持有
+
+    原实现价格数少于 ma_short 时短期均线为 NaN，比较结果都为 False 而持有，
+    与现在把 ma_short 计入最少价格数的结果相同。
+    """
+    ties = 0
+    for params in PARAMS:
+        strategy = QuantStrategy(1, '000001.SZ', *params, 100)
+        for seed in range(20):
+            closes = price_series(seed).tolist()
+            for end in range(1, len(closes) + 1):
+                prices = closes[:end]
+                expected = baseline_signal(prices, *params)
+                actual = strategy.calculate_signal(prices)
+                if actual != expected:
+                    assert actual == 0 and exact_tie(prices, params[0], params[1]), (params, seed, end)
+                    ties += 1
+    # 平盘较多的价格序列中，均线相等而浮点结果偏离的情况确实出现并被持有
+    assert ties > 0
+
+
+@pytest.mark.parametrize('params', PARAMS)
+@pytest.mark.parametrize('seed', range(20))
+def test_rolling_signals_match_calculate_signal(seed, params):
+    closes = price_series(seed)
+    assert rolling_signals(closes, *params).tolist() == reference(closes, params).tolist()
+
+
+@pytest.mark.parametrize('params', PARAMS)
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_signal_matches_calculate_signal(seed, params):
+    closes = price_series(seed)
+    expected = reference(closes, params)
+    state = IncrementalSignal(*params)
+    for end, close in enumerate(closes):
+        # 盘中：历史K线加上当前价格
+        assert state.signal_with(close) == expected[end]
+        state.update(close)
+        assert state.signal() == expected[end]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compute_signals_match_calculate_signal(seed):
+    series = [price_series(seed * 10 + offset) for offset in range(3)]
+    expected = {(row, params): reference(closes, params) for row, closes in enumerate(series) for params in PARAMS}
+    keys = sorted(expected)
+    rows = np.asarray([row for row, _ in keys])
+    ma_short, ma_long, momentum_days = (np.asarray([params[i] for _, params in keys]) for i in range(3))
+    window = int(max(ma_short.max(), ma_long.max(), momentum_days.max()))
+
+    for end in range(len(series[0])):
+        # 与 read_close_panel 相同：最近 window 根历史收盘价右对齐，不足处为 NaN
+        panel = np.full((len(series), window), np.nan)
+        lengths = np.zeros(len(series), dtype=np.int64)
+        for row, closes in enumerate(series):
+            history = closes[max(0, end - window):end]
+            if len(history):
+                panel[row, window - len(history):] = history
+            lengths[row] = len(history)
+        current = np.asarray([closes[end] for closes in series])
+        signals = compute_signals(panel, lengths, current, rows, ma_short, ma_long, momentum_days)
+        assert signals.tolist() == [expected[key][end] for key in keys]
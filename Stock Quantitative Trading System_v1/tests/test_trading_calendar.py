@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from trading_calendar import TradingCalendar
+
+FIRST, LAST = date(2026, 3, 4), date(2026, 3, 25)
+HOLIDAYS = {date(2026, 3, 11), date(2026, 3, 20)}
+
+
+def days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def expected_open(day):
+    """覆盖范围内按载入的交易日，范围之外按周一至周五"""
+    if FIRST <= day <= LAST:
+        return day.weekday() < 5 and day not in HOLIDAYS
+    return day.weekday() < 5
+
+
+@pytest.fixture
+def calendar():
+    calendar = TradingCalendar()
+    calendar.set_days([day for day in days(FIRST, LAST) if expected_open(day)], FIRST, LAST)
+    return calendar
+
+
+# 覆盖范围前后各两周，包含跨越范围边界的情况
+SPAN = days(FIRST - timedelta(days=14), LAST + timedelta(days=14))
+
+
+def test_is_trading_day_falls_back_to_weekdays_outside_range(calendar):
+    assert not calendar.is_trading_day(date(2026, 3, 11))
+    assert calendar.is_trading_day(date(2026, 3, 3))   # 范围之前的周二
+    assert not calendar.is_trading_day(date(2026, 2, 28))  # 范围之前的周六
+    assert calendar.is_trading_day(date(2026, 3, 27))  # 范围之后的周五
+    assert not calendar.is_trading_day(date(2026, 3, 29))  # 范围之后的周日
+    assert [calendar.is_trading_day(day) for day in SPAN] == [expected_open(day) for day in SPAN]
+
+
+def test_previous_and_next_trading_day(calendar):
+    for day in SPAN:
+        previous = day - timedelta(days=1)
+        while not expected_open(previous):
+            previous -= timedelta(days=1)
+        following = day + timedelta(days=1)
+        while not expected_open(following):
+            following += timedelta(days=1)
+        assert calendar.previous_trading_day(day) == previous, day
+        assert calendar.next_trading_day(day) == following, day
+
+
+def test_previous_and_next_across_range_edges(calendar):
+    # 范围第一天之前按工作日，最后一天之后按工作日
+    assert calendar.previous_trading_day(FIRST) == date(2026, 3, 3)
+    assert calendar.next_trading_day(date(2026, 3, 3)) == FIRST
+    assert calendar.next_trading_day(LAST) == date(2026, 3, 26)
+    assert calendar.previous_trading_day(date(2026, 3, 26)) == LAST
+    assert calendar.next_trading_day(date(2026, 3, 10)) == date(2026, 3, 12)
+    assert calendar.last_trading_day(datetime(2026, 3, 11, 15)) == date(2026, 3, 10)
+
+
+def test_count_and_trading_days_across_range_edges(calendar):
+    starts = SPAN[::3]
+    for start in starts:
+        for end in SPAN[::2]:
+            expected = [day for day in days(start, end) if expected_open(day)] if start <= end else []
+            assert calendar.trading_days(start, end) == expected, (start, end)
+            assert calendar.count(start, end) == len(expected), (start, end)
+    assert calendar.count(FIRST, LAST) == 14
+    assert calendar.count('20260302', '20260327') == 18
+    assert calendar.count(LAST, FIRST) == 0
+
+
+def test_unloaded_calendar_uses_weekdays():
+    calendar = TradingCalendar()
+    assert calendar.is_trading_day(date(2026, 3, 11))
+    assert calendar.next_trading_day(date(2026, 3, 13)) == date(2026, 3, 16)
+    assert calendar.previous_trading_day(date(2026, 3, 16)) == date(2026, 3, 13)
+    assert calendar.count(date(2026, 3, 1), date(2026, 3, 31)) == 22
+
+
+def test_next_open_skips_lunch_break_and_holiday(calendar):
+    assert calendar.next_open(datetime(2026, 3, 10, 12)) == datetime(2026, 3, 10, 13)
+    assert calendar.next_open(datetime(2026, 3, 10, 15)) == datetime(2026, 3, 12, 9, 30)
+    assert calendar.next_open(datetime(2026, 3, 12, 8)) == datetime(2026, 3, 12, 9, 30)
+    now = datetime(2026, 3, 12, 10)
+    assert calendar.next_open(now) == now
@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from tushare_client import FakeTushareBackend, HISTORICAL_TTL, TushareClient
+
+
+def run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        results[index] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_identical_requests_coalesce():
+    backend = FakeTushareBackend(latency=0.2)
+    client = TushareClient(backend, rate_limit=None)
+    results = run_concurrently(6, lambda: client.daily(ts_code='000001.SZ', start_date='20200101',
+                                                       end_date='20200131'))
+    assert len(backend.calls) == 1
+    assert client.stats['calls'] == 1
+    assert client.stats['coalesced'] == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_ttl_rules():
+    client = TushareClient(FakeTushareBackend(), rate_limit=None)
+    today = datetime.now().strftime('%Y%m%d')
+    assert client._ttl('daily', {'end_date': '20200131'}) is HISTORICAL_TTL
+    assert client._ttl('daily', {'trade_date': '20200131'}) is HISTORICAL_TTL
+    assert client._ttl('daily', {'end_date': today}) == 300
+    assert client._ttl('daily', {'start_date': '20200101'}) == 300
+    assert client._ttl('stock_basic', {}) == 24 * 3600
+
+
+def test_disk_cache_keeps_history_and_expires_current_data(tmp_path):
+    backend = FakeTushareBackend()
+    client = TushareClient(backend, rate_limit=None, cache_dir=str(tmp_path), ttls={'daily': 0, 'stock_basic': 0})
+    for _ in range(2):
+        client.daily(ts_code='000001.SZ', start_date='20200101', end_date='20200131')
+        client.stock_basic()
+    # 已结束交易日的日线永久缓存，当天数据按有效期（此处为 0）重新请求
+    assert [name for name, _ in backend.calls] == ['daily', 'stock_basic', 'stock_basic']
+    assert client.stats['cache_hits'] == 1
+
+
+def test_daily_batches_stay_under_row_cap():
+    backend = FakeTushareBackend(stock_count=25)
+    client = TushareClient(backend, rate_limit=None, batch_size=50, max_rows=100)
+    # 2020-01-06 至 2020-01-17 共 10 个工作日，每批最多 10 只股票
+    df = client.daily(ts_code=','.join(backend.codes()), start_date='20200106', end_date='20200117')
+    assert len(backend.calls) == 3
+    assert all(len(params['ts_code'].split(',')) <= 10 for _, params in backend.calls)
+    assert len(df) == 25 * 10
+    assert not df.duplicated(['ts_code', 'trade_date']).any()
+
+
+def test_daily_splits_long_ranges_by_date():
+    backend = FakeTushareBackend()
+    client = TushareClient(backend, rate_limit=None, max_rows=20)
+    start, end = '20200101', '20200310'
+    df = client.daily(ts_code='000001.SZ', start_date=start, end_date=end)
+    expected = int(np.busday_count(np.datetime64('2020-01-01'), np.datetime64('2020-03-11')))
+    assert len(backend.calls) == -(-expected // 20)
+    assert sorted(df['trade_date']) == sorted(set(df['trade_date']))
+    assert len(df) == expected
+    assert min(df['trade_date']) == '20200101' and max(df['trade_date']) == end
+
+
+def test_stats_counted_under_concurrency(tmp_path):
+    client = TushareClient(FakeTushareBackend(), rate_limit=None, cache_dir=str(tmp_path))
+    client.daily(ts_code='000001.SZ', start_date='20200101', end_date='20200131')
+
+    def hits():
+        for _ in range(200):
+            client.daily(ts_code='000001.SZ', start_date='20200101', end_date='20200131')
+
+    run_concurrently(8, hits)
+    assert client.stats['cache_hits'] == 8 * 200
+    assert client.stats['calls'] == 1
@@ -0,0 +1,247 @@
+import os
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+import pandas as pd
+
+# 沪深交易所的交易时段
+DEFAULT_SESSIONS = (('09:30', '11:30'), ('13:00', '15:00'))
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), '%Y%m%d').date()
+
+
+class TradingCalendar:
+    """交易日历
+
+    覆盖范围内每天是否开市保存为按日期序数排列的 NumPy 布尔数组，另存累计
+    交易日数。判断交易日、查找前后交易日、统计区间内的交易日数都只需按下标
+    读取，不需要遍历。覆盖范围之外的日期按周一至周五估计。
+
+    日历从 trade_cal 接口载入一次并保存到本地文件，之后启动时优先读取文件；
+    文件覆盖不到今天之后 refresh_days 天时重新请求接口。
+    """
+
+    def __init__(self, sessions=DEFAULT_SESSIONS, path=None, start_date='20100101', refresh_days=30):
+        self.path = path
+        self.start_date = start_date
+        self.refresh_days = refresh_days
+        self.sessions = []
+        self.set_sessions(sessions)
+        self.source = None
+        self._base = 0  # 覆盖范围第一天的日期序数
+        self._mask = np.zeros(0, dtype=bool)  # 第 i 天（base + i）是否开市
+        self._cumulative = np.zeros(0, dtype=np.int64)  # 截至第 i 天（含）的交易日数
+        self._days = np.zeros(0, dtype=np.int64)  # 全部交易日的日期序数
+
+    def init_app(self, app):
+        self.set_sessions(app.config.get('MARKET_SESSIONS', DEFAULT_SESSIONS))
+        self.path = app.config.get('TRADING_CALENDAR_FILE', self.path)
+        self.start_date = app.config.get('TRADING_CALENDAR_START', self.start_date)
+
+    def set_sessions(self, sessions):
+        self.sessions = [(dt_time.fromisoformat(start), dt_time.fromisoformat(end)) for start, end in sessions]
+
+    @property
+    def loaded(self):
+        return len(self._mask) > 0
+
+    @property
+    def first_day(self):
+        return date.fromordinal(self._base) if self.loaded else None
+
+    @property
+    def last_day(self):
+        return date.fromordinal(self._base + len(self._mask) - 1) if self.loaded else None
+
+    def set_days(self, open_days, first_day=None, last_day=None):
+        """设置覆盖 [first_day, last_day] 的日历，open_days 为其中的交易日"""
+        ordinals = np.unique(np.asarray([_to_date(day).toordinal() for day in open_days], dtype=np.int64))
+        if first_day is None and last_day is None and len(ordinals) == 0:
+            self._base = 0
+            self._mask = np.zeros(0, dtype=bool)
+            self._cumulative = np.zeros(0, dtype=np.int64)
+            self._days = ordinals
+            return
+        first = _to_date(first_day).toordinal() if first_day is not None else int(ordinals[0])
+        last = _to_date(last_day).toordinal() if last_day is not None else int(ordinals[-1])
+        ordinals = ordinals[(ordinals >= first) & (ordinals <= last)]
+        mask = np.zeros(last - first + 1, dtype=bool)
+        mask[ordinals - first] = True
+        self._base = first
+        self._mask = mask
+        self._cumulative = np.cumsum(mask)
+        self._days = ordinals
+
+    def _covers(self, ordinal):
+        return self._base <= ordinal < self._base + len(self._mask)
+
+    # ---------- 载入 ----------
+
+    def load(self, client=None, today=None):
+        """依次尝试本地文件、trade_cal 接口，都不可用时按工作日估计，返回数据来源"""
+        today = _to_date(today or datetime.now())
+        needed = today + timedelta(days=self.refresh_days)
+        frame = self._read_file()
+        if frame is not None and self._apply(frame) and self.last_day >= needed:
+            self.source = 'file'
+            return self.source
+        if client is not None:
+            try:
+                end_date = date(today.year + 1, 12, 31).strftime('%Y%m%d')
+                frame = client.trade_cal(exchange='SSE', start_date=self.start_date, end_date=end_date)
+                if self._apply(frame):
+                    self._write_file(frame)
+                    self.source = 'trade_cal'
+                    return self.source
+            except Exception as e:
+                print(f"读取交易日历失败: {str(e)}")
+        if self.loaded:
+            # 文件过期且接口不可用时继续使用文件，覆盖范围之外按工作日估计
+            self.source = 'file'
+        else:
+            self.source = 'weekdays'
+            print("交易日历不可用，按周一至周五估计交易日")
+        return self.source
+
+    def refresh(self, client=None, today=None):
+        """覆盖范围不足 refresh_days 天时重新载入，返回是否重新载入"""
+        today = _to_date(today or datetime.now())
+        if self.loaded and self.last_day >= today + timedelta(days=self.refresh_days):
+            return False
+        self.load(client, today)
+        return True
+
+    def _apply(self, frame):
+        if frame is None or frame.empty or 'cal_date' not in frame:
+            return False
+        cal_dates = frame['cal_date'].astype(str)
+        is_open = frame['is_open'].astype(int) == 1 if 'is_open' in frame else np.ones(len(frame), dtype=bool)
+        self.set_days(cal_dates[is_open].tolist(), cal_dates.min(), cal_dates.max())
+        return self.loaded
+
+    def _read_file(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            return pd.read_csv(self.path, dtype={'cal_date': str})
+        except Exception as e:
+            print(f"读取交易日历文件失败: {str(e)}")
+            return None
+
+    def _write_file(self, frame):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            columns = [column for column in ('cal_date', 'is_open') if column in frame]
+            temp_path = f"{self.path}.tmp"
+            frame[columns].sort_values('cal_date').to_csv(temp_path, index=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"保存交易日历文件失败: {str(e)}")
+
+    # ---------- 查询 ----------
+
+    def is_trading_day(self, day):
+        ordinal = _to_date(day).toordinal()
+        if self._covers(ordinal):
+            return bool(self._mask[ordinal - self._base])
+        return date.fromordinal(ordinal).weekday() < 5
+
+    def _count_through(self, ordinal):
+        """覆盖范围内截至 ordinal（含）的交易日数"""
+        if ordinal < self._base:
+            return 0
+        return int(self._cumulative[min(ordinal - self._base, len(self._mask) - 1)])
+
+    def previous_trading_day(self, day):
+        """day 之前（不含）最近的交易日"""
+        ordinal = _to_date(day).toordinal() - 1
+        if self._covers(ordinal):
+            count = self._count_through(ordinal)
+            if count:
+                return date.fromordinal(int(self._days[count - 1]))
+        while not self.is_trading_day(date.fromordinal(ordinal)):
+            ordinal -= 1
+        return date.fromordinal(ordinal)
+
+    def next_trading_day(self, day):
+        """day 之后（不含）最近的交易日"""
+        ordinal = _to_date(day).toordinal() + 1
+        if self._covers(ordinal):
+            count = self._count_through(ordinal - 1)
+            if count < len(self._days):
+                return date.fromordinal(int(self._days[count]))
+        while not self.is_trading_day(date.fromordinal(ordinal)):
+            ordinal += 1
+        return date.fromordinal(ordinal)
+
+    def last_trading_day(self, day):
+        """day 当天或之前最近的交易日"""
+        day = _to_date(day)
+        return day if self.is_trading_day(day) else self.previous_trading_day(day)
+
+    def _weekday_ordinals(self, first, last):
+        if first > last:
+            return np.zeros(0, dtype=np.int64)
+        ordinals = np.arange(first, last + 1, dtype=np.int64)
+        # 0001-01-01 的序数为 1，是星期一
+        return ordinals[(ordinals - 1) % 7 < 5]
+
+    def _ordinals(self, start, end):
+        first, last = _to_date(start).toordinal(), _to_date(end).toordinal()
+        if not self.loaded:
+            return self._weekday_ordinals(first, last)
+        covered_last = self._base + len(self._mask) - 1
+        lo = self._count_through(max(first, self._base) - 1)
+        hi = self._count_through(min(last, covered_last))
+        return np.concatenate([
+            self._weekday_ordinals(first, min(last, self._base - 1)),
+            self._days[lo:hi] if hi > lo else np.zeros(0, dtype=np.int64),
+            self._weekday_ordinals(max(first, covered_last + 1), last)
+        ])
+
+    def trading_days(self, start, end):
+        """[start, end] 内的全部交易日"""
+        return [date.fromordinal(int(ordinal)) for ordinal in self._ordinals(start, end)]
+
+    def count(self, start, end):
+        """[start, end] 内的交易日数"""
+        first, last = _to_date(start).toordinal(), _to_date(end).toordinal()
+        if first > last:
+            return 0
+        covered_last = self._base + len(self._mask) - 1
+        if self.loaded and self._base <= first and last <= covered_last:
+            return self._count_through(last) - self._count_through(first - 1)
+        return len(self._ordinals(start, end))
+
+    def is_open(self, now=None):
+        """now 是否处于交易日的交易时段"""
+        now = now or datetime.now()
+        if not self.is_trading_day(now):
+            return False
+        current = now.time()
+        return any(start <= current < end for start, end in self.sessions)
+
+    def next_open(self, now=None):
+        """下一次开盘时间，当前处于交易时段时返回 now"""
+        now = now or datetime.now()
+        if self.is_open(now):
+            return now
+        day = now.date()
+        if self.is_trading_day(day):
+            for start, _ in self.sessions:
+                if now.time() < start:
+                    return datetime.combine(day, start)
+        return datetime.combine(self.next_trading_day(day), self.sessions[0][0])
+
+
+trading_calendar = TradingCalendar()
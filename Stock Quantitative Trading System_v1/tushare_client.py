@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 各接口缓存有效期（秒），None 表示永久有效
+DEFAULT_TTLS = {
+    'stock_basic': 24 * 3600,
+    'trade_cal': 24 * 3600,
+    'daily': 300,
+}
+# 查询已结束交易日的行情不会再变化，可以永久缓存
+HISTORICAL_TTL = None
+
+
+class TokenBucket:
+    """令牌桶限速：每分钟补充 rate 个令牌，最多积累 burst 个"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate / 60.0
+        self.capacity = burst or max(1, rate // 10)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时阻塞等待，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class DiskCache:
+    """按请求键把 DataFrame 保存为文件，读取时检查有效期"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, endpoint, key):
+        return os.path.join(self.directory, endpoint, key + '.pkl')
+
+    def get(self, endpoint, key, ttl):
+        path = self._path(endpoint, key)
+        try:
+            if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+                return None
+            return pd.read_pickle(path)
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def set(self, endpoint, key, df):
+        path = self._path(endpoint, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免并发读取到写了一半的文件
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(temp_path)
+        os.replace(temp_path, path)
+
+
+class TushareClient:
+    """Tushare 接口封装
+
+    所有调用都经过同一个入口：先查磁盘缓存，未命中时合并并发的相同
+    请求，只有一个线程真正访问接口，其余线程等待同一个结果；真正的
+    接口调用前先从令牌桶取得令牌，保证不超过每分钟调用次数限制。
+    缓存键由接口名、参数和日期组成：参数里没有明确日期的请求附带当天
+    日期，第二天自然失效；只涉及已结束交易日的请求永久缓存。
+
+    backend 需要提供 query(api_name, fields='', **params)，可以是
+    ts.pro_api() 返回的对象，也可以是 FakeTushareBackend。
+    """
+
+    def __init__(self, backend, rate_limit=200, burst=None, cache_dir=None, ttls=None, batch_size=50,
+                 max_rows=6000):
+        self.backend = backend
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.cache = DiskCache(cache_dir) if cache_dir else None
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._inflight = {}  # 请求键 -> Future
+        self.stats = {'calls': 0, 'cache_hits': 0, 'coalesced': 0, 'throttled_seconds': 0.0}
+
+    def _count(self, name, value=1):
+        # 多个线程同时调用，计数在锁内累加
+        with self._lock:
+            self.stats[name] += value
+
+    def _key(self, endpoint, fields, params):
+        today = datetime.now().strftime('%Y%m%d')
+        dated = any(params.get(name) for name in ('trade_date', 'end_date'))
+        payload = json.dumps({'fields': fields, 'params': params, 'as_of': None if dated else today},
+                             sort_keys=True, default=str)
+        return hashlib.sha1(f"{endpoint}:{payload}".encode('utf-8')).hexdigest()
+
+    def _ttl(self, endpoint, params):
+        today = datetime.now().strftime('%Y%m%d')
+        day = params.get('trade_date') or params.get('end_date')
+        if endpoint == 'daily' and day and str(day) < today:
+            return HISTORICAL_TTL
+        return self.ttls.get(endpoint, 300)
+
+    def query(self, endpoint, fields='', **params):
+        """调用任意接口，返回 DataFrame"""
+        params = {name: value for name, value in params.items() if value is not None}
+        key = self._key(endpoint, fields, params)
+        ttl = self._ttl(endpoint, params)
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, key, ttl)
+            if cached is not None:
+                self._count('cache_hits')
+                return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+        if not owner:
+            return future.result()
+
+        try:
+            if self.bucket is not None:
+                self._count('throttled_seconds', self.bucket.acquire())
+            self._count('calls')
+            df = self.backend.query(endpoint, fields=fields, **params)
+            if self.cache is not None and df is not None and not df.empty:
+                self.cache.set(endpoint, key, df)
+            future.set_result(df)
+            return df
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stock_basic(self, **params):
+        return self.query('stock_basic', **params)
+
+    def trade_cal(self, **params):
+        return self.query('trade_cal', **params)
+
+    def _date_windows(self, params):
+        """日线请求的日期区间，返回 ([(start_date, end_date)], 每个区间的交易日数)
+
+        交易日数按工作日估计（节假日只会让实际行数更少）。单只股票的区间
+        超过 max_rows 个交易日时按 max_rows 个工作日切分；没有开始日期时
+        无法估计行数，返回 None。
+        """
+        if params.get('trade_date'):
+            return None, 1
+        start_date = params.get('start_date')
+        if not start_date:
+            return None, None
+        end_date = params.get('end_date') or datetime.now().strftime('%Y%m%d')
+        start = np.busday_offset(np.datetime64(datetime.strptime(str(start_date), '%Y%m%d').date()), 0, roll='forward')
+        end = np.datetime64(datetime.strptime(str(end_date), '%Y%m%d').date())
+        days = int(np.busday_count(start, end + 1))
+        if days <= self.max_rows:
+            return None, max(days, 1)
+        windows = []
+        while start <= end:
+            window_end = min(np.busday_offset(start, self.max_rows - 1), end)
+            windows.append((str(start).replace('-', ''), str(window_end).replace('-', '')))
+            start = np.busday_offset(window_end + 1, 0, roll='forward')
+        return windows, self.max_rows
+
+    def daily(self, **params):
+        """ts_code 为逗号分隔的多只股票时分批请求后合并
+
+        接口每次最多返回 max_rows 行，每批股票数取 batch_size 和
+        max_rows // 交易日数 中较小的一个；区间太长时再按日期切分。
+        """
+        codes = [code for code in str(params.get('ts_code') or '').split(',') if code]
+        windows, days = self._date_windows(params)
+        per_call = self.batch_size if days is None else max(1, min(self.batch_size, self.max_rows // days))
+        if len(codes) <= per_call and windows is None:
+            return self.query('daily', **params)
+        batches = [','.join(sorted(codes[start:start + per_call])) for start in range(0, len(codes), per_call)] \
+            if codes else [None]
+        frames = [
+            self.query('daily', **dict(params, ts_code=batch, **(
+                {'start_date': start_date, 'end_date': end_date} if windows else {})))
+            for batch in batches
+            for start_date, end_date in (windows or [(None, None)])
+        ]
+        frames = [frame for frame in frames if frame is not None and not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def daily_batch(self, codes, start_date=None, end_date=None):
+        """批量获取多只股票的日线"""
+        return self.daily(ts_code=','.join(codes), start_date=start_date, end_date=end_date)
+
+
+class FakeTushareBackend:
+    """离线的 Tushare 替身
+
+    股票列表固定生成，日线按股票代码做随机种子生成确定的随机游走，
+    交易日历为工作日。接口与 ts.pro_api() 的 query 一致，可用于离线
+    运行和测试；calls 记录每次调用。
+    """
+
+    def __init__(self, stock_count=50, start='20150101', latency=0.0):
+        self.stock_count = stock_count
+        self.start = datetime.strptime(start, '%Y%m%d')
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda fields='', **params: self.query(name, fields=fields, **params)
+
+    def codes(self):
+        return [f"{600000 + i:06d}.SH" if i % 2 else f"{i:06d}.SZ" for i in range(1, self.stock_count + 1)]
+
+    def query(self, api_name, fields='', **params):
+        with self._lock:
+            self.calls.append((api_name, params))
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, '_' + api_name, None)
+        if handler is None:
+            raise Exception(f'接口不存在: {api_name}')
+        return handler(**params)
+
+    def _stock_basic(self, **params):
+        codes = self.codes()
+        return pd.DataFrame({
+            'ts_code': codes,
+            'name': [f"模拟股票{code[:6]}" for code in codes],
+            'industry': ['模拟行业'] * len(codes),
+            'market': ['主板'] * len(codes),
+        })
+
+    def _days(self, end_date=None):
+        """从 start 到 end_date 的工作日，返回 'YYYYMMDD' 字符串数组"""
+        end = datetime.strptime(end_date, '%Y%m%d') if end_date else datetime.now()
+        days = np.arange(np.datetime64(self.start.date()), np.datetime64(end.date()) + 1)
+        days = days[np.is_busday(days)]
+        return np.char.replace(np.datetime_as_string(days, unit='D'), '-', '')
+
+    def _trade_cal(self, start_date=None, end_date=None, is_open=None, limit=None, **params):
+        days = self._days(end_date)
+        if start_date:
+            days = days[days >= start_date]
+        dates = days[::-1].tolist()
+        if limit:
+            dates = dates[:int(limit)]
+        return pd.DataFrame({'exchange': 'SSE', 'cal_date': dates, 'is_open': 1})
+
+    def _series(self, code, days):
+        seed = zlib.crc32(code.encode('utf-8'))
+        rng = np.random.default_rng(seed)
+        closes = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, len(days)))), 2)
+        return closes
+
+    def _daily(self, ts_code=None, trade_date=None, start_date=None, end_date=None, **params):
+        codes = ts_code.split(',') if ts_code else self.codes()
+        days = self._days(trade_date or end_date)
+        frames = []
+        for code in codes:
+            closes = self._series(code, days)
+            frame = pd.DataFrame({
+                'ts_code': code,
+                'trade_date': days,
+                'close': closes,
+                'pre_close': np.concatenate([[closes[0]], closes[:-1]]),
+            })
+            frame['open'] = frame['pre_close']
+            frame['high'] = np.maximum(frame['open'], frame['close'])
+            frame['low'] = np.minimum(frame['open'], frame['close'])
+            frame['vol'] = 1000.0
+            if trade_date:
+                frame = frame[frame['trade_date'] == trade_date]
+            else:
+                if start_date:
+                    frame = frame[frame['trade_date'] >= start_date]
+                if end_date:
+                    frame = frame[frame['trade_date'] <= end_date]
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        # 与 Tushare 一致，按交易日倒序返回
+        return pd.concat(frames, ignore_index=True).sort_values('trade_date', ascending=False, kind='stable') \
+            .reset_index(drop=True)
@@ -0,0 +1,34 @@
+"""后台任务进程
+
+网页进程和后台任务分开部署时，网页进程设置 APP_ROLE=web，只处理请求；
+行情模拟、挂单撮合和量化策略由这里启动的进程运行：
+
+    APP_ROLE=web gunicorn -w 4 app:app
+    python worker.py
+
+同时启动多个 worker 进程时，只有选举出的领导者运行后台任务，其余进程待命，
+领导者退出（文件锁释放或数据库租约过期）后由待命进程接管。
+"""
+import time
+
+from app import app, start_background_services
+from leader import leader_election
+from scheduler import scheduler
+
+
+def main():
+    app.config['APP_ROLE'] = 'scheduler'
+    start_background_services()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("后台任务进程退出")
+    finally:
+        scheduler.stop(timeout=10)
+        if leader_election.is_leader:
+            leader_election.release()
+
+
+if __name__ == '__main__':
+    main()